@@ -0,0 +1,78 @@
+# Compare the synchronous Pointings client with AsyncPointings when
+# submitting many events and instruments against a slow local server
+
+## USAGE:
+# python benchmarks/bench_async.py --events 20 --latency 0.05
+
+import asyncio
+from optparse import OptionParser
+import statistics
+import sys
+import time
+
+sys.path.insert(0, '.')
+from treasuremap import Pointings
+from treasuremap.aio import AsyncPointings
+from treasuremap.mockserver import MockTreasureMap
+from treasuremap.session import configure_session
+
+
+def make(cls, url, nevents, ninstruments):
+    pointings = []
+    for event in range(nevents):
+        for instrumentid in range(ninstruments):
+            p = cls("planned", "S{:06d}".format(event), instrumentid, 'r',
+                    api_token="TOKEN", base_url=url)
+            p.add_pointings([10.0, 20.0, 30.0], -5.0,
+                            "2019-08-16T14:10:27.0", 23.0, "ab_mag")
+            p.build_json()
+            pointings.append(p)
+    return pointings
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run_sync(pointings):
+    latencies = [timed(p.submit) for p in pointings]
+    return sum(latencies), latencies
+
+
+async def run_async(pointings):
+    async def one(p):
+        start = time.perf_counter()
+        await p.asubmit()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(p) for p in pointings))
+    return time.perf_counter() - start, latencies
+
+
+def report(name, total, latencies):
+    print("{:6s} total {:7.3f} s  {:8.1f} req/s  median latency {:.1f} ms".format(
+        name, total, len(latencies) / total,
+        1e3 * statistics.median(latencies)))
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--events', type='int', default=20,
+                      help="Number of events")
+    parser.add_option('--instruments', type='int', default=3,
+                      help="Number of instruments per event")
+    parser.add_option('--latency', type='float', default=0.05,
+                      help="Server latency per request in seconds")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    configure_session(pool_maxsize=32)
+
+    with MockTreasureMap(latency=options.latency) as server:
+        report("sync", *run_sync(
+            make(Pointings, server.url, options.events, options.instruments)))
+        report("async", *asyncio.run(run_async(
+            make(AsyncPointings, server.url, options.events,
+                 options.instruments))))
@@ -0,0 +1,79 @@
+# Reading pointings back from the mock API: uncached, served from the
+# ResponseCache, revalidated with an ETag, and paginated by time window
+
+## USAGE:
+# python benchmarks/bench_client.py --pointings 20000 --latency 0.05 --lookups 20
+
+from optparse import OptionParser
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, '.')
+from treasuremap import Pointings, ResponseCache, TreasureMapClient, submit_many
+from treasuremap.mockserver import MockTreasureMap
+
+GRACEID = "TEST_EVENT"
+
+
+def timed(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats, result
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--pointings', type='int', default=20000,
+                      help="Number of pointings on the server")
+    parser.add_option('--latency', type='float', default=0.05,
+                      help="Seconds the mock API takes per request")
+    parser.add_option('--lookups', type='int', default=20,
+                      help="Repeated lookups of the same event")
+    parser.add_option('--days', type='int', default=14,
+                      help="Days the pointings are spread over, one page per day")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    rng = np.random.default_rng(0)
+    n = options.pointings
+    times = np.datetime64('2019-08-14T00:00:00') + \
+        rng.integers(0, 86400 * options.days, n).astype('timedelta64[s]')
+
+    with MockTreasureMap() as server, tempfile.TemporaryDirectory() as tmp:
+        p = Pointings("completed", GRACEID, 38, "i", api_token="TOKEN",
+                      base_url=server.url)
+        p.add_pointings(rng.uniform(0, 360, n), rng.uniform(-60, 30, n),
+                        np.datetime_as_string(times), 23.0, "ab_mag")
+        submit_many([p], chunk_size=1000)
+        server.latency = options.latency
+
+        plain = TreasureMapClient(api_token="TOKEN", base_url=server.url)
+        cached = TreasureMapClient(
+            api_token="TOKEN", base_url=server.url,
+            cache=ResponseCache(os.path.join(tmp, 'cache.sqlite'), ttl=3600))
+        stale = TreasureMapClient(
+            api_token="TOKEN", base_url=server.url,
+            cache=ResponseCache(os.path.join(tmp, 'stale.sqlite'), ttl=0))
+
+        cold, rows = timed(lambda: plain.pointings(GRACEID), options.lookups)
+        cached.pointings(GRACEID)
+        hit, _ = timed(lambda: cached.pointings(GRACEID), options.lookups)
+        stale.pointings(GRACEID)
+        revalidated, _ = timed(lambda: stale.pointings(GRACEID),
+                               options.lookups)
+
+        end = np.datetime64('2019-08-14') + np.timedelta64(options.days, 'D')
+        for workers in (1, 4):
+            start = time.perf_counter()
+            paged = sum(1 for _ in plain.iter_pointings(
+                GRACEID, '2019-08-14', end, max_workers=workers))
+            print("Paginated, {} worker(s): {:8.1f} ms for {} pointings".format(
+                workers, 1e3 * (time.perf_counter() - start), paged))
+
+    print("Uncached lookup:         {:8.1f} ms ({} pointings)".format(1e3 * cold, len(rows)))
+    print("Cached lookup:           {:8.1f} ms".format(1e3 * hit))
+    print("Revalidated (HTTP 304):  {:8.1f} ms".format(1e3 * revalidated))
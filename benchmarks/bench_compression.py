@@ -0,0 +1,87 @@
+# Upload size and time with gzip/zstd request compression and rounded
+# coordinates and depths, against the mock API. That the mock decodes
+# the bodies exactly, and the HTTP 415 fallback, are checked in
+# tests/test_compression.py
+
+## USAGE:
+# python benchmarks/bench_compression.py --pointings 50000 --latency 0.02
+
+from optparse import OptionParser
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, '.')
+from treasuremap import Pointings, submit_many
+from treasuremap.mockserver import MockTreasureMap
+
+CONFIGS = [
+    ('plain', {}),
+    ('rounded', {'coord_decimals': 5, 'depth_decimals': 2}),
+    ('gzip', {'compression': 'gzip'}),
+    ('zstd', {'compression': 'zstd'}),
+    ('gzip + rounded', {'compression': 'gzip', 'coord_decimals': 5, 'depth_decimals': 2}),
+    ('zstd + rounded', {'compression': 'zstd', 'coord_decimals': 5, 'depth_decimals': 2}),
+]
+
+
+def make_pointings(url, n, options):
+    rng = np.random.default_rng(0)
+    times = np.datetime64('2019-08-14T00:00:00') + \
+        rng.integers(0, 86400 * 20, n).astype('timedelta64[s]')
+    p = Pointings("completed", "TEST_EVENT", 38, "i", api_token="TOKEN",
+                  base_url=url, **options)
+    p.add_pointings(rng.uniform(0, 360, n), rng.uniform(-90, 30, n),
+                    np.datetime_as_string(times), rng.uniform(20, 24, n),
+                    "ab_mag")
+    return p
+
+
+def reset(server):
+    with server.lock:
+        server.requests.clear()
+        server.pointings.clear()
+        server.bytes_received = 0
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--pointings', type='int', default=50000,
+                      help="Number of pointings")
+    parser.add_option('--chunk-size', type='int', default=500,
+                      help="Pointings per request")
+    parser.add_option('--latency', type='float', default=0.0,
+                      help="Seconds the mock API takes per request")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    n = options.pointings
+    baseline = None
+    with MockTreasureMap(latency=options.latency) as server:
+        for name, config in CONFIGS:
+            try:
+                p = make_pointings(server.url, n, config)
+            except ValueError as e:
+                print("{:<16} skipped: {}".format(name, e))
+                continue
+
+            reset(server)
+            start = time.perf_counter()
+            try:
+                result = submit_many([p], options.chunk_size, max_workers=4)[0]
+            except ValueError as e:
+                print("{:<16} skipped: {}".format(name, e))
+                continue
+            elapsed = time.perf_counter() - start
+
+            assert not result['failed'], result['failed']
+            if baseline is None:
+                baseline = server.bytes_received
+            print("{:<16} {:>11} bytes on the wire  {:6.1%} of plain  {:7.3f} s".format(
+                name, server.bytes_received, server.bytes_received / baseline, elapsed))
+
+        # Streamed upload, compressed while it is encoded
+        p = make_pointings(server.url, n, {'compression': 'gzip'})
+        reset(server)
+        p.submit_stream()
+        print("{:<16} {:>11} bytes on the wire".format('gzip streamed', server.bytes_received))
@@ -0,0 +1,84 @@
+# Depths from raw DECam exposures: DepthEngine against a per-row loop,
+# and re-reading the exposures from the ExposureCache
+
+## USAGE:
+# python benchmarks/bench_depth.py --exposures 200000
+
+import math
+from optparse import OptionParser
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '.')
+from treasuremap.depth import ZERO_POINTS, DepthEngine, ExposureCache
+
+NIGHTS = ExposureCache.nights('20190813', '20190905')
+
+
+def make_exposures(n, seed=0):
+    rng = np.random.default_rng(seed)
+    fields = rng.integers(0, max(1, n // 4), n)
+    return pd.DataFrame({
+        'expnum': np.arange(n),
+        'exptime': rng.choice([30.0, 60.0, 90.0], n),
+        'filter': rng.choice(list('grizY'), n),
+        'night': rng.choice(NIGHTS, n),
+        'time': np.char.mod('%02d:00:00', fields % 24),
+        'qc_teff': rng.uniform(0.2, 1.2, n),
+        'ra': np.char.mod('%010.6f', fields * 0.01),
+        'dec': np.char.mod('%9.5f', -fields * 0.001),
+        'hex': np.char.mod('x%07d', fields)})
+
+
+def per_row(exposures):
+    groups = {}
+    for row in exposures.itertuples():
+        key = (row.night, row.filter, row.hex, row.ra, row.dec, row.time)
+        groups[key] = groups.get(key, 0.0) + row.qc_teff * row.exptime
+    zero_points = ZERO_POINTS[38]
+    return {key: round(zero_points[key[1]] + 1.25 * math.log10(total / 90.0), 2)
+            for key, total in groups.items()}
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--exposures', type='int', default=200000,
+                      help="Number of raw exposures")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    exposures = make_exposures(options.exposures)
+    engine = DepthEngine()
+
+    start = time.perf_counter()
+    loop = per_row(exposures)
+    t_loop = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pointings = engine.pointings(exposures)
+    t_engine = time.perf_counter() - start
+
+    assert len(pointings) == len(loop)
+    fluxes = DepthEngine(unit='flux_jy')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ExposureCache(tmp)
+        fetch = lambda first, last: exposures[
+            (exposures['night'] > first) & (exposures['night'] < last)]
+        start = time.perf_counter()
+        cache.load('2019B-0372', '20190813', '20190905', fetch)
+        t_pull = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cached = cache.load('2019B-0372', '20190813', '20190905', fetch)
+        fluxes.pointings(cached)
+        t_cached = time.perf_counter() - start
+
+    print("{} exposures into {} pointings".format(len(exposures), len(pointings)))
+    print("Per-row loop:                 {:8.3f} s".format(t_loop))
+    print("DepthEngine:                  {:8.3f} s  (x{:.0f})".format(t_engine, t_loop / t_engine))
+    print("First pull, writing cache:    {:8.3f} s".format(t_pull))
+    print("Cached pull + flux_jy depths: {:8.3f} s".format(t_cached))
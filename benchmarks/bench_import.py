@@ -0,0 +1,81 @@
+# Start-up time of the package and the command line scripts, with the
+# heavy dependencies each one loads. Exits 1 if a fast path takes more
+# than --threshold seconds over a bare interpreter or loads a heavy module
+
+## USAGE:
+# python benchmarks/bench_import.py --repeats 10 --threshold 0.1
+
+from optparse import OptionParser
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+HEAVY = ['numpy', 'pandas', 'requests', 'astropy', 'scipy', 'healpy',
+         'pyarrow', 'psycopg2']
+
+# (name, arguments to python, whether it has to start fast)
+CASES = [
+    ('python', ['-c', 'pass'], False),
+    ('import treasuremap', ['-c', 'import treasuremap'], True),
+    ('from treasuremap import metrics', ['-c', 'from treasuremap import metrics'], True),
+    ('from treasuremap import Pointings', ['-c', 'from treasuremap import Pointings'], False),
+    ('submit_tm.py --help', [os.path.join(REPO, 'submit_tm.py'), '--help'], True),
+    ('submit_batch.py --help', [os.path.join(REPO, 'submit_batch.py'), '--help'], True),
+    ('treasue_map_query.py --help', [os.path.join(REPO, 'treasue_map_query.py'), '--help'], True),
+    ('watch_tm.py --help', [os.path.join(REPO, 'watch_tm.py'), '--help'], True),
+]
+
+
+def run(args, cwd, env):
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=cwd, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def loaded(args, cwd, env):
+    '''
+    Heavy top-level packages imported, from -X importtime
+    '''
+    child = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                           cwd=cwd, env=env, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.PIPE, text=True)
+    modules = set()
+    for line in child.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            modules.add(line.rsplit('|', 1)[1].strip().split('.')[0])
+    return [name for name in HEAVY if name in modules]
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--repeats', type='int', default=10,
+                      help="Runs per case, the fastest is kept")
+    parser.add_option('--threshold', type='float', default=0.1,
+                      help="Seconds over a bare interpreter allowed for the fast cases")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    env = dict(os.environ, PYTHONPATH=REPO)
+    failures = []
+    with tempfile.TemporaryDirectory() as workdir:
+        base = None
+        for name, case, fast in CASES:
+            seconds = min(run(case, workdir, env) for _ in range(options.repeats))
+            if base is None:
+                base = seconds
+            heavy = loaded(case, workdir, env)
+            over = seconds - base
+
+            flag = ''
+            if fast and (over > options.threshold or heavy):
+                flag = '  REGRESSION'
+                failures.append(name)
+            print("{:<36} {:7.1f} ms  +{:7.1f} ms  {}{}".format(
+                name, 1e3 * seconds, 1e3 * over, ','.join(heavy) or '-', flag))
+
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,76 @@
+# Benchmark bulk pointing ingestion against the per-row loop
+# that submit_tm.py used to run
+
+## USAGE:
+# python benchmarks/bench_ingest.py --rows 50000
+
+from optparse import OptionParser
+import sys
+import time
+
+from astropy.coordinates import SkyCoord
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '.')
+from treasuremap import Pointings, pointings_from_frame
+
+
+def make_frame(nrows, seed=0):
+    '''
+    Make a synthetic DECam-like pointing table
+    '''
+    rng = np.random.default_rng(seed)
+    times = np.datetime64('2019-08-14T00:00:00') + \
+        rng.integers(0, 86400 * 20, nrows).astype('timedelta64[s]')
+    return pd.DataFrame({
+        'ra': rng.uniform(0, 360, nrows),
+        'dec': rng.uniform(-90, 30, nrows),
+        'time': np.datetime_as_string(times, unit='s'),
+        'band': rng.choice(list('grizY'), nrows),
+        'depth': rng.uniform(20, 24, nrows),
+        'depth_unit': 'ab_mag'})
+
+
+def per_row(df):
+    pointings = {}
+    for flt in set(df['band'].values):
+        pointings[flt] = Pointings("completed", "TEST_EVENT", 38, flt)
+    for index, row in df.iterrows():
+        coord = SkyCoord(row['ra'], row['dec'], frame="icrs", unit="deg")
+        pointings[row['band']].add_pointing(ra=coord.ra.deg,
+                                            dec=coord.dec.deg,
+                                            time=row['time'],
+                                            depth=row['depth'],
+                                            depth_unit=row['depth_unit'])
+    return pointings
+
+
+def bulk(df):
+    return pointings_from_frame(df, "completed", "TEST_EVENT", 38)
+
+
+def timeit(func, df):
+    start = time.perf_counter()
+    result = func(df)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--rows', type='int', default=20000,
+                      help="Number of synthetic pointings")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    df = make_frame(options.rows)
+
+    t_row, slow = timeit(per_row, df)
+    t_bulk, fast = timeit(bulk, df)
+
+    for flt in slow:
+        assert slow[flt].pointings == fast[flt].pointings
+
+    print("rows:     {}".format(options.rows))
+    print("per-row:  {:.3f} s".format(t_row))
+    print("bulk:     {:.3f} s".format(t_bulk))
+    print("speed-up: {:.1f}x".format(t_row / t_bulk))
@@ -0,0 +1,81 @@
+# Time loading a synthetic pointing table from each supported format,
+# against a plain pandas.read_csv of the whole file
+
+## USAGE:
+# python benchmarks/bench_loaders.py --rows 1000000
+
+from optparse import OptionParser
+import os
+import sys
+import tempfile
+import time
+
+from astropy.table import Table
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+sys.path.insert(0, '.')
+from treasuremap.loaders import read_pointings
+
+
+def make_frame(nrows, seed=0):
+    '''
+    Make a synthetic exposure catalogue with extra columns that the
+    loaders should skip
+    '''
+    rng = np.random.default_rng(seed)
+    times = np.datetime64('2019-08-14T00:00:00') + \
+        rng.integers(0, 86400 * 20, nrows).astype('timedelta64[s]')
+    return pd.DataFrame({
+        'expnum': np.arange(nrows),
+        'ra': rng.uniform(0, 360, nrows),
+        'dec': rng.uniform(-90, 30, nrows),
+        'time': np.datetime_as_string(times, unit='s'),
+        'band': rng.choice(list('grizY'), nrows),
+        'depth': rng.uniform(20, 24, nrows),
+        'depth_unit': 'ab_mag',
+        'exptime': rng.uniform(30, 300, nrows),
+        'qc_teff': rng.uniform(0, 1, nrows),
+        'object': np.char.add('DESGW: hex x', rng.integers(0, 10**6, nrows).astype(str)),
+        'airmass': rng.uniform(1, 2, nrows)})
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--rows', type='int', default=1000000,
+                      help="Number of rows in the synthetic table")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    df = make_frame(options.rows)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {
+            'csv': os.path.join(tmp, 'pointings.csv'),
+            'parquet': os.path.join(tmp, 'pointings.parquet'),
+            'arrow': os.path.join(tmp, 'pointings.arrow'),
+            'fits': os.path.join(tmp, 'pointings.fits')
+        }
+        df.to_csv(paths['csv'], index=False)
+        df.to_parquet(paths['parquet'], index=False)
+        feather.write_feather(pa.Table.from_pandas(df, preserve_index=False),
+                              paths['arrow'], compression='uncompressed')
+        Table.from_pandas(df).write(paths['fits'])
+
+        baseline, _ = timed(pd.read_csv, paths['csv'])
+        print("{:8s} {:>10s} {:>10s}".format("format", "MB", "seconds"))
+        print("{:8s} {:>10s} {:>10.3f}".format("csv(all)", "", baseline))
+        for format, path in paths.items():
+            elapsed, table = timed(read_pointings, path)
+            assert len(table) == options.rows
+            assert list(table.columns) == ['ra', 'dec', 'time', 'band',
+                                           'depth', 'depth_unit']
+            print("{:8s} {:>10.1f} {:>10.3f}".format(
+                format, os.path.getsize(path) / 2**20, elapsed))
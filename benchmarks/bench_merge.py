@@ -0,0 +1,117 @@
+# Merging of dithered pointings: clustering time against an all-pairs
+# check, and how much smaller the submission payload gets
+
+## USAGE:
+# python benchmarks/bench_merge.py --hexes 20000 --dithers 3 --nights 2
+
+import json
+from optparse import OptionParser
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, '.')
+from treasuremap import Pointings
+from treasuremap.merge import cluster
+
+
+def dithered(hexes, dithers, nights, offset, rng):
+    '''
+    Hex centres on a roughly uniform patch, each observed `dithers`
+    times a night with small offsets, 90 s exposures back to back
+    '''
+    ra0 = rng.uniform(120, 240, hexes)
+    dec0 = np.degrees(np.arcsin(rng.uniform(-0.5, 0.3, hexes)))
+    start = np.datetime64('2019-08-14T23:00:00', 'ms')
+
+    ra, dec, times, depth = [], [], [], []
+    for night in range(nights):
+        for d in range(dithers):
+            ra.append(ra0 + rng.uniform(-offset, offset, hexes) / np.cos(np.radians(dec0)))
+            dec.append(dec0 + rng.uniform(-offset, offset, hexes))
+            seconds = np.arange(hexes) * dithers * 120 + d * 120
+            times.append(start + np.timedelta64(night, 'D') +
+                         (seconds % (9 * 3600) * 1000).astype('timedelta64[ms]'))
+            depth.append(rng.normal(23.0, 0.3, hexes))
+
+    return (np.concatenate(ra) % 360, np.concatenate(dec),
+            np.concatenate(times), np.concatenate(depth))
+
+
+def all_pairs(ra, dec, times, radius, window):
+    '''
+    Clusters from checking every pair, O(n**2)
+    '''
+    vec = np.column_stack([np.cos(np.radians(dec)) * np.cos(np.radians(ra)),
+                           np.cos(np.radians(dec)) * np.sin(np.radians(ra)),
+                           np.sin(np.radians(dec))])
+    ms = times.astype(np.int64)
+    cos_radius = np.cos(np.radians(radius))
+    labels = np.arange(len(ra))
+
+    def root(i):
+        while labels[i] != i:
+            labels[i] = labels[labels[i]]
+            i = labels[i]
+        return i
+
+    for i in range(len(ra)):
+        close = np.flatnonzero((vec[i + 1:] @ vec[i] >= cos_radius) &
+                               (np.abs(ms[i + 1:] - ms[i]) <= window * 1000)) + i + 1
+        for j in close:
+            labels[root(j)] = root(i)
+    return len(set(root(i) for i in range(len(ra))))
+
+
+def payload_bytes(p):
+    return len(json.dumps(p.payload(p.pointings)))
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--hexes', type='int', default=20000,
+                      help="Number of fields")
+    parser.add_option('--dithers', type='int', default=3,
+                      help="Dithered exposures per field and night")
+    parser.add_option('--nights', type='int', default=2,
+                      help="Nights each field is observed")
+    parser.add_option('--offset', type='float', default=0.05,
+                      help="Largest dither offset in degrees")
+    parser.add_option('--radius', type='float', default=0.15,
+                      help="Merge radius in degrees")
+    parser.add_option('--window', type='float', default=3600.0,
+                      help="Merge window in seconds")
+    parser.add_option('--baseline', type='int', default=3000,
+                      help="Pointings used for the all-pairs baseline")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    rng = np.random.default_rng(0)
+    ra, dec, times, depth = dithered(options.hexes, options.dithers,
+                                     options.nights, options.offset, rng)
+
+    p = Pointings('completed', 'S190814bv', 38, 'i', api_token='x')
+    p.add_pointings(ra, dec, times, depth, 'ab_mag')
+    before, before_bytes = len(p), payload_bytes(p)
+
+    start = time.perf_counter()
+    removed = p.merge_nearby(options.radius, options.window)
+    t_merge = time.perf_counter() - start
+
+    print("pointings:                 {:10d} -> {:d}".format(before, len(p)))
+    print("payload:                   {:10.2f} -> {:.2f} MB".format(
+        before_bytes / 1e6, payload_bytes(p) / 1e6))
+    print("merge_nearby:              {:10.3f} s".format(t_merge))
+
+    m = options.baseline
+    start = time.perf_counter()
+    indexed = cluster(ra[:m], dec[:m], times[:m], options.radius, options.window).max() + 1
+    t_indexed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    naive = all_pairs(ra[:m], dec[:m], times[:m], options.radius, options.window)
+    t_naive = time.perf_counter() - start
+
+    assert indexed == naive
+    print("clusters of {} (all pairs): {:8.3f} s  vs {:.3f} s indexed".format(m, t_naive, t_indexed))
+    print("all pairs, all {} (est.):  {:8.1f} s".format(before, t_naive * (before / m) ** 2))
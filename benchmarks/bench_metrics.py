@@ -0,0 +1,82 @@
+# Overhead of the metrics hooks: adding pointings one at a time and
+# submitting to the mock API with metrics disabled, enabled, and with
+# the old per-pointing debug logging
+
+## USAGE:
+# python benchmarks/bench_metrics.py --pointings 200000
+
+import logging
+from optparse import OptionParser
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, '.')
+from treasuremap import Pointings, submit_many
+from treasuremap import metrics
+from treasuremap.mockserver import MockTreasureMap
+
+
+def add_one_by_one(url, ra, dec, log=None):
+    p = Pointings("completed", "TEST_EVENT", 38, "i", api_token="TOKEN",
+                  base_url=url)
+    for i, (r, d) in enumerate(zip(ra.tolist(), dec.tolist())):
+        p.add_pointing(r, d, "2019-08-16T14:10:27.0", 23.0, "ab_mag")
+        if log is not None:
+            log.debug("Added pointing for index {}".format(i))
+    return p
+
+
+def run(url, ra, dec, log=None):
+    start = time.perf_counter()
+    p = add_one_by_one(url, ra, dec, log)
+    t_add = time.perf_counter() - start
+    start = time.perf_counter()
+    submit_many([p], chunk_size=2000, max_workers=4)
+    return t_add, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--pointings', type='int', default=200000,
+                      help="Number of pointings")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    rng = np.random.default_rng(0)
+    ra = rng.uniform(0, 360, options.pointings)
+    dec = rng.uniform(-60, 30, options.pointings)
+
+    with MockTreasureMap() as server, tempfile.TemporaryDirectory() as tmp:
+        # Keep the per-request response logging out of the timings
+        logging.getLogger('treasuremap').setLevel(logging.WARNING)
+        run(server.url, ra[:1000], dec[:1000])
+
+        metrics.disable()
+        t_off = run(server.url, ra, dec)
+
+        sinks = [metrics.JSONLinesSink(os.path.join(tmp, 'metrics.jsonl')),
+                 metrics.PrometheusSink(os.path.join(tmp, 'metrics.prom'))]
+        registry = metrics.enable(sinks)
+        t_on = run(server.url, ra, dec)
+        snapshot = registry.flush()
+        metrics.disable()
+
+        logging.basicConfig(filename=os.path.join(tmp, 'debug.log'),
+                            level=logging.DEBUG)
+        log = logging.getLogger('submit_tm')
+        t_log = run(server.url, ra, dec, log)
+
+        with open(os.path.join(tmp, 'metrics.prom')) as f:
+            prom = f.read()
+
+    n = options.pointings
+    for label, (t_add, t_submit) in [('metrics disabled', t_off),
+                                     ('metrics enabled', t_on),
+                                     ('per-pointing logging', t_log)]:
+        print("{:<22} add {:6.3f} s ({:5.2f} us/pointing), submit {:6.3f} s".format(
+            label, t_add, 1e6 * t_add / n, t_submit))
+    print()
+    print(prom)
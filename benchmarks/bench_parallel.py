@@ -0,0 +1,88 @@
+# Time to encode the chunk payloads of planned tilings of several sizes
+# in one process and with 2, 4 and 8 worker processes reading the
+# table from shared memory, as many as there are CPUs, where the pool is
+# forced; the crossover gives
+# parallel.MIN_ROWS. Then the default, which keeps small tables in-process
+# and caps the workers at the CPU count, must never be much slower than
+# serial. Checks that every run gives the bodies posted by the serial
+# path byte for byte
+
+## USAGE:
+# python benchmarks/bench_parallel.py --sizes 20000,200000,1000000 --chunk-size 500
+
+from optparse import OptionParser
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, '.')
+from treasuremap import Pointings
+from treasuremap.parallel import MIN_ROWS
+
+WORKERS = [2, 4, 8]
+
+
+def make_pointings(n):
+    rng = np.random.default_rng(0)
+    times = np.datetime64('2019-08-14T00:00:00') + \
+        rng.integers(0, 86400 * 20, n).astype('timedelta64[s]')
+    p = Pointings("planned", "TEST_EVENT", 38, "i", api_token="TOKEN")
+    p.add_pointings(rng.uniform(0, 360, n), rng.uniform(-90, 30, n),
+                    np.datetime_as_string(times), rng.uniform(20, 24, n),
+                    "ab_mag")
+    return p
+
+
+def serial_bodies(p, chunk_size):
+    # As submit_many encodes each chunk before posting it
+    return [json.dumps(payload, allow_nan=False, separators=(',', ':')).encode()
+            for _, _, payload in p.chunks(chunk_size)]
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--sizes', default='20000,200000',
+                      help="Comma separated numbers of pointings")
+    parser.add_option('--chunk-size', type='int', default=500,
+                      help="Pointings per request")
+    parser.add_option('--repeats', type='int', default=5,
+                      help="Runs per configuration, the best is reported")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    def best(function):
+        times = []
+        for _ in range(options.repeats):
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    print("chunks of {}, {} CPUs, MIN_ROWS {}".format(
+        options.chunk_size, os.cpu_count(), MIN_ROWS))
+    for n in map(int, options.sizes.split(',')):
+        p = make_pointings(n)
+        print("{} pointings".format(n))
+
+        serial, expected = best(lambda: serial_bodies(p, options.chunk_size))
+        print("  {:<14} {:8.3f} s".format('serial', serial))
+
+        # Workers beyond the CPU count are capped, and one is no pool
+        for workers in [w for w in WORKERS if 1 < w <= (os.cpu_count() or 1)]:
+            elapsed, chunks = best(lambda: p.prepare_chunks(
+                options.chunk_size, processes=workers, min_rows=0))
+            assert [body for _, _, body in chunks] == expected
+            print("  {:<14} {:8.3f} s  {:5.2f}x serial".format(
+                '{} workers'.format(workers),
+                elapsed, serial / elapsed))
+
+        elapsed, chunks = best(lambda: p.prepare_chunks(options.chunk_size))
+        assert [body for _, _, body in chunks] == expected
+        print("  {:<14} {:8.3f} s  {:5.2f}x serial".format('default', elapsed,
+                                                          serial / elapsed))
+        # Allow for timing noise
+        assert elapsed < 1.25 * serial, (elapsed, serial)
+
+    print("Bodies match the serial encoding exactly")
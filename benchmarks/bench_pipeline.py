@@ -0,0 +1,107 @@
+# Wall-clock time from query to acknowledged pointings, reading a SQLite
+# exposure table and submitting to the mock API two ways: the old
+# workflow (whole query -> CSV on disk -> read back -> submit) and
+# stream_submit, which uploads each batch while the next ones are read.
+# --query-latency makes each batch slow to read, as from a remote
+# database. Checks the mock receives every pointing both ways
+
+## USAGE:
+# python benchmarks/bench_pipeline.py --pointings 100000 --query-latency 0.1 --latency 0.01
+
+from optparse import OptionParser
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '.')
+from treasuremap import metrics, pointings_from_frame, submit_many
+from treasuremap.loaders import read_pointings
+from treasuremap.mockserver import MockTreasureMap
+from treasuremap.pipeline import stream_submit
+from treasuremap.sources import SQLSource
+
+QUERY = "select ra, dec, time, band, depth, depth_unit from pointings order by time"
+
+
+def make_database(path, n):
+    rng = np.random.default_rng(0)
+    times = np.datetime64('2019-08-14T00:00:00') + \
+        np.sort(rng.integers(0, 86400 * 20, n)).astype('timedelta64[s]')
+    df = pd.DataFrame({'ra': rng.uniform(0, 360, n),
+                       'dec': rng.uniform(-90, 30, n),
+                       'time': np.datetime_as_string(times),
+                       'band': rng.choice(list('grizY'), n),
+                       'depth': rng.uniform(20, 24, n),
+                       'depth_unit': 'ab_mag'})
+    with sqlite3.connect(path) as conn:
+        df.to_sql('pointings', conn, index=False)
+
+
+def make_source(path, options):
+    def slow(batch):
+        time.sleep(options.query_latency)
+        return batch
+
+    return SQLSource(lambda: sqlite3.connect(path), QUERY, options.batch_size,
+                     transform=slow, instrumentid=38)
+
+
+def via_csv(source, workdir, url, options):
+    csv = os.path.join(workdir, 'pointings.csv')
+    pd.concat(list(source.batches()), ignore_index=True).to_csv(csv, index=False)
+    pointings = pointings_from_frame(read_pointings(csv), 'completed', 'TEST_EVENT', 38,
+                                     'TOKEN', base_url=url)
+    results = submit_many(list(pointings.values()), options.chunk_size, options.workers)
+    return sum(len(r['pointing_ids']) for r in results)
+
+
+def via_pipeline(source, workdir, url, options):
+    totals = stream_submit(source, 'TEST_EVENT', 'TOKEN', chunk_size=options.chunk_size,
+                           max_workers=options.workers, queue_size=options.queue_size,
+                           base_url=url)
+    return len(totals['pointing_ids'])
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--pointings', type='int', default=100000,
+                      help="Number of pointings in the database")
+    parser.add_option('--batch-size', type='int', default=10000,
+                      help="Rows read per batch")
+    parser.add_option('--chunk-size', type='int', default=500,
+                      help="Pointings per request")
+    parser.add_option('--workers', type='int', default=4,
+                      help="Requests in flight")
+    parser.add_option('--queue-size', type='int', default=2,
+                      help="Batches read ahead by the pipeline")
+    parser.add_option('--query-latency', type='float', default=0.1,
+                      help="Seconds each batch takes to read")
+    parser.add_option('--latency', type='float', default=0.01,
+                      help="Seconds the mock API takes per request")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database = os.path.join(workdir, 'exposures.sqlite')
+        make_database(database, options.pointings)
+
+        for name, run in [('query -> CSV -> submit', via_csv),
+                          ('stream_submit', via_pipeline)]:
+            registry = metrics.enable()
+            with MockTreasureMap(latency=options.latency) as server:
+                start = time.perf_counter()
+                accepted = run(make_source(database, options), workdir, server.url, options)
+                elapsed = time.perf_counter() - start
+                assert accepted == len(server.pointings) == options.pointings, \
+                    (accepted, len(server.pointings))
+            metrics.disable()
+
+            waits = {t['name']: t['total'] for t in registry.snapshot()['timings']}
+            print("{:<24} {:8.3f} s  reader blocked {:6.3f} s  uploader idle {:6.3f} s".format(
+                name, elapsed, waits.get('wait_upload', 0.0), waits.get('wait_source', 0.0)))
+
+    print("Every pointing was acknowledged both ways")
@@ -0,0 +1,58 @@
+# Count the connections opened when submitting several bands, with a
+# fresh connection per request versus the shared pooled session
+
+## USAGE:
+# python benchmarks/bench_session.py --bands 5 --rounds 20
+
+from optparse import OptionParser
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, '.')
+from treasuremap import Pointings
+from treasuremap.mockserver import MockTreasureMap
+from treasuremap.session import make_session
+
+
+def make_pointings(url, nbands, session):
+    pointings = []
+    for flt in 'grizYJHK'[:nbands]:
+        p = Pointings("planned", "TEST_EVENT", 38, flt,
+                      api_token="TOKEN", session=session, base_url=url)
+        p.add_pointings([10.0, 20.0], [-5.0, -6.0],
+                        "2019-08-16T14:10:27.0", 23.0, "ab_mag")
+        p.build_json()
+        pointings.append(p)
+    return pointings
+
+
+def run(session, nbands, rounds):
+    with MockTreasureMap() as server:
+        pointings = make_pointings(server.url, nbands, session)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for p in pointings:
+                p.submit()
+                p.cancel_all()
+        elapsed = time.perf_counter() - start
+        connections = server.connections
+    return connections, elapsed
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--bands', type='int', default=5,
+                      help="Number of bands (Pointings objects)")
+    parser.add_option('--rounds', type='int', default=20,
+                      help="Number of submit/cancel_all rounds")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    # The requests module acts as a session that never reuses connections
+    cold = run(requests, options.bands, options.rounds)
+    pooled = run(make_session(), options.bands, options.rounds)
+
+    print("requests:     {}".format(2 * options.bands * options.rounds))
+    print("bare post:    {} connections in {:.3f} s".format(*cold))
+    print("shared pool:  {} connections in {:.3f} s".format(*pooled))
@@ -0,0 +1,103 @@
+# Benchmark the spatial index: footprint coverage of a HEALPix sky map,
+# nearest-neighbour and overlap queries. Coverage and neighbours use
+# pointings packed into the localisation, overlaps the same number spread
+# over the sky: packed that densely, 1e5 pointings make over 1e8
+# overlapping pairs, more than fit in memory
+
+## USAGE:
+# python benchmarks/bench_spatial.py --pointings 100000 --nside 2048
+
+import math
+from optparse import OptionParser
+import sys
+import time
+
+import healpy as hp
+import numpy as np
+
+sys.path.insert(0, '.')
+from treasuremap.spatial import Footprint, SpatialIndex, radec_to_vec
+
+
+def make_skymap(nside, ra=165.0, dec=-0.0, sigma=5.0):
+    '''
+    Gaussian localisation blob normalised to unit probability
+    '''
+    vec = np.array(hp.pix2vec(nside, np.arange(hp.nside2npix(nside))))
+    distance = np.degrees(np.arccos(np.clip(radec_to_vec(ra, dec) @ vec, -1, 1)))
+    prob = np.exp(-0.5 * (distance / sigma) ** 2)
+    return prob / prob.sum()
+
+
+def per_pointing(ra, dec, pos_angle, footprint, skymap):
+    '''
+    Coverage computed one pointing and one vertex at a time
+    '''
+    nside = hp.npix2nside(len(skymap))
+    covered = set()
+    for r, d, pa in zip(ra, dec, pos_angle):
+        vertices = []
+        for x, y in footprint.polygons[0]:
+            xi = math.radians(x * math.cos(math.radians(pa)) - y * math.sin(math.radians(pa)))
+            eta = math.radians(x * math.sin(math.radians(pa)) + y * math.cos(math.radians(pa)))
+            a, b = math.radians(r), math.radians(d)
+            centre = np.array([math.cos(b) * math.cos(a), math.cos(b) * math.sin(a), math.sin(b)])
+            east = np.array([-math.sin(a), math.cos(a), 0.0])
+            north = np.array([-math.sin(b) * math.cos(a), -math.sin(b) * math.sin(a), math.cos(b)])
+            v = centre + xi * east + eta * north
+            vertices.append(v / np.linalg.norm(v))
+        covered.update(hp.query_polygon(nside, np.array(vertices)).tolist())
+    return skymap[list(covered)].sum()
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--pointings', type='int', default=100000,
+                      help="Number of pointings")
+    parser.add_option('--nside', type='int', default=2048,
+                      help="Sky map resolution")
+    parser.add_option('--baseline', type='int', default=2000,
+                      help="Pointings used for the per-pointing baseline")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    n = options.pointings
+    rng = np.random.default_rng(0)
+    ra = rng.normal(165.0, 8.0, n) % 360
+    dec = np.clip(rng.normal(0.0, 8.0, n), -89, 89)
+    pos_angle = rng.uniform(0, 90, n)
+    footprint = Footprint.rectangle(2.2, 2.0)
+
+    t_map, skymap = timed(make_skymap, options.nside)
+    print("sky map (nside {}):        {:8.2f} s".format(options.nside, t_map))
+
+    t_index, index = timed(SpatialIndex, ra, dec, pos_angle, footprint)
+    print("build index:               {:8.2f} s".format(t_index))
+
+    t_proj, _ = timed(lambda: index.vertices)
+    print("project footprints:        {:8.2f} s".format(t_proj))
+
+    t_cov, prob = timed(index.covered_probability, skymap)
+    print("covered probability:       {:8.2f} s  ({:.4f})".format(t_cov, prob))
+
+    m = options.baseline
+    t_base, base_prob = timed(per_pointing, ra[:m], dec[:m], pos_angle[:m], footprint, skymap)
+    t_sub, sub_prob = timed(index.covered_probability, skymap, False, np.arange(m))
+    assert abs(base_prob - sub_prob) < 1e-9
+    assert t_sub < t_base, (t_sub, t_base)
+    print("per-pointing loop ({}):   {:8.2f} s  vs {:.2f} s indexed".format(m, t_base, t_sub))
+    print("per-pointing loop, all {} (est.): {:8.2f} s".format(n, t_base * n / m))
+
+    t_nn, _ = timed(index.nearest, ra, dec, 2)
+    print("nearest neighbours:        {:8.2f} s".format(t_nn))
+
+    sky_ra = rng.uniform(0, 360, n)
+    sky_dec = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    sky = SpatialIndex(sky_ra, sky_dec, pos_angle, footprint)
+    t_ov, pairs = timed(sky.overlaps)
+    print("overlaps, all sky ({}):  {:8.2f} s  ({} pairs)".format(n, t_ov, len(pairs)))
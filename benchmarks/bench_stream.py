@@ -0,0 +1,66 @@
+# Compare peak memory of building the whole payload in memory with
+# encoding it from a generator of pointings
+
+## USAGE:
+# python benchmarks/bench_stream.py --sizes 10000,100000,1000000
+
+import json
+from optparse import OptionParser
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, '.')
+from treasuremap import Pointings
+from treasuremap.mockserver import MockTreasureMap
+
+
+def generate(p, n):
+    for i in range(n):
+        yield p.make_pointing(i * 360.0 / n, -30.0 + i * 60.0 / n,
+                              "2019-08-16T14:10:27.0", 23.0, "ab_mag")
+
+
+def in_memory(p, n):
+    for i in range(n):
+        p.add_pointing(i * 360.0 / n, -30.0 + i * 60.0 / n,
+                       "2019-08-16T14:10:27.0", 23.0, "ab_mag")
+    p.build_json()
+    return len(json.dumps(p.json_data, separators=(',', ':')).encode())
+
+
+def streamed(p, n):
+    with open(os.devnull, 'wb') as f:
+        return p.write_json(f, generate(p, n))
+
+
+def peak(func, n):
+    p = Pointings("planned", "TEST_EVENT", 38, 'r', api_token="TOKEN")
+    tracemalloc.start()
+    size = func(p, n)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, peak
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--sizes', default='10000,100000',
+                      help="Comma separated numbers of pointings")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    # Check the streamed body arrives intact over chunked transfer
+    with MockTreasureMap() as server:
+        p = Pointings("planned", "TEST_EVENT", 38, 'r', api_token="TOKEN",
+                      base_url=server.url)
+        response = p.submit_stream(generate(p, 1000))
+        assert len(response["pointing_ids"]) == 1000
+
+    print("{:>10s} {:>12s} {:>14s} {:>14s}".format(
+        "pointings", "bytes", "in-memory MB", "streamed MB"))
+    for n in map(int, options.sizes.split(',')):
+        size, mem = peak(in_memory, n)
+        streamed_size, stream_mem = peak(streamed, n)
+        assert size == streamed_size
+        print("{:>10d} {:>12d} {:>14.2f} {:>14.2f}".format(
+            n, size, mem / 2**20, stream_mem / 2**20))
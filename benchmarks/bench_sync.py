@@ -0,0 +1,117 @@
+# Re-planning against the mock API: syncing only the changed pointings
+# with PlanSync versus cancel_all and a full resubmit
+
+## USAGE:
+# python benchmarks/bench_sync.py --pointings 5000 --change 0.05 --rounds 5
+
+import json
+from optparse import OptionParser
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, '.')
+from treasuremap import Pointings, PlanSync, submit_many
+from treasuremap.mockserver import MockTreasureMap
+
+GRACEID = "TEST_EVENT"
+INSTRUMENT = 38
+
+
+def make_plan(url, ra, dec, times, bands):
+    plan = []
+    for flt in sorted(set(bands)):
+        rows = bands == flt
+        p = Pointings("planned", GRACEID, INSTRUMENT, flt, api_token="TOKEN",
+                      base_url=url)
+        p.add_pointings(ra[rows], dec[rows], times[rows], 23.0, "ab_mag")
+        plan.append(p)
+    return plan
+
+
+def replan(ra, dec, times, bands, change, rng):
+    '''
+    Drop a fraction of the plan, move another fraction and add new fields
+    '''
+    n = len(ra)
+    keep = rng.random(n) >= change
+    moved = rng.random(n) < change
+    times = times.copy()
+    times[moved] += np.timedelta64(600, 's')
+    new = int(change * n)
+    return (np.r_[ra[keep], rng.uniform(0, 360, new)],
+            np.r_[dec[keep], rng.uniform(-60, 30, new)],
+            np.r_[times[keep], times[:new]],
+            np.r_[bands[keep], bands[:new]])
+
+
+def planned(server):
+    with server.lock:
+        return sorted((r["position"], r["time"], r["band"])
+                      for r in server.pointings.values()
+                      if r["status"] == "planned")
+
+
+def expected(plan):
+    return sorted(set((r["position"], r["time"], r["band"])
+                      for p in plan for r in p.records()))
+
+
+def rows_sent(server):
+    return sum(len(json.loads(body)["pointings"])
+               for path, _, body in server.requests if path.endswith('/pointings'))
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--pointings', type='int', default=5000,
+                      help="Number of planned pointings")
+    parser.add_option('--change', type='float', default=0.05,
+                      help="Fraction of the plan dropped, moved and added per round")
+    parser.add_option('--rounds', type='int', default=5,
+                      help="Number of re-plans")
+    parser.add_option('--latency', type='float', default=0.05,
+                      help="Seconds the mock API takes per request")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    rng = np.random.default_rng(0)
+    n = options.pointings
+    start = np.datetime64('2019-08-15T00:00:00', 'ms')
+    plans = [(rng.uniform(0, 360, n), rng.uniform(-60, 30, n),
+              start + (np.arange(n) * 120 * 1000).astype('timedelta64[ms]'),
+              rng.choice(np.array(list('griz')), n))]
+    for _ in range(options.rounds):
+        plans.append(replan(*plans[-1], options.change, rng))
+
+    with MockTreasureMap(latency=options.latency) as server:
+        t0 = time.perf_counter()
+        for arrays in plans:
+            plan = make_plan(server.url, *arrays)
+            plan[0].cancel_all()
+            submit_many(plan)
+            assert planned(server) == expected(plan)
+        t_full = time.perf_counter() - t0
+        full_rows, full_requests = rows_sent(server), len(server.requests)
+
+    with MockTreasureMap(latency=options.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        state = PlanSync(os.path.join(tmp, 'plan.jsonl'), GRACEID, INSTRUMENT)
+        t0 = time.perf_counter()
+        cancelled = 0
+        for arrays in plans:
+            plan = make_plan(server.url, *arrays)
+            cancelled += state.sync(plan)["cancelled"]
+            assert planned(server) == expected(plan)
+        t_sync = time.perf_counter() - t0
+        sync_rows, sync_requests = rows_sent(server), len(server.requests)
+
+        # A fresh PlanSync reading the same state has nothing left to do
+        again = PlanSync(state.path, GRACEID, INSTRUMENT).diff(plan)
+        assert again[0] == 0 and again[1] == []
+
+    print("cancel_all + resubmit: {:8d} pointings sent in {:5d} requests, {:6.2f} s".format(
+        full_rows, full_requests, t_full))
+    print("PlanSync:              {:8d} pointings sent in {:5d} requests, {:6.2f} s ({} cancelled)".format(
+        sync_rows, sync_requests, t_sync, cancelled))
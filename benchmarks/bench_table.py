@@ -0,0 +1,78 @@
+# Memory per pointing and append throughput of the columnar
+# PointingTable against a list of pointing dicts
+
+## USAGE:
+# python benchmarks/bench_table.py --rows 1000000
+
+from optparse import OptionParser
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, '.')
+from treasuremap import Pointings
+
+
+def dict_append(p, ra, dec, times):
+    pointings = []
+    for r, d, t in zip(ra, dec, times):
+        pointings.append({
+            "status": p.status,
+            "position": "POINT({} {})".format(r, d),
+            "instrumentid": p.instrumentid,
+            "pos_angle": 0.0,
+            "time": t,
+            "band": p.band,
+            "depth": 23.0,
+            "depth_unit": "ab_mag"
+        })
+    return pointings
+
+
+def table_append(p, ra, dec, times):
+    for r, d, t in zip(ra, dec, times):
+        p.add_pointing(r, d, t, 23.0, "ab_mag")
+    return p
+
+
+def table_extend(p, ra, dec, times):
+    p.add_pointings(ra, dec, times, 23.0, "ab_mag")
+    return p
+
+
+def measure(func, ra, dec, times):
+    p = Pointings("planned", "TEST_EVENT", 38, 'r', api_token="TOKEN")
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(p, ra, dec, times)
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return elapsed, memory
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--rows', type='int', default=200000,
+                      help="Number of pointings")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    n = options.rows
+    rng = np.random.default_rng(0)
+    ra = rng.uniform(0, 360, n).tolist()
+    dec = rng.uniform(-90, 30, n).tolist()
+    times = np.datetime_as_string(
+        np.datetime64('2019-08-14T00:00:00') +
+        rng.integers(0, 86400 * 20, n).astype('timedelta64[s]'),
+        unit='s').tolist()
+
+    print("{:14s} {:>12s} {:>14s}".format("", "bytes/point", "appends/s"))
+    for name, func in [("list of dicts", dict_append),
+                       ("table append", table_append),
+                       ("table extend", table_extend)]:
+        elapsed, memory = measure(func, ra, dec, times)
+        print("{:14s} {:>12.1f} {:>14.0f}".format(
+            name, memory / n, n / elapsed))
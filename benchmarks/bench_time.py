@@ -0,0 +1,85 @@
+# Exposure midpoints and Treasure Map timestamps for many observations,
+# computed one row at a time with strptime/strftime (as the examples
+# did) and with the array functions of treasuremap.time. Also times the
+# DECam night + time of day formatting of treasue_map_query.py against
+# the row-wise .apply it replaced. Checks both give the same strings
+
+## USAGE:
+# python benchmarks/bench_time.py --rows 1000000
+
+from optparse import OptionParser
+import datetime as dt
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '.')
+from treasuremap.time import format_times, midpoints, parse_durations, parse_nights
+
+
+def make_observations(n):
+    rng = np.random.default_rng(0)
+    start = np.datetime64('2019-08-14T00:00:00') + \
+        rng.integers(0, 86400 * 365, n).astype('timedelta64[s]')
+    length = rng.integers(1, 86400, n)
+    durations = ['{:02d}:{:02d}:{:02d}'.format(s // 3600, s // 60 % 60, s % 60)
+                 for s in length.tolist()]
+    return np.datetime_as_string(start).tolist(), durations
+
+
+def midpoints_per_row(obs_start, obs_length):
+    times = []
+    for start, dur in zip(obs_start, obs_length):
+        start_dt = dt.datetime.strptime(start, "%Y-%m-%dT%H:%M:%S")
+        dodgy_delta = dt.datetime.strptime(
+            dur, "%H:%M:%S") - dt.datetime.strptime("00:00:00", "%H:%M:%S")
+
+        mid = start_dt + dodgy_delta / 2
+        times.append(dt.datetime.strftime(mid, "%Y-%m-%dT%H:%M:%S.%f")[:-4])
+    return times
+
+
+def nights_per_row(df):
+    date = pd.to_datetime(df['night'], format='%Y%m%d')
+    tod = pd.to_datetime(df['time'], format='%H:%M:%S')
+    return (date.apply(lambda x: x.strftime('%Y-%m-%d')) + 'T' +
+            tod.apply(lambda x: x.strftime('%H:%M:%S') + '.0')).tolist()
+
+
+def nights_vectorized(df):
+    return format_times(parse_nights(df['night'].values) +
+                        parse_durations(df['time'].values), decimals=1).tolist()
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--rows', type='int', default=1000000,
+                      help="Number of observations")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    obs_start, obs_length = make_observations(options.rows)
+    print("{} observations".format(options.rows))
+
+    slow, expected = timed(midpoints_per_row, obs_start, obs_length)
+    fast, got = timed(lambda: format_times(midpoints(obs_start, obs_length)).tolist())
+    assert got == expected
+    print("{:<22} {:8.3f} s per row  {:8.3f} s vectorized  {:6.1f}x".format(
+        'midpoints', slow, fast, slow / fast))
+
+    df = pd.DataFrame({'night': [s[:10].replace('-', '') for s in obs_start],
+                       'time': [s[11:] for s in obs_start]})
+    slow, expected = timed(nights_per_row, df)
+    fast, got = timed(nights_vectorized, df)
+    assert got == expected
+    print("{:<22} {:8.3f} s per row  {:8.3f} s vectorized  {:6.1f}x".format(
+        'night + time of day', slow, fast, slow / fast))
+
+    print("Vectorized timestamps match the per-row ones exactly")
@@ -0,0 +1,111 @@
+# Latency of watch mode, from observation to acknowledged pointing ID,
+# against the mock API. A writer drops a pointing file stamped with the
+# current time into a directory every --every seconds while a Watcher
+# tails it, for a few micro-batch settings. One file is rewritten with
+# extra rows to check that only those are sent; the mock must end up
+# with every pointing exactly once, also when it fails some requests
+
+## USAGE:
+# python benchmarks/bench_watch.py --files 20 --per-file 50 --every 0.2 --error-rate 0.1
+
+from optparse import OptionParser
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '.')
+from treasuremap import metrics, SubmissionJournal
+from treasuremap.mockserver import MockTreasureMap
+from treasuremap.watch import DirectoryPoll, Watcher
+
+# (max_size, max_delay)
+CONFIGS = [(1, 0.0), (200, 0.5), (200, 2.0)]
+
+
+def write_file(path, n, rng):
+    now = np.datetime64(time.time_ns() // 1000000, 'ms')
+    df = pd.DataFrame({'ra': rng.uniform(0, 360, n),
+                       'dec': rng.uniform(-90, 30, n),
+                       'time': np.datetime_as_string(np.full(n, now)),
+                       'band': rng.choice(list('griz'), n),
+                       'depth': rng.uniform(20, 24, n),
+                       'depth_unit': 'ab_mag'})
+    tmp = path + '.tmp'
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return df
+
+
+def writer(directory, options):
+    rng = np.random.default_rng(0)
+    for i in range(options.files):
+        write_file(os.path.join(directory, 'exp_{:04d}.csv'.format(i)), options.per_file, rng)
+        time.sleep(options.every)
+
+    # Rewrite the first file with some rows appended
+    first = os.path.join(directory, 'exp_0000.csv')
+    extra = first + '.new'
+    write_file(extra, 10, rng)
+    with open(first) as f, open(extra) as g:
+        text = f.read() + ''.join(g.readlines()[1:])
+    os.remove(extra)
+    with open(first + '.tmp', 'w') as f:
+        f.write(text)
+    os.replace(first + '.tmp', first)
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--files', type='int', default=20, help="Files written")
+    parser.add_option('--per-file', type='int', default=50, help="Pointings per file")
+    parser.add_option('--every', type='float', default=0.2, help="Seconds between files")
+    parser.add_option('--interval', type='float', default=0.05, help="Seconds between polls")
+    parser.add_option('--latency', type='float', default=0.01, help="Seconds the mock API takes per request")
+    parser.add_option('--error-rate', type='float', default=0.0, help="Fraction of requests the mock fails")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    expected = options.files * options.per_file + 10
+    for max_size, max_delay in CONFIGS:
+        registry = metrics.enable()
+        with tempfile.TemporaryDirectory() as directory, \
+                MockTreasureMap(latency=options.latency, error_rate=options.error_rate,
+                                seed=0) as server:
+            journal = SubmissionJournal(os.path.join(directory, 'watch.journal'))
+            incoming = os.path.join(directory, 'incoming')
+            os.makedirs(incoming)
+
+            watcher = Watcher(DirectoryPoll(incoming, settle=0.0), 'TEST_EVENT', 38,
+                              api_token='TOKEN', interval=options.interval,
+                              max_size=max_size, max_delay=max_delay, journal=journal,
+                              base_url=server.url)
+            thread = threading.Thread(target=writer, args=(incoming, options))
+            thread.start()
+
+            # Watch until the writer is done and every pointing is in
+            waiting = threading.Thread(target=watcher.run)
+            waiting.start()
+            thread.join()
+            deadline = time.time() + 30
+            while len(server.pointings) < expected and time.time() < deadline:
+                time.sleep(0.05)
+            watcher.stop()
+            waiting.join()
+
+            assert len(server.pointings) == expected, (len(server.pointings), expected)
+        metrics.disable()
+
+        snapshot = registry.snapshot()
+        timings = {t['name']: t for t in snapshot['timings']}
+        latency = timings['latency']
+        batches = timings['micro_batch']['count']
+        print("max_size {:>4} max_delay {:4.1f} s: {:>3} micro-batches, latency mean {:6.3f} s "
+              "max {:6.3f} s, {} rows skipped on reread".format(
+                  max_size, max_delay, batches, latency['total'] / latency['count'],
+                  latency['max'], watcher.totals['skipped']))
+
+    print("Every pointing was acknowledged exactly once")
@@ -0,0 +1,297 @@
+# End-to-end benchmark suite against the local mock Treasure Map API.
+# Times add_pointing, add_pointings, build_json, serialisation, submit
+# and a full submit_tm.py run for synthetic pointing sets, records peak
+# memory, and writes the results as JSON for tracking regressions
+
+## USAGE:
+# python benchmarks/run_benchmarks.py --sizes 100,1000,10000,100000,1000000 --output results.json
+# python benchmarks/run_benchmarks.py --compare results.json   # exits 1 on a regression
+# python benchmarks/run_benchmarks.py --latency 0.05 --error-rate 0.05 --cases submit
+
+import datetime
+import gc
+import json
+from optparse import OptionParser
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '.')
+from treasuremap import Pointings, submit_many
+from treasuremap.mockserver import MockTreasureMap
+from treasuremap.retry import RetryPolicy
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+GRACEID = "BENCH_EVENT"
+
+
+def make_frame(n, seed=0):
+    '''
+    Synthetic DECam-like pointing table with n rows
+    '''
+    rng = np.random.default_rng(seed)
+    times = np.datetime64('2019-08-14T00:00:00') + \
+        rng.integers(0, 86400 * 20, n).astype('timedelta64[s]')
+    return pd.DataFrame({
+        'ra': rng.uniform(0, 360, n),
+        'dec': rng.uniform(-90, 30, n),
+        'time': np.char.add(np.datetime_as_string(times, unit='s'), '.0'),
+        'band': rng.choice(list('grizY'), n),
+        'depth': rng.uniform(20, 24, n).round(2),
+        'depth_unit': 'ab_mag'})
+
+
+def new_pointings(url=None):
+    return Pointings("completed", GRACEID, 38, "i", api_token="TOKEN",
+                     base_url=url, retry=RetryPolicy(backoff=0.01))
+
+
+def filled(df, url=None):
+    p = new_pointings(url)
+    p.add_pointings(df['ra'].values, df['dec'].values, df['time'].values,
+                    df['depth'].values, 'ab_mag')
+    return p
+
+
+# Each case takes the frame and the mock URL and returns a function to
+# time, so setup stays out of the measurement
+
+def case_add_pointing(df, url):
+    rows = list(zip(df['ra'].tolist(), df['dec'].tolist(),
+                    df['time'].tolist(), df['depth'].tolist()))
+
+    def run():
+        p = new_pointings()
+        for ra, dec, t, depth in rows:
+            p.add_pointing(ra, dec, t, depth, 'ab_mag')
+        return p
+    return run
+
+
+def case_add_pointings(df, url):
+    return lambda: filled(df)
+
+
+def case_build_json(df, url):
+    p = filled(df)
+    return p.build_json
+
+
+def case_serialise(df, url):
+    p = filled(df)
+    p.build_json()
+    return lambda: json.dumps(p.json_data).encode()
+
+
+def case_serialise_stream(df, url):
+    p = filled(df)
+
+    def run():
+        size = 0
+        for piece in p.iter_json():
+            size += len(piece)
+        return size
+    return run
+
+
+def case_submit(df, url):
+    p = filled(df, url)
+
+    def run():
+        result = submit_many([p], chunk_size=500, max_workers=4)[0]
+        if result["failed"]:
+            raise RuntimeError("{} chunks failed".format(len(result["failed"])))
+        return result
+    return run
+
+
+CASES = {
+    'add_pointing': case_add_pointing,
+    'add_pointings': case_add_pointings,
+    'build_json': case_build_json,
+    'serialise': case_serialise,
+    'serialise_stream': case_serialise_stream,
+    'submit': case_submit,
+}
+
+# One pointing at a time is slow; stop it at this size by default
+LIMITS = {'add_pointing': 100000}
+
+
+def measure(make, df, url, memory):
+    '''
+    Best of a few timed runs, then one run under tracemalloc for peak memory
+    '''
+    run = make(df, url)
+    repeats = 3 if len(df) <= 10000 else 1
+    times = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        run = make(df, url)
+        gc.collect()
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return min(times), peak
+
+
+# Runs a script as __main__ and reports its own peak RSS on stderr
+CHILD = """
+import resource, runpy, sys
+sys.argv = sys.argv[1:]
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+finally:
+    sys.stderr.write('\\nmaxrss %d\\n' % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def run_submit_tm(df, server, workdir):
+    '''
+    Run submit_tm.py on a CSV of the frame in a child process
+    '''
+    infile = os.path.join(workdir, 'pointings.csv')
+    df.to_csv(infile, index=False)
+    os.makedirs(os.path.join(workdir, 'logs'), exist_ok=True)
+
+    env = dict(os.environ, PYTHONPATH=REPO)
+    start = time.perf_counter()
+    child = subprocess.run([sys.executable, '-c', CHILD,
+                            os.path.join(REPO, 'submit_tm.py'),
+                            '--infile', infile, '--graceid', GRACEID,
+                            '--api-token', 'TOKEN', '--url', server.url,
+                            '--journal', os.path.join(workdir, 'bench.journal')],
+                           cwd=workdir, env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                           text=True)
+    elapsed = time.perf_counter() - start
+
+    if len(server.pointings) != len(df):
+        raise RuntimeError("submit_tm.py submitted {} of {} pointings:\n{}".format(
+            len(server.pointings), len(df), child.stderr))
+
+    # ru_maxrss is in KiB on Linux
+    rss = int(child.stderr.rsplit('maxrss', 1)[1])
+    return elapsed, rss * 1024
+
+
+def metadata(options):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'time': datetime.datetime.now().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'latency': options.latency,
+        'error_rate': options.error_rate,
+    }
+
+
+def compare(results, baseline, threshold):
+    '''
+    Print the change against a baseline, returning the regressions
+    '''
+    old = {(r['case'], r['size']): r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        o = old.get((r['case'], r['size']))
+        if o is None:
+            continue
+        ratio = r['seconds'] / o['seconds'] if o['seconds'] else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions.append(r)
+        print("{:<18} {:>8} {:9.4f} s -> {:9.4f} s  x{:5.2f}{}".format(
+            r['case'], r['size'], o['seconds'], r['seconds'], ratio, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = OptionParser(__doc__)
+    parser.add_option('--sizes', default='100,1000,10000,100000,1000000',
+                      help="Comma separated numbers of pointings")
+    parser.add_option('--cases', default=','.join(list(CASES) + ['submit_tm']),
+                      help="Comma separated cases to run")
+    parser.add_option('--latency', type='float', default=0.0,
+                      help="Seconds the mock API waits before each answer")
+    parser.add_option('--error-rate', type='float', default=0.0,
+                      help="Fraction of requests the mock answers with HTTP 503")
+    parser.add_option('--no-memory', action='store_true',
+                      help="Skip the tracemalloc runs")
+    parser.add_option('--output', default=None,
+                      help="JSON file for the results (default benchmarks/results/<time>.json)")
+    parser.add_option('--compare', default=None,
+                      help="Earlier results to compare against")
+    parser.add_option('--threshold', type='float', default=1.25,
+                      help="Slowdown ratio counted as a regression")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    sizes = [int(float(s)) for s in options.sizes.split(',')]
+    cases = options.cases.split(',')
+    unknown = [c for c in cases if c not in CASES and c != 'submit_tm']
+    if unknown:
+        parser.error("Unknown cases: {}".format(', '.join(unknown)))
+
+    results = []
+    with MockTreasureMap(latency=options.latency,
+                         error_rate=options.error_rate, seed=0) as server, \
+            tempfile.TemporaryDirectory() as workdir:
+        for n in sizes:
+            df = make_frame(n)
+            for case in cases:
+                if n > LIMITS.get(case, n):
+                    continue
+                if case == 'submit_tm':
+                    seconds, peak = run_submit_tm(df, server, workdir)
+                else:
+                    seconds, peak = measure(CASES[case], df, server.url,
+                                            not options.no_memory)
+                result = {'case': case, 'size': n, 'seconds': seconds,
+                          'per_second': n / seconds if seconds else None,
+                          'peak_bytes': peak}
+                results.append(result)
+                print("{:<18} {:>8} {:9.4f} s {:12.0f} /s {:>10}".format(
+                    case, n, seconds, result['per_second'] or 0,
+                    '-' if peak is None else '{:.1f} MB'.format(peak / 1e6)))
+
+                # Keep the mock from holding every benchmark's pointings
+                with server.lock:
+                    server.pointings.clear()
+                    server.requests.clear()
+
+    output = options.output
+    if output is None:
+        os.makedirs(os.path.join(REPO, 'benchmarks', 'results'), exist_ok=True)
+        output = os.path.join(REPO, 'benchmarks', 'results', '{}.json'.format(
+            datetime.datetime.now().strftime('%y%m%d_%H%M%S')))
+    with open(output, 'w') as f:
+        json.dump({'meta': metadata(options), 'results': results}, f, indent=4)
+    print("Wrote {}".format(output))
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, options.threshold):
+            sys.exit(1)
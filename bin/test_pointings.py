@@ -5,7 +5,6 @@ from astropy.coordinates import SkyCoord
 import numpy as np
 import json
 
-import datetime as dt
 
 # Set up instrument parameters
 graceid = "TEST_EVENT"
@@ -38,18 +37,11 @@ dec = S190814bv_coord.dec.deg
 # Initialise Pointings class
 S190814bv = Pointings("planned", graceid, instrumentid, band)
 
-# Loop over each observation and add to Pointings
-for start, dur, rms in zip(obs_start, obs_length, rms_vals):
-    start_dt = dt.datetime.strptime(start, "%Y-%m-%dT%H:%M:%S")
-    dodgy_delta = dt.datetime.strptime(
-        dur, "%H:%M:%S") - dt.datetime.strptime("00:00:00", "%H:%M:%S")
-
-    time = start_dt + dodgy_delta / 2
-    time_str = dt.datetime.strftime(time, "%Y-%m-%dT%H:%M:%S.%f")[:-4]
-
-    S190814bv.add_pointing(
-        ra, dec, time_str, rms.to(
-            u.Jy).value * 5, depth_unit)
+# Add all observations to Pointings, timed at the middle of each exposure
+n_obs = len(obs_start)
+S190814bv.add_pointings(
+    np.full(n_obs, ra), np.full(n_obs, dec), obs_start,
+    rms_vals.to(u.Jy).value * 5, depth_unit, duration=obs_length)
 
 # Build the JSON and submit
 S190814bv.build_json()
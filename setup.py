@@ -11,6 +11,8 @@ setup(
     license='MIT',
     description=('Python module to upload pointings to treasuremap.space'),
     install_requires=[],
+    # zstd request bodies, see treasuremap.compression
+    extras_require={'zstd': ['zstandard']},
     scripts=[],
     include_package_data=True
 )
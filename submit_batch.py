@@ -0,0 +1,128 @@
+# A script to submit many pointing files to Treasure Map in one go,
+# for several events and instruments
+# Authors: R. Morgan and M. Gill
+
+## USAGE:
+# python submit_batch.py --manifest tonight.csv
+#
+# tonight.csv lists one job per line:
+#   graceid,instrumentid,infile,status
+#   S190814bv,38,S190814bv_TM_pointings.csv,completed
+#   S200105ae,38,S200105ae_plan.parquet,planned
+
+import datetime
+import getpass
+import glob
+import json
+import logging
+from optparse import OptionParser
+import os
+import sys
+
+# Get username of user
+USERNAME = getpass.getuser()
+
+# Handle command line arguments
+parser = OptionParser(__doc__)
+parser.add_option('--manifest', default=None, help="CSV or JSON file of jobs with graceid, instrumentid, infile and status")
+parser.add_option('--processes', type='int', default=None, help="Processes reading and encoding pointing files (default: number of CPUs)")
+parser.add_option('--workers', type='int', default=8, help="Maximum number of requests in flight across all jobs")
+parser.add_option('--chunk-size', type='int', default=500, help="Maximum number of pointings per request")
+parser.add_option('--journal-dir', default='logs', help="Directory of per-event journals, reruns only submit what they lack")
+parser.add_option('--log-dir', default=None, help="Directory for the batch and per-job logs (default logs/batch_<time>)")
+parser.add_option('--api-token', default=None, help="Treasure Map API token (default: $TREASUREMAP_API or api_tokens/<user>/)")
+parser.add_option('--url', default=None, help="Treasure Map API base URL, e.g. of a test server")
+parser.add_option('--compress', default=None, help="Compress request bodies with gzip or zstd, falling back to none if the server refuses")
+parser.add_option('--coord-decimals', type='int', default=None, help="Round RA and Dec to this many decimal places in the payloads")
+parser.add_option('--depth-decimals', type='int', default=None, help="Round depths to this many decimal places in the payloads")
+parser.add_option('--metrics', default=None, help="JSON-lines file to write timing spans and counters to")
+parser.add_option('--prometheus', default=None, help="Prometheus textfile (.prom) to write counters and timings to at the end")
+parser.add_option('--test', action='store_true', help="Read and encode the jobs without submitting")
+options, args = parser.parse_args(sys.argv[1:])
+
+if not options.manifest:
+    print("Use '--manifest' to specify the file listing the jobs")
+    sys.exit(1)
+
+if options.compress not in (None, 'gzip', 'zstd'):
+    print("Use '--compress gzip' or '--compress zstd'")
+    sys.exit(1)
+
+# Set up the batch log and one log file per job
+if options.log_dir is None:
+    options.log_dir = "logs/batch_{}".format(datetime.datetime.now().strftime("%y-%m-%d_%H-%M-%S"))
+os.makedirs(options.log_dir, exist_ok=True)
+os.makedirs(options.journal_dir, exist_ok=True)
+
+log_format = logging.Formatter("|%(levelname)s\t| %(asctime)s -- %(message)s", datefmt="20%y-%m-%d %I:%M:%S %p")
+logging.basicConfig(filename=os.path.join(options.log_dir, "batch.log"),
+                    filemode="a+",
+                    format="|%(levelname)s\t| %(asctime)s -- %(name)s -- %(message)s",
+                    datefmt="20%y-%m-%d %I:%M:%S %p",
+                    level=logging.DEBUG)
+logging.info("[" + USERNAME + "] " + "submit_batch.py started")
+logging.debug("[" + USERNAME + "] " + "program command: " + ' '.join(sys.argv))
+
+# Imported only now, so '--help' and a missing manifest return straight away
+from treasuremap import metrics
+from treasuremap.batch import format_summary, job_logger, read_manifest, run_batch
+
+try:
+    jobs = read_manifest(options.manifest)
+except (OSError, ValueError) as e:
+    print("Unable to read {}: {}".format(options.manifest, e))
+    logging.critical("[" + USERNAME + "] " + "Unable to read manifest: {}".format(e))
+    sys.exit(1)
+logging.info("[" + USERNAME + "] " + "Read {} jobs from {}".format(len(jobs), options.manifest))
+
+for job in jobs:
+    handler = logging.FileHandler(os.path.join(options.log_dir, "{}.log".format(job['name'])))
+    handler.setFormatter(log_format)
+    job_logger(job).addHandler(handler)
+
+# API token - Get your own by making a TreasureMap account
+api_token = options.api_token or os.getenv('TREASUREMAP_API')
+if api_token is None:
+    tokens = glob.glob('api_tokens/{}/*.api_token'.format(USERNAME)) + glob.glob('api_tokens/mssgill/*.api_token')
+    if not tokens:
+        print("No API token: use '--api-token', set TREASUREMAP_API or add one under api_tokens/")
+        logging.critical("[" + USERNAME + "] " + "Program needs a valid API_token and will terminate")
+        sys.exit(1)
+    api_token = os.path.basename(tokens[0]).split('.')[0]
+
+# Collect timings and counters of the uploads only when asked to
+sinks = []
+if options.metrics:
+    sinks.append(metrics.JSONLinesSink(options.metrics))
+if options.prometheus:
+    sinks.append(metrics.PrometheusSink(options.prometheus))
+if sinks:
+    metrics.enable(sinks)
+
+summary = run_batch(jobs,
+                    api_token=api_token,
+                    processes=options.processes,
+                    max_workers=options.workers,
+                    chunk_size=options.chunk_size,
+                    journal_dir=options.journal_dir,
+                    base_url=options.url,
+                    submit=not options.test,
+                    pointing_options={'compression': options.compress,
+                                      'coord_decimals': options.coord_decimals,
+                                      'depth_decimals': options.depth_decimals})
+
+if sinks:
+    metrics.registry().flush()
+
+# Save the summary, including the pointing IDs of each job
+with open(os.path.join(options.log_dir, "summary.json"), 'w') as f:
+    json.dump(summary, f, indent=4)
+
+print(format_summary(summary))
+logging.info("[" + USERNAME + "] " + "Submitted {} of {} pointings, {} failed, {} jobs with errors".format(
+    summary['submitted'], summary['pointings'], summary['failed'], summary['errors']))
+logging.info("[" + USERNAME + "] " + "Program finished")
+logging.shutdown()
+
+if summary['failed'] or summary['errors']:
+    sys.exit(1)
@@ -8,23 +8,45 @@ import json
 import logging
 from optparse import OptionParser
 import os
+import shutil
 import sys
 sys.path.append('treasuremap')
 
-from astropy.coordinates import SkyCoord
-import pandas as pd
-from treasuremap import Pointings
-
 # Get username of user
 USERNAME = getpass.getuser()
 
+# Handle command line arguments
+parser = OptionParser(__doc__)
+parser.add_option('--infile', default=None, help="Name of file with pointing info")
+parser.add_option('--format', default=None, help="Format of --infile: csv, parquet, arrow or fits (default: from the file name)")
+parser.add_option('--preview', action='store_true', help="Prompt before submitting")
+parser.add_option('--test', action='store_true', help="Run without submitting")
+parser.add_option('--graceid', default=None, help="Name of the GraceDB event")
+parser.add_option('--chunk-size', type='int', default=500, help="Maximum number of pointings per request")
+parser.add_option('--workers', type='int', default=4, help="Maximum number of requests in flight")
+parser.add_option('--journal', default=None, help="Journal of acknowledged pointings, reruns only submit what it lacks (default logs/<graceid>.journal)")
+parser.add_option('--dedup', default=None, help="SQLite index of submitted pointings, pointings already in it are skipped")
+parser.add_option('--seed', default=None, help="Comma separated requests.json logs or journals to seed --dedup from, with the acknowledged pointings looked up on the server")
+parser.add_option('--merge-radius', type='float', default=None, help="Merge pointings closer than this many degrees into one with their combined depth")
+parser.add_option('--api-token', default=None, help="Treasure Map API token (default: from api_tokens/<user>/)")
+parser.add_option('--url', default=None, help="Treasure Map API base URL, e.g. of a test server")
+parser.add_option('--metrics', default=None, help="JSON-lines file to write timing spans and counters to")
+parser.add_option('--prometheus', default=None, help="Prometheus textfile (.prom) to write counters and timings to at the end")
+parser.add_option('--compress', default=None, help="Compress request bodies with gzip or zstd, falling back to none if the server refuses")
+parser.add_option('--coord-decimals', type='int', default=None, help="Round RA and Dec to this many decimal places in the payloads (5 is under 0.04 arcsec)")
+parser.add_option('--depth-decimals', type='int', default=None, help="Round depths to this many decimal places in the payloads")
+parser.add_option('--processes', type='int', default=None, help="Encode the payloads up front in this many processes, for very large tilings")
+parser.add_option('--merge-window', type='float', default=3600.0, help="Only merge pointings taken within this many seconds of each other (default 3600)")
+options, args = parser.parse_args(sys.argv[1:])
+
 # Get the time for stamping the log files
-time = datetime.dateime.now()
+time = datetime.datetime.now()
 
 # Set up logging
 log_dir = "logs/{}/".format(time.strftime("%y-%m-%d_%H-%M-%S"))
-rc = os.system("mkdir " + log_dir)
-if rc != 0:
+try:
+    os.makedirs(log_dir)
+except OSError:
     print("Unable to make log directory " + log_dir)
     print("Check your user's write permissions or make the directory manually")
     sys.exit()
@@ -37,14 +59,6 @@ logging.basicConfig(filename=log_dir + "submit_{}.log".format(time.strftime("%y%
 logging.info("[" + USERNAME + "] " + "submit_tm.py started")
 logging.debug("[" + USERNAME + "] " + "program command: " + ' '.join(sys.argv))
 
-# Handle command line arguments
-parser = OptionParser(__doc__)
-parser.add_option('--infile', default=None, help="Name of file with pointing info")
-parser.add_option('--preview', action='store_true', help="Prompt before submitting")
-parser.add_option('--test', action='store_true', help="Run without submitting")
-parser.add_option('--graceid', default=None, help="Name of the GraceDB event")
-options, args = parser.parse_args(sys.argv[1:])
-
 if not options.infile:
     print("Use '--infile' to specify the file with pointing info")
     logging.critical("[" + USERNAME + "] " + "Missing --infile argument")
@@ -59,17 +73,55 @@ if not options.graceid:
     logging.shutdown()
     sys.exit()
 
+if options.compress not in (None, 'gzip', 'zstd'):
+    print("Use '--compress gzip' or '--compress zstd'")
+    logging.critical("[" + USERNAME + "] " + "Unknown --compress {}".format(options.compress))
+    logging.info("[" + USERNAME + "] " + "Program terminating")
+    logging.shutdown()
+    sys.exit()
+
 logging.debug("[" + USERNAME + "] " + "--infile set to {}".format(options.infile))
+logging.debug("[" + USERNAME + "] " + "--format set to {}".format(options.format))
 logging.debug("[" + USERNAME + "] " + "--graceid set to {}".format(options.graceid))
 logging.debug("[" + USERNAME + "] " + "--preview set to {}".format(options.preview))
 logging.debug("[" + USERNAME + "] " + "--test set to {}".format(options.test))
+logging.debug("[" + USERNAME + "] " + "--chunk-size set to {}".format(options.chunk_size))
+logging.debug("[" + USERNAME + "] " + "--workers set to {}".format(options.workers))
+logging.debug("[" + USERNAME + "] " + "--journal set to {}".format(options.journal))
+logging.debug("[" + USERNAME + "] " + "--dedup set to {}".format(options.dedup))
+logging.debug("[" + USERNAME + "] " + "--seed set to {}".format(options.seed))
+logging.debug("[" + USERNAME + "] " + "--merge-radius set to {}".format(options.merge_radius))
+logging.debug("[" + USERNAME + "] " + "--url set to {}".format(options.url))
+logging.debug("[" + USERNAME + "] " + "--metrics set to {}".format(options.metrics))
+logging.debug("[" + USERNAME + "] " + "--prometheus set to {}".format(options.prometheus))
+logging.debug("[" + USERNAME + "] " + "--merge-window set to {}".format(options.merge_window))
+logging.debug("[" + USERNAME + "] " + "--compress set to {}".format(options.compress))
+logging.debug("[" + USERNAME + "] " + "--coord-decimals set to {}".format(options.coord_decimals))
+logging.debug("[" + USERNAME + "] " + "--depth-decimals set to {}".format(options.depth_decimals))
+logging.debug("[" + USERNAME + "] " + "--processes set to {}".format(options.processes))
+
+# Imported only now, so '--help' and missing arguments return straight away
+import numpy as np
+
+from treasuremap import pointings_from_frame, submit_many, DedupIndex, SubmissionJournal, TreasureMapClient
+from treasuremap import metrics
+from treasuremap.loaders import read_pointings
+
+# Collect timings and counters of each stage only when asked to
+sinks = []
+if options.metrics:
+    sinks.append(metrics.JSONLinesSink(options.metrics))
+if options.prometheus:
+    sinks.append(metrics.PrometheusSink(options.prometheus))
+if sinks:
+    metrics.enable(sinks)
 
 # Copy the infile to the log directory
 logging.info("[" + USERNAME + "] " + "Copying infile to log directory")
-rc = os.system("cp {} ".format(options.infile) + log_dir)
-if rc == 0:
+try:
+    shutil.copy(options.infile, log_dir)
     logging.debug("[" + USERNAME + "] " + "Copy was successful")
-else:
+except OSError:
     logging.warning("[" + USERNAME + "] " + "Copy FAILED")
 
 if options.test:
@@ -77,24 +129,28 @@ if options.test:
     logging.info("[" + USERNAME + "] " + "Setting --preview to True for testing")
 
 # API token - Get your own by making a TreasureMap account
-try:
-    API_TOKEN = glob.glob('api_tokens/{}/*.api_token'.format(USERNAME))[0].split('/')[-1].split('.')[0]
-    logging.debug("[" + USERNAME + "] " + "API_TOKEN set to {}".format(API_TOKEN))
-except IndexError:
-    logging.error("[" + USERNAME + "] " + "Unable to find user-specific API_TOKEN")
-    logging.info("[" + USERNAME + "] " + "M. Gill's token will be used as a default")
+if options.api_token:
+    API_TOKEN = options.api_token
+    logging.debug("[" + USERNAME + "] " + "API_TOKEN set from --api-token")
+else:
     try:
-        API_TOKEN = glob.glob('api_tokens/mssgill/*.api_token')[0].split('/')[-1].split('.')[0]
+        API_TOKEN = glob.glob('api_tokens/{}/*.api_token'.format(USERNAME))[0].split('/')[-1].split('.')[0]
         logging.debug("[" + USERNAME + "] " + "API_TOKEN set to {}".format(API_TOKEN))
     except IndexError:
-        logging.error("[" + USERNAME + "] " + "Unable to find M. Gill's default API_TOKEN")
-        logging.critical("[" + USERNAME + "] " + "Program needs a valid API_token and will terminate")
-        logging.shutdown()
-        sys.exit()
+        logging.error("[" + USERNAME + "] " + "Unable to find user-specific API_TOKEN")
+        logging.info("[" + USERNAME + "] " + "M. Gill's token will be used as a default")
+        try:
+            API_TOKEN = glob.glob('api_tokens/mssgill/*.api_token')[0].split('/')[-1].split('.')[0]
+            logging.debug("[" + USERNAME + "] " + "API_TOKEN set to {}".format(API_TOKEN))
+        except IndexError:
+            logging.error("[" + USERNAME + "] " + "Unable to find M. Gill's default API_TOKEN")
+            logging.critical("[" + USERNAME + "] " + "Program needs a valid API_token and will terminate")
+            logging.shutdown()
+            sys.exit()
 
-# Read the pointing information into a Pandas DataFrame
+# Read the pointing information into a Pandas DataFrame, loading only the needed columns
 try:
-    pointings_df = pd.read_csv(options.infile)
+    pointings_df = read_pointings(options.infile, options.format)
     logging.info("[" + USERNAME + "] " + "Successfully read {}".format(options.infile))
 except FileNotFoundError:
     logging.error("[" + USERNAME + "] " + "Unable to find specified infile")
@@ -102,34 +158,53 @@ except FileNotFoundError:
     logging.info("[" + USERNAME + "] " + "Program terminating")
     logging.shutdown()
     sys.exit()
+except (KeyError, ValueError) as e:
+    print("Unable to read {}: {}".format(options.infile, e))
+    logging.error("[" + USERNAME + "] " + "Unable to read infile: {}".format(e))
+    logging.critical("[" + USERNAME + "] " + "Progams needs a valid pointing file")
+    logging.info("[" + USERNAME + "] " + "Program terminating")
+    logging.shutdown()
+    sys.exit()
 
-# Instantiate the treasuremap.Pointing class
+# Instantiate the treasuremap.Pointing class and add the pointings
 #  -- looks like treasuremap requires a different object per band
-pointings = {}
-logging.info("[" + USERNAME + "] " + "Initializing treasuremap.Pointings")
-for flt in set(pointings_df['band'].values):
-    pointings[flt] = Pointings(status="completed",
-                               graceid=options.graceid,
-                               instrumentid=38, # 38 == DECam
-                               band=flt,
-                               api_token=API_TOKEN)
-logging.debug("[" + USERNAME + "] " + "Made pointings for " + ','.join(list(pointings.keys())) + " bands")
-
 logging.info("[" + USERNAME + "] " + "Starting processing of DECam pointings")
-# Iterate through our pointings and add them
-for index, row in pointings_df.iterrows():
-    # Format RA and Dec as proper data type
-    coord = SkyCoord(row['ra'], row['dec'], frame="icrs",  unit="deg")
-
-    # Add the pointing based on the filter used
-    pointings[row['band']].add_pointing(ra=coord.ra.deg, 
-                                        dec=coord.dec.deg,
-                                        time=row['time'],
-                                        depth=row['depth'],
-                                        depth_unit=row['depth_unit'])
-    logging.debug("[" + USERNAME + "] " + "Added pointing for index {}".format(index))
+pointings = pointings_from_frame(pointings_df,
+                                 status="completed",
+                                 graceid=options.graceid,
+                                 instrumentid=38, # 38 == DECam
+                                 api_token=API_TOKEN,
+                                 base_url=options.url,
+                                 compression=options.compress,
+                                 coord_decimals=options.coord_decimals,
+                                 depth_decimals=options.depth_decimals)
+logging.debug("[" + USERNAME + "] " + "Made pointings for " + ','.join(list(pointings.keys())) + " bands")
+for flt in pointings.keys():
+    logging.debug("[" + USERNAME + "] " + "Added {} pointings in {} band".format(len(pointings[flt]), flt))
 logging.info("[" + USERNAME + "] " + "Finished making pointings")
 
+# Collapse dithered exposures of the same field into single pointings
+if options.merge_radius:
+    for flt in pointings.keys():
+        merged = pointings[flt].merge_nearby(options.merge_radius, options.merge_window)
+        logging.info("[" + USERNAME + "] " + "Merged away {} {} band pointings, {} left".format(merged, flt, len(pointings[flt])))
+
+# Skip pointings that earlier runs already submitted
+dedup = None
+if options.dedup:
+    dedup = DedupIndex(options.dedup)
+    if options.seed:
+        client = TreasureMapClient(api_token=API_TOKEN, base_url=options.url)
+        added, ids = dedup.seed_from_logs(options.seed.split(','), options.graceid, client)
+        logging.info("[" + USERNAME + "] " + "Seeded {} with {} acknowledged pointings".format(options.dedup, added))
+        if ids:
+            logging.warning("[" + USERNAME + "] " + "{} acknowledged pointing IDs were not found on the server and were not added".format(len(ids)))
+    for flt in list(pointings.keys()):
+        dropped = pointings[flt].drop_duplicates(dedup)
+        logging.info("[" + USERNAME + "] " + "Dropped {} already submitted {} band pointings".format(dropped, flt))
+        if len(pointings[flt]) == 0:
+            del pointings[flt]
+
 
 # Build all jsons
 logging.info("[" + USERNAME + "] " + "Starting generation of json data")
@@ -164,17 +239,48 @@ if not options.test:
     # Submit jsons
     logging.info("[" + USERNAME + "] " + "Beginning submission process")
     requests = {}
-    for flt in pointings.keys():
-        try:
-            request = pointings[flt].submit()
-            logging.info("[" + USERNAME + "] " + "Submitted {} band pointing".format(flt))
-            requests[flt] = request
-        except Exception:
-            logging.info("[" + USERNAME + "] " + "There was a prolem with the submisison.")
-            logging.exception("[" + USERNAME + "] " + "The traceback for the submission is below")
-            logging.warning("[" + USERNAME + "] " + "The {} band pointings may not have submitted properly".format(flt))
+    bands = list(pointings.keys())
+    if options.journal is None:
+        options.journal = "logs/{}.journal".format(options.graceid)
+    journal = SubmissionJournal(options.journal)
+    logging.info("[" + USERNAME + "] " + "Journal {} holds {} acknowledged pointings".format(options.journal, len(journal)))
+    try:
+        results = submit_many([pointings[flt] for flt in bands],
+                              chunk_size=options.chunk_size,
+                              max_workers=options.workers,
+                              journal=journal,
+                              processes=options.processes)
+    except Exception:
+        logging.info("[" + USERNAME + "] " + "There was a prolem with the submisison.")
+        logging.exception("[" + USERNAME + "] " + "The traceback for the submission is below")
+        results = []
+    for flt, request in zip(bands, results):
+        requests[flt] = request
+        logging.info("[" + USERNAME + "] " + "Submitted {} band pointings, {} accepted, {} already acknowledged".format(
+            flt, len(request["pointing_ids"]) - request["resumed"], request["resumed"]))
+        for failure in request["failed"]:
+            logging.warning("[" + USERNAME + "] " + "{} band pointings {}-{} may not have submitted properly: {}".format(
+                flt, failure["start"], failure["stop"], failure["error"]))
+            if failure["uncertain"]:
+                logging.warning("[" + USERNAME + "] " + "{} band pointings {}-{} may be on the server all the same, check them there before a rerun sends them again".format(
+                    flt, failure["start"], failure["stop"]))
+        if request["failed"]:
+            logging.warning("[" + USERNAME + "] " + "Rerun with the same --journal to resubmit only the failed {} band pointings".format(flt))
+        if dedup is not None:
+            # The journal holds only what the server accepted, leaving out failed chunks and
+            # the pointings rejected in ERRORS
+            acknowledged = np.array([journal.key(pointings[flt].graceid, pointing) in journal
+                                     for pointing in pointings[flt].records()], dtype=bool)
+            dedup.add_pointings(pointings[flt], acknowledged)
     logging.info("[" + USERNAME + "] " + "Finished submisison")
 
+    # Report how much the encoding and compression saved on the wire
+    bytes_raw = sum(pointings[flt].bytes_raw for flt in bands)
+    bytes_sent = sum(pointings[flt].bytes_sent for flt in bands)
+    if bytes_raw:
+        logging.info("[" + USERNAME + "] " + "Sent {} bytes for {} bytes of JSON ({:.1%} saved)".format(
+            bytes_sent, bytes_raw, 1 - bytes_sent / bytes_raw))
+
     # Save pointings
     logging.info("[" + USERNAME + "] " + "Saving submission pointings")
     pointing_filename = log_dir + "pointings.json"
@@ -182,7 +288,7 @@ if not options.test:
     logging.debug("[" + USERNAME + "] " + "pointing file set to {}".format(pointing_filename))
 
     for flt in pointings.keys():
-        pointing_file.write(json.dumps(pointings[flt], indent=4))
+        pointing_file.write(json.dumps(pointings[flt].pointings, indent=4))
         pointing_file.write('\n\n')
 
         logging.info("[" + USERNAME + "] " + "Wrote pointings for {} band".format(flt))
@@ -207,6 +313,12 @@ else:
     logging.info("[" + USERNAME + "] " + "Skipping submission process due to --test argument")
 
 # Conclude the program
+if sinks:
+    snapshot = metrics.registry().flush()
+    for counter in snapshot["counters"]:
+        logging.info("[" + USERNAME + "] " + "{} {}: {}".format(counter["name"], counter["labels"] or '', counter["value"]))
+    for timing in snapshot["timings"]:
+        logging.info("[" + USERNAME + "] " + "{} {}: {} in {:.3f} s".format(timing["name"], timing["labels"] or '', timing["count"], timing["total"]))
 logging.info("[" + USERNAME + "] " + "Progam finished")
 logging.shutdown()
 
@@ -0,0 +1,40 @@
+import pytest
+
+from treasuremap.mockserver import MockTreasureMap
+from treasuremap.retry import RetryPolicy
+from treasuremap.session import close_session
+from treasuremap.treasuremap import Pointings
+
+
+@pytest.fixture(autouse=True)
+def fresh_session():
+    # Every test starts without connections pooled for an earlier server
+    close_session()
+    yield
+    close_session()
+
+
+@pytest.fixture
+def server():
+    with MockTreasureMap(seed=0) as mock:
+        yield mock
+
+
+@pytest.fixture
+def make_pointings(server):
+    '''
+    Build `Pointings` posting to the mock API, with `n` pointings spaced
+    one degree apart in RA
+    '''
+
+    def make(n=10, band='r', status='completed', graceid='TEST_EVENT',
+             ra=10.0, **kwargs):
+        kwargs.setdefault('retry', RetryPolicy(retries=2, backoff=0.0))
+        p = Pointings(status, graceid, 38, band, api_token='TOKEN',
+                      base_url=server.url, **kwargs)
+        for i in range(n):
+            p.add_pointing(ra + i, -20.0, '2019-08-16T14:10:27.0', 22.0,
+                           'ab_mag')
+        return p
+
+    return make
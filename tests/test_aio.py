@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+
+from treasuremap import SubmissionJournal
+from treasuremap.aio import AsyncPointings, submit_many_async
+from treasuremap.retry import RetryPolicy
+from treasuremap.treasuremap import submit_many
+
+
+def make_async(server, n=10, band='r', status='planned', **kwargs):
+    p = AsyncPointings(status, 'TEST_EVENT', 38, band, api_token='TOKEN',
+                       base_url=server.url,
+                       retry=RetryPolicy(retries=2, backoff=0.0), **kwargs)
+    for i in range(n):
+        p.add_pointing(10.0 + i, -20.0, '2019-08-16T14:10:27.0', 22.0,
+                       'ab_mag')
+    return p
+
+
+def test_asubmit(server):
+    p = make_async(server)
+    p.build_json()
+
+    response = asyncio.run(p.asubmit())
+
+    assert len(response['pointing_ids']) == 10
+    assert len(server.pointings) == 10
+
+
+def test_asubmit_chunked_with_a_journal(tmp_path, server):
+    journal = SubmissionJournal(str(tmp_path / 'async.journal'))
+    server.error_rate = 0.5
+    server.error_status = 500
+    first = asyncio.run(make_async(server, n=40).asubmit_chunked(
+        chunk_size=5, journal=journal))
+    assert first['failed']
+
+    server.error_rate = 0.0
+    second = asyncio.run(make_async(server, n=40).asubmit_chunked(
+        chunk_size=5, journal=journal))
+
+    assert second['resumed'] == len(first['pointing_ids'])
+    assert not second['failed']
+    assert len(second['pointing_ids']) == 40
+    assert len(server.pointings) == 40
+
+
+def test_acancel_and_acancel_all(server):
+    p = make_async(server)
+    p.build_json()
+    ids = asyncio.run(p.asubmit())['pointing_ids']
+
+    asyncio.run(p.acancel(ids[:3]))
+    assert [server.pointings[i]['status'] for i in ids[:4]] == [
+        'cancelled'] * 3 + ['planned']
+
+    asyncio.run(p.acancel_all())
+    assert set(record['status'] for record in
+               server.pointings.values()) == {'cancelled'}
+
+
+def test_requests_in_flight_are_capped(server):
+    server.latency = 0.05
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    pointings = [make_async(server, n=20, band=band) for band in 'gri']
+    for p in pointings:
+        post = p.post_pointings
+
+        def counted(payload, post=post):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+            try:
+                return post(payload)
+            finally:
+                with lock:
+                    in_flight[0] -= 1
+
+        p.post_pointings = counted
+
+    results = asyncio.run(submit_many_async(pointings, chunk_size=4,
+                                            max_workers=2))
+
+    assert [len(r['pointing_ids']) for r in results] == [20, 20, 20]
+    assert in_flight[1] == 2
+
+
+def test_event_loop_is_not_blocked(server):
+    server.latency = 0.2
+
+    async def main():
+        p = make_async(server)
+        p.build_json()
+        ticks = 0
+        task = asyncio.ensure_future(p.asubmit())
+        start = time.monotonic()
+        while not task.done():
+            ticks += 1
+            await asyncio.sleep(0.01)
+        return ticks, time.monotonic() - start
+
+    ticks, elapsed = asyncio.run(main())
+    assert elapsed >= 0.2
+    assert ticks >= 5
+
+
+def test_async_pointings_work_with_submit_many(server):
+    pointings = [make_async(server, n=12, band=band) for band in 'gr']
+
+    results = submit_many(pointings, chunk_size=5)
+
+    assert [len(r['pointing_ids']) for r in results] == [12, 12]
+    assert len(server.requests) == 6
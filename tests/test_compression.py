@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from treasuremap.compression import compress, decompress, iter_compressed
+from treasuremap.mockserver import MockTreasureMap
+from treasuremap.treasuremap import submit_many
+
+
+
+@pytest.fixture(params=['gzip', 'zstd'])
+def encoding(request):
+    if request.param == 'zstd':
+        pytest.importorskip('zstandard')
+    return request.param
+
+
+def pointing_bodies(server):
+    return sorted(body for path, _, body in server.requests
+                  if path.endswith('/pointings'))
+
+
+def test_round_trip(encoding):
+    body = json.dumps({'pointings': list(range(1000))}).encode()
+
+    assert decompress(compress(body, encoding), encoding) == body
+    assert decompress(b''.join(iter_compressed(
+        [body[:100], body[100:], b''], encoding)), encoding) == body
+
+
+def test_unknown_encoding_is_refused(make_pointings):
+    with pytest.raises(ValueError):
+        compress(b'{}', 'br')
+    with pytest.raises(ValueError):
+        make_pointings(compression='br')
+
+
+@pytest.mark.parametrize('rounded', [False, True])
+def test_mock_decodes_the_encoded_json_exactly(server, make_pointings,
+                                               encoding, rounded):
+    options = {'coord_decimals': 5, 'depth_decimals': 2} if rounded else {}
+    p = make_pointings(n=50, compression=encoding, **options)
+
+    result = submit_many([p], chunk_size=20)[0]
+
+    assert not result['failed']
+    assert pointing_bodies(server) == sorted(
+        json.dumps(payload, separators=(',', ':')).encode()
+        for _, _, payload in p.chunks(20))
+    assert server.bytes_received < sum(map(len, pointing_bodies(server)))
+    assert 0 < p.bytes_sent < p.bytes_raw
+
+
+def test_streamed_body_is_decoded_exactly(server, make_pointings, encoding):
+    p = make_pointings(n=50, compression=encoding)
+
+    p.submit_stream()
+
+    assert pointing_bodies(server) == [b''.join(p.iter_json())]
+    assert len(server.pointings) == 50
+
+
+def test_refused_compression_falls_back_to_plain(make_pointings, caplog):
+    with MockTreasureMap(encodings=()) as server:
+        p = make_pointings(n=50, compression='gzip')
+        p.BASE = server.url
+
+        result = submit_many([p], chunk_size=10, max_workers=1)[0]
+
+        assert not result['failed']
+        assert len(server.pointings) == 50
+        # The refused body is not recorded, the plain one sent instead is
+        assert pointing_bodies(server) == sorted(
+            json.dumps(payload, separators=(',', ':')).encode()
+            for _, _, payload in p.chunks(10))
+        # Only the first chunk was refused, the others went out plain
+        assert server.bytes_received > sum(map(len, pointing_bodies(server)))
+        assert server.bytes_received < 2 * sum(map(len,
+                                                   pointing_bodies(server)))
+        assert caplog.text.count('does not accept gzip') == 1
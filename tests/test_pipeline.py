@@ -0,0 +1,137 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from treasuremap import SubmissionJournal
+from treasuremap.pipeline import stream_submit
+from treasuremap.sources import FileSource, SQLSource
+
+
+def frame(n, start=0):
+    return pd.DataFrame({'ra': [10.0 + i for i in range(start, start + n)],
+                         'dec': -20.0,
+                         'time': '2019-08-16T14:10:27.0',
+                         'band': ['g', 'r'] * (n // 2) + ['g'] * (n % 2),
+                         'depth': 22.0,
+                         'depth_unit': 'ab_mag'})
+
+
+def submit(server, source, **kwargs):
+    kwargs.setdefault('instrumentid', 38)
+    return stream_submit(source, 'TEST_EVENT', api_token='TOKEN',
+                         base_url=server.url, chunk_size=7, **kwargs)
+
+
+@pytest.mark.parametrize('format', ['csv', 'parquet'])
+def test_file_source_is_read_in_batches(tmp_path, server, format):
+    path = str(tmp_path / 'pointings.{}'.format(format))
+    if format == 'csv':
+        frame(50).to_csv(path, index=False)
+    else:
+        frame(50).to_parquet(path, index=False)
+
+    source = FileSource(path, batch_size=20, instrumentid=38)
+    assert [len(batch) for batch in source] == [20, 20, 10]
+
+    totals = submit(server, source)
+
+    assert totals['batches'] == 3
+    assert totals['pointings'] == 50
+    assert len(totals['pointing_ids']) == 50
+    assert totals['failed'] == 0
+    assert len(server.pointings) == 50
+    assert sorted(set(record['band'] for record in
+                      server.pointings.values())) == ['g', 'r']
+
+
+def test_sql_source(server):
+    def connect():
+        conn = sqlite3.connect(':memory:', check_same_thread=False)
+        frame(30).to_sql('pointings', conn, index=False)
+        return conn
+
+    source = SQLSource(connect, "select * from pointings", batch_size=8,
+                       instrumentid=38)
+    totals = submit(server, source)
+
+    assert totals['batches'] == 4
+    assert len(totals['pointing_ids']) == 30
+
+
+def test_any_iterable_of_frames(server):
+    totals = submit(server, (frame(10, start) for start in (0, 10, 20)),
+                    status='planned')
+
+    assert totals['pointings'] == 30
+    assert set(record['status'] for record in
+               server.pointings.values()) == {'planned'}
+
+
+def test_empty_batches_are_counted_and_skipped(server):
+    totals = submit(server, [frame(0), frame(4)])
+
+    assert totals['batches'] == 2
+    assert len(totals['pointing_ids']) == 4
+    assert len(server.requests) == 2
+
+
+def test_source_errors_reach_the_caller(server):
+    def broken():
+        yield frame(4)
+        raise RuntimeError("database went away")
+
+    with pytest.raises(RuntimeError, match="database went away"):
+        submit(server, broken())
+
+
+def test_reader_stops_when_the_upload_fails(server):
+    read = []
+
+    def endless():
+        for start in range(0, 10000, 10):
+            read.append(start)
+            yield frame(10, start)
+
+    # Pointings refuse the status when the first batch is taken
+    with pytest.raises(AssertionError):
+        submit(server, endless(), status='unknown', queue_size=2)
+
+    # The reader blocked on the full queue and gave up
+    assert len(read) <= 4
+
+
+def test_journal_resumes_a_stream(tmp_path, server):
+    journal = SubmissionJournal(str(tmp_path / 'stream.journal'))
+    server.error_rate = 0.5
+    server.error_status = 500
+    first = submit(server, [frame(28)], journal=journal)
+    assert first['failed'] > 0
+
+    server.error_rate = 0.0
+    second = submit(server, [frame(28)], journal=journal)
+
+    assert second['resumed'] == 28 - first['failed']
+    assert second['failed'] == 0
+    assert len(server.pointings) == 28
+
+
+def test_failed_counts_only_the_pointings_sent(tmp_path, server):
+    journal = SubmissionJournal(str(tmp_path / 'stream.journal'))
+    rows = frame(28).assign(band='g')
+    submit(server, [rows.iloc[::2]], journal=journal)
+
+    # Every chunk now fails, and spans rows the journal skipped
+    server.error_status = 400
+    server.error_rate = 1.0
+    totals = submit(server, [rows], journal=journal)
+
+    assert totals['resumed'] == 14
+    assert totals['failed'] == 14
+
+
+def test_arguments_are_checked(server):
+    with pytest.raises(ValueError):
+        submit(server, [frame(2)], instrumentid=None)
+    with pytest.raises(ValueError):
+        submit(server, [frame(2)], queue_size=0)
@@ -0,0 +1,136 @@
+import json
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import treasue_map_query as query
+from treasuremap import decam, pipeline
+
+
+def row(expnum, ra, night='20190815'):
+    return ('g', night, '{:10.6f}'.format(ra), '-25.00000', '03:00:00', 90.0,
+            ' 23.40', '1234567', expnum)
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    '''
+    SQLite file standing in for the DECam database, with the pointing
+    query swapped for one SQLite understands
+    '''
+
+    path = str(tmp_path / 'decam.db')
+    conn = sqlite3.connect(path)
+    conn.execute("create table pointings (filter, night, ra, dec, time, "
+                 "sumexptime, depth, hex, expnum)")
+    conn.commit()
+    conn.close()
+
+    def build_query(propid, start, end, since=None):
+        where = '' if since is None else ' where expnum > {}'.format(since)
+        return "select * from pointings{} order by night".format(where)
+
+    def connect():
+        return sqlite3.connect(path, check_same_thread=False)
+
+    monkeypatch.setattr(query, 'build_query', build_query)
+    monkeypatch.setattr(query, 'connect', connect)
+    monkeypatch.setattr(decam, 'build_query', build_query)
+    monkeypatch.setattr(decam, 'connect', connect)
+
+    def add(rows):
+        conn = connect()
+        conn.executemany("insert into pointings values "
+                         "(?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.commit()
+        conn.close()
+
+    return add
+
+
+def run(tmp_path, *args):
+    query.main(['--start', '20190813', '--end', '20190905', '--propid', 'P',
+                '--incremental', '--state', str(tmp_path / 'state.json')] +
+               list(args))
+    return query.load_watermark(str(tmp_path / 'state.json'), 'P')
+
+
+def test_watermark_round_trip(tmp_path):
+    path = str(tmp_path / 'state.json')
+    assert query.load_watermark(path, 'P') is None
+
+    query.save_watermark(path, 'P', 1005, '20190815')
+    query.save_watermark(path, 'Q', 7, '20190816')
+
+    assert query.load_watermark(path, 'P') == {'expnum': 1005,
+                                               'night': '20190815'}
+    assert query.load_watermark(path, 'Q')['expnum'] == 7
+    assert os.listdir(str(tmp_path)) == ['state.json']
+
+
+def test_track_watermark_keeps_the_newest_exposure():
+    batches = [pd.DataFrame({'expnum': [3, 9], 'night': ['a', 'b']}),
+               pd.DataFrame({'expnum': [], 'night': []}),
+               pd.DataFrame({'expnum': [5], 'night': ['c']})]
+    mark = {'expnum': None}
+
+    assert list(query.track_watermark(batches, mark)) == batches
+    assert mark == {'expnum': 9, 'night': 'b'}
+
+
+def test_query_only_regroups_touched_groups():
+    full = decam.build_query('P', '20190813', '20190905')
+    since = decam.build_query('P', '20190813', '20190905', since=1005)
+
+    assert 'expnum > ' not in full
+    assert 'where expnum > 1005' in since
+    assert 'having max(expnum) > 1005' in since
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_incremental_export_only_writes_new_exposures(tmp_path, database,
+                                                      stream):
+    outfile = str(tmp_path / 'out.csv')
+    extra = ['--outfile', outfile] + (['--stream'] if stream else [])
+
+    database([row(1000 + i, 10.0 + i) for i in range(5)])
+    assert run(tmp_path, *extra) == {'expnum': 1004, 'night': '20190815'}
+    assert len(pd.read_csv(outfile)) == 5
+
+    database([row(1010 + i, 20.0 + i, '20190816') for i in range(3)])
+    assert run(tmp_path, *extra) == {'expnum': 1012, 'night': '20190816'}
+    assert list(pd.read_csv(outfile)['ra']) == [20.0, 21.0, 22.0]
+
+    # Nothing new leaves an empty file and the watermark where it was
+    assert run(tmp_path, *extra)['expnum'] == 1012
+    assert len(pd.read_csv(outfile)) == 0
+
+
+def test_failed_submissions_are_retried_without_duplicates(
+        tmp_path, database, server, monkeypatch):
+    stream_submit = pipeline.stream_submit
+    monkeypatch.setattr(pipeline, 'stream_submit', lambda *args, **kwargs:
+                        stream_submit(*args, base_url=server.url,
+                                      chunk_size=5, **kwargs))
+    database([row(1000 + i, 10.0 + i) for i in range(40)])
+    extra = ['--stream', '--submit', '--graceid', 'S1', '--journal',
+             str(tmp_path / 'S1.journal')]
+
+    server.error_rate = 0.5
+    server.error_status = 500
+    assert run(tmp_path, *extra) is None
+    assert 0 < len(server.pointings) < 40
+    run(tmp_path, *extra)
+
+    # The watermark only moves once every pointing is in
+    server.error_rate = 0.0
+    assert run(tmp_path, *extra) == {'expnum': 1039, 'night': '20190815'}
+    positions = [record['position'] for record in server.pointings.values()]
+    assert len(positions) == 40
+    assert len(set(positions)) == 40
+
+    with open(str(tmp_path / 'S1.journal')) as f:
+        keys = [key for line in f for key in json.loads(line)['keys']]
+    assert len(keys) == 40
@@ -0,0 +1,181 @@
+import email.utils
+import json
+import socket
+import time
+
+import pytest
+
+from treasuremap import SubmissionJournal, TreasureMapClient
+from treasuremap.exceptions import TreasureMapError
+from treasuremap.journal import accepted_keys
+from treasuremap.retry import RetryPolicy, parse_retry_after
+from treasuremap.treasuremap import submit_many
+
+
+def fail_first(server, n):
+    '''
+    Make the mock answer the next `n` requests with its error status
+    '''
+
+    answers = [True] * n
+    server.fail = lambda: bool(answers) and answers.pop()
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('2.5') == 2.5
+    assert parse_retry_after('-3') == 0.0
+    assert parse_retry_after('soon') is None
+
+    later = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 < parse_retry_after(later) <= 60
+
+
+def test_503_is_retried_after_retry_after(server, make_pointings):
+    server.retry_after = 0.3
+    fail_first(server, 1)
+    p = make_pointings(retry=RetryPolicy(retries=2, backoff=0.0))
+    p.build_json()
+
+    start = time.monotonic()
+    response = p.submit()
+
+    assert time.monotonic() - start >= 0.3
+    assert len(response['pointing_ids']) == 10
+    assert len(server.requests) == 2
+    assert len(server.pointings) == 10
+
+
+def test_retry_after_is_capped(server, make_pointings):
+    server.retry_after = 60
+    fail_first(server, 1)
+    p = make_pointings(retry=RetryPolicy(retries=2, max_backoff=0.1))
+    p.build_json()
+
+    start = time.monotonic()
+    p.submit()
+
+    assert time.monotonic() - start < 5
+
+
+def test_retries_run_out(server, make_pointings):
+    server.error_rate = 1.0
+    p = make_pointings(retry=RetryPolicy(retries=2, backoff=0.0))
+    p.build_json()
+
+    with pytest.raises(TreasureMapError) as error:
+        p.submit()
+
+    assert error.value.response.status_code == 503
+    assert not error.value.uncertain
+    assert len(server.requests) == 3
+
+
+def test_stored_post_answered_500_is_uncertain_and_not_retried(
+        server, make_pointings):
+    server.late_error_rate = 1.0
+    p = make_pointings()
+    p.build_json()
+
+    with pytest.raises(TreasureMapError) as error:
+        p.submit()
+
+    assert error.value.uncertain
+    assert len(server.requests) == 1
+    assert len(server.pointings) == 10
+
+
+def test_get_answered_500_is_retried(server):
+    server.error_status = 500
+    fail_first(server, 2)
+    client = TreasureMapClient(api_token='TOKEN', base_url=server.url,
+                               retry=RetryPolicy(retries=2, backoff=0.0))
+
+    assert client.pointings('TEST_EVENT') == []
+    assert len(server.requests) == 3
+
+
+def test_post_timeout_is_uncertain_and_not_retried(server, make_pointings):
+    server.latency = 0.5
+    p = make_pointings(timeout=(1.0, 0.1))
+    p.build_json()
+
+    with pytest.raises(TreasureMapError) as error:
+        p.submit()
+
+    assert error.value.uncertain
+    assert len(server.requests) == 1
+
+
+def test_refused_connection_is_retried_and_not_uncertain(make_pointings):
+    # A port nothing listens on
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    p = make_pointings()
+    p.BASE = 'http://127.0.0.1:{}/api/v0'.format(port)
+    p.build_json()
+
+    with pytest.raises(TreasureMapError) as error:
+        p.submit()
+
+    assert not error.value.uncertain
+    assert 'after 3 attempts' in str(error.value)
+
+
+def test_rerun_with_the_journal_skips_acknowledged_rows(tmp_path, server,
+                                                       make_pointings):
+    journal = SubmissionJournal(str(tmp_path / 'submit.journal'))
+    server.error_status = 500
+    fail_first(server, 1)
+    first = submit_many([make_pointings(n=20)], chunk_size=5, max_workers=1,
+                        journal=journal)[0]
+
+    assert len(first['failed']) == 1
+    assert len(first['pointing_ids']) == 15
+    assert len(SubmissionJournal(journal.path)) == 15
+
+    second = submit_many([make_pointings(n=20)], chunk_size=5,
+                         journal=SubmissionJournal(journal.path))[0]
+
+    assert second['resumed'] == 15
+    assert second['pointing_ids'][:15] == first['pointing_ids']
+    assert len(second['pointing_ids']) == 20
+    assert len(server.pointings) == 20
+    assert len(server.requests) == 5
+    assert server.requests[-1][2].count(b'"position"') == 5
+
+
+def test_rejected_pointings_are_not_journaled(tmp_path, server,
+                                              make_pointings):
+    journal = SubmissionJournal(str(tmp_path / 'submit.journal'))
+    p = make_pointings(n=4)
+    # The API rejects a pointing without a time in ERRORS
+    p.add_pointing(30.0, -20.0, None, 22.0, 'ab_mag')
+
+    result = submit_many([p], journal=journal)[0]
+
+    assert len(result['pointing_ids']) == 4
+    assert len(result['ERRORS']) == 1
+    assert len(journal) == 4
+
+    again = submit_many([p], journal=journal)[0]
+
+    assert again['resumed'] == 4
+    assert len(again['ERRORS']) == 1
+    assert b'"time":null' in server.requests[-1][2]
+    assert server.requests[-1][2].count(b'"position"') == 1
+
+
+def test_accepted_keys():
+    pointing = {'position': 'POINT(1 2)', 'time': None}
+    keys = ['a', SubmissionJournal.key('E', pointing), 'c']
+
+    assert accepted_keys('E', keys, {'pointing_ids': [1, 2, 3]}) == keys
+    assert accepted_keys('E', keys, {
+        'pointing_ids': [1, 3],
+        'ERRORS': [['Object: ' + json.dumps(pointing), ['Invalid time']]],
+    }) == ['a', 'c']
+    # IDs the ERRORS do not account for cannot be matched to keys
+    assert accepted_keys('E', keys, {'pointing_ids': [1, 3]}) is None
+    assert accepted_keys('E', keys, {'pointing_ids': [1, 3],
+                                     'ERRORS': ['Something broke']}) is None
@@ -0,0 +1,58 @@
+import requests
+
+from treasuremap import session
+from treasuremap.treasuremap import submit_many
+
+
+def test_pointings_share_one_session(make_pointings):
+    first = make_pointings(band='g')
+    second = make_pointings(band='r')
+
+    assert first.session is second.session
+    assert first.session is session.get_session()
+
+
+def test_requests_reuse_a_kept_alive_connection(server, make_pointings):
+    for band in 'griz':
+        p = make_pointings(band=band)
+        p.build_json()
+        assert len(p.submit()["pointing_ids"]) == 10
+
+    assert len(server.requests) == 4
+    assert server.connections == 1
+
+
+def test_concurrent_chunks_stay_within_the_pool(server, make_pointings):
+    p = make_pointings(n=100)
+    result = submit_many([p], chunk_size=10, max_workers=4)[0]
+
+    assert len(result["pointing_ids"]) == 100
+    assert len(server.requests) == 10
+    assert server.connections <= 4
+
+
+def test_own_session_is_used_as_is(server, make_pointings):
+    own = requests.Session()
+    p = make_pointings(session=own)
+    p.build_json()
+    p.submit()
+
+    assert p.session is own
+    assert session._session is None
+    own.close()
+
+
+def test_configure_session_replaces_and_closes_the_old_one():
+    old = session.get_session()
+    new = session.configure_session(pool_maxsize=2)
+
+    assert session.get_session() is new
+    assert new is not old
+    assert new.get_adapter('http://example.org')._pool_maxsize == 2
+
+
+def test_close_session_drops_the_shared_session():
+    old = session.get_session()
+    session.close_session()
+
+    assert session.get_session() is not old
@@ -0,0 +1,192 @@
+import sqlite3
+
+import pytest
+
+from treasuremap import decam
+from treasuremap.sources import DECamSource, SQLSource, Source, iter_query
+
+
+# Query rows as decam.QUERY returns them
+ROWS = [('g', '20190815', ' 12.500000', '-25.00000', '03:00:00', 90.0,
+         ' 23.40', '1234567', 1000 + i) for i in range(25)]
+ROWS[7] = ROWS[7][:-1] + (2000,)
+
+
+class NamedCursor:
+    '''
+    Stand-in for a psycopg2 server-side cursor over SQLite
+
+    Only the parts `iter_query` uses: the cursor name and `itersize`,
+    `execute`, `fetchmany`, `description` and `close`. The PostgreSQL
+    query is recorded and `sql` is run instead.
+    '''
+
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.name = name
+        self.itersize = 2000
+        self.closed = False
+        self._cursor = conn.db.cursor()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, query):
+        self.conn.queries.append(query)
+        self._cursor.execute(self.conn.sql)
+
+    def fetchmany(self, size):
+        self.conn.fetches.append(size)
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self.closed = True
+        self._cursor.close()
+
+
+class PostgresStandIn:
+    '''
+    psycopg2-like connection whose `cursor(name=...)` gives a
+    `NamedCursor`
+    '''
+
+    def __init__(self, sql="select * from pointings order by expnum"):
+        self.db = sqlite3.connect(':memory:', check_same_thread=False)
+        self.db.execute("create table pointings (filter, night, ra, dec, "
+                        "time, sumexptime, depth, hex, expnum)")
+        self.db.executemany("insert into pointings values "
+                            "(?, ?, ?, ?, ?, ?, ?, ?, ?)", ROWS)
+        self.sql = sql
+        self.queries = []
+        self.fetches = []
+        self.cursors = []
+        self.closed = False
+
+    def cursor(self, name=None):
+        cursor = NamedCursor(self, name)
+        self.cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        self.closed = True
+        self.db.close()
+
+
+def test_source_needs_batches():
+    with pytest.raises(TypeError):
+        Source()
+
+    class Empty(Source):
+        def batches(self):
+            return iter(())
+
+    assert list(Empty()) == []
+
+
+def test_named_cursor_is_read_in_batches():
+    conn = PostgresStandIn()
+    batches = list(iter_query(conn, "select 1", batch_size=10))
+
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert list(batches[0].columns) == ['filter', 'night', 'ra', 'dec',
+                                        'time', 'sumexptime', 'depth', 'hex',
+                                        'expnum']
+    [cursor] = conn.cursors
+    assert cursor.name == 'tm_source'
+    assert cursor.itersize == 10
+    assert cursor.closed
+    assert set(conn.fetches) == {10}
+
+
+def test_plain_sqlite_falls_back_to_an_unnamed_cursor():
+    def connect():
+        conn = sqlite3.connect(':memory:')
+        conn.execute("create table t (ra, dec)")
+        conn.executemany("insert into t values (?, ?)",
+                         [(i, -i) for i in range(7)])
+        return conn
+
+    source = SQLSource(connect, "select ra, dec from t", batch_size=3)
+    assert [len(batch) for batch in source] == [3, 3, 1]
+
+
+def test_sql_source_closes_its_connection():
+    conns = []
+
+    def connect():
+        conns.append(PostgresStandIn())
+        return conns[-1]
+
+    source = SQLSource(connect, "select 1", batch_size=10)
+    batches = source.batches()
+    next(batches)
+    batches.close()
+
+    assert conns[0].closed
+    assert conns[0].cursors[0].closed
+
+
+def test_decam_source_keeps_the_newest_exposure():
+    conns = []
+
+    def connect():
+        conns.append(PostgresStandIn())
+        return conns[-1]
+
+    source = DECamSource('2019B-0372', '20190813', '20190905',
+                         batch_size=10, connect=connect)
+    assert source.watermark == {'expnum': None, 'night': None}
+
+    batches = list(source)
+
+    assert sum(len(batch) for batch in batches) == len(ROWS)
+    assert list(batches[0].columns) == decam.COLUMNS
+    assert batches[0]['time'][0] == '2019-08-15T03:00:00.0'
+    assert source.watermark == {'expnum': 2000, 'night': '20190815'}
+    assert "propid = '2019B-0372'" in conns[0].queries[0]
+    assert "max(expnum) >" not in conns[0].queries[0]
+
+
+def test_decam_source_only_reads_groups_after_since():
+    conns = []
+
+    def connect():
+        conns.append(PostgresStandIn(
+            "select * from pointings where expnum > 1020"))
+        return conns[-1]
+
+    source = DECamSource('2019B-0372', '20190813', '20190905', since=1020,
+                         connect=connect)
+    batches = list(source)
+
+    query = conns[0].queries[0]
+    assert "where expnum > 1020" in query
+    assert "having max(expnum) > 1020" in query
+    assert sum(len(batch) for batch in batches) == 5
+    assert source.watermark['expnum'] == 2000
+
+
+def test_decam_source_without_new_rows_keeps_no_watermark():
+    source = DECamSource('2019B-0372', '20190813', '20190905', since=5000,
+                         connect=lambda: PostgresStandIn(
+                             "select * from pointings where expnum > 5000"))
+
+    assert list(source) == []
+    assert source.watermark == {'expnum': None, 'night': None}
+
+
+def test_decam_source_needs_psycopg2_by_default(monkeypatch):
+    import builtins
+
+    real_import = builtins.__import__
+
+    def no_psycopg2(name, *args, **kwargs):
+        if name == 'psycopg2':
+            raise ImportError("No module named 'psycopg2'")
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, '__import__', no_psycopg2)
+    source = DECamSource('2019B-0372', '20190813', '20190905')
+    with pytest.raises(ImportError):
+        list(source)
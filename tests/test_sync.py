@@ -0,0 +1,163 @@
+import pytest
+
+from treasuremap.sync import PlanSync
+
+
+@pytest.fixture
+def state(tmp_path):
+    return str(tmp_path / 'plan.jsonl')
+
+
+def planned(make_pointings, ras, band='r'):
+    p = make_pointings(n=0, band=band, status='planned')
+    for ra in ras:
+        p.add_pointing(ra, -20.0, '2019-08-16T14:10:27.0', 22.0, 'ab_mag')
+    return p
+
+
+def statuses(server):
+    return sorted(record['status'] for record in server.pointings.values())
+
+
+def test_first_sync_submits_the_whole_plan(server, make_pointings, state):
+    plan = PlanSync(state, 'TEST_EVENT', 38)
+    p = planned(make_pointings, range(10))
+
+    assert plan.diff([p]) == (10, [], 0)
+    result = plan.sync([p], chunk_size=4)
+
+    assert result['submitted'] == 10
+    assert result['cancelled'] == 0
+    assert len(plan) == 10
+    assert statuses(server) == ['planned'] * 10
+
+
+def test_unchanged_plan_sends_nothing(server, make_pointings, state):
+    plan = PlanSync(state, 'TEST_EVENT', 38)
+    plan.sync([planned(make_pointings, range(10))])
+    requests = len(server.requests)
+
+    p = planned(make_pointings, range(10))
+    assert plan.diff([p]) == (0, [], 10)
+    result = plan.sync([p])
+
+    assert (result['submitted'], result['cancelled'],
+            result['unchanged']) == (0, 0, 10)
+    assert len(server.requests) == requests
+
+
+def test_changed_plan_only_sends_the_difference(server, make_pointings,
+                                                state):
+    plan = PlanSync(state, 'TEST_EVENT', 38)
+    first = plan.sync([planned(make_pointings, range(10))])
+    dropped = first['pointing_ids'][:3]
+
+    p = planned(make_pointings, list(range(3, 10)) + [50, 51])
+    submit, cancel, unchanged = plan.diff([p])
+    assert (submit, sorted(cancel), unchanged) == (2, sorted(dropped), 7)
+
+    result = plan.sync([p])
+
+    assert result['submitted'] == 2
+    assert sorted(result['cancelled_ids']) == sorted(dropped)
+    assert statuses(server) == ['cancelled'] * 3 + ['planned'] * 9
+    for pointing_id in dropped:
+        assert server.pointings[pointing_id]['status'] == 'cancelled'
+
+
+def test_duplicates_in_a_plan_count_once(server, make_pointings, state):
+    plan = PlanSync(state, 'TEST_EVENT', 38)
+    p = planned(make_pointings, [1, 2, 2, 3, 3, 3])
+
+    assert plan.diff([p]) == (3, [], 0)
+    assert plan.sync([p])['submitted'] == 3
+    assert len(server.pointings) == 3
+
+
+def test_bands_are_planned_separately(server, make_pointings, state):
+    plan = PlanSync(state, 'TEST_EVENT', 38)
+    plan.sync([planned(make_pointings, range(4), 'g'),
+               planned(make_pointings, range(4), 'r')])
+
+    r_ids = plan.pointing_ids(plan.plan_keys(
+        [planned(make_pointings, range(4), 'r')])[0])
+
+    assert len(plan) == 8
+    assert len(r_ids) == 4
+    assert plan.diff([planned(make_pointings, range(4), 'g')]) == (
+        0, r_ids, 4)
+
+
+def test_state_is_reloaded(server, make_pointings, state):
+    first = PlanSync(state, 'TEST_EVENT', 38)
+    first.sync([planned(make_pointings, range(5))])
+    first.sync([planned(make_pointings, range(2))])
+
+    again = PlanSync(state, 'TEST_EVENT', 38)
+
+    assert len(again) == 2
+    assert again.diff([planned(make_pointings, range(2))]) == (0, [], 2)
+
+
+def test_state_of_another_event_is_refused(make_pointings, state):
+    PlanSync(state, 'TEST_EVENT', 38)
+
+    with pytest.raises(ValueError):
+        PlanSync(state, 'OTHER_EVENT', 38)
+
+
+def test_plan_must_match_event_and_status(make_pointings, state):
+    plan = PlanSync(state, 'TEST_EVENT', 38)
+
+    with pytest.raises(ValueError):
+        plan.diff([make_pointings(n=2, status='planned',
+                                  graceid='OTHER_EVENT')])
+    with pytest.raises(ValueError):
+        plan.diff([make_pointings(n=2, status='completed')])
+
+
+def test_unmatched_ids_are_cancelled_next_time(server, make_pointings,
+                                               state):
+    plan = PlanSync(state, 'TEST_EVENT', 38)
+    plan.record('TEST_EVENT', ['a', 'b'], {'pointing_ids': [101]})
+
+    assert len(plan) == 0
+    assert plan.diff([planned(make_pointings, range(2))]) == (2, [101], 0)
+
+
+def test_rejected_pointings_leave_the_rest_mapped(server, make_pointings,
+                                                  state):
+    plan = PlanSync(state, 'TEST_EVENT', 38)
+
+    def plan_with_rejected():
+        p = planned(make_pointings, range(3))
+        # The API rejects a pointing without a time in ERRORS
+        p.add_pointing(30.0, -20.0, None, 22.0, 'ab_mag')
+        return p
+
+    result = plan.sync([plan_with_rejected()])
+
+    assert result['submitted'] == 3
+    assert len(plan) == 3
+    assert plan.diff([plan_with_rejected()]) == (1, [], 3)
+
+    result = plan.sync([plan_with_rejected()])
+
+    assert (result['submitted'], result['cancelled']) == (0, 0)
+    assert statuses(server) == ['planned'] * 3
+
+
+def test_failed_chunks_are_sent_on_the_next_sync(server, make_pointings,
+                                                 state):
+    plan = PlanSync(state, 'TEST_EVENT', 38)
+    server.error_rate = 1.0
+    result = plan.sync([planned(make_pointings, range(6))], chunk_size=3)
+
+    assert result['submitted'] == 0
+    assert len(result['failed']) == 2
+
+    server.error_rate = 0.0
+    result = plan.sync([planned(make_pointings, range(6))], chunk_size=3)
+
+    assert result['submitted'] == 6
+    assert len(server.pointings) == 6
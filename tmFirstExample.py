@@ -14,7 +14,6 @@ from astropy.coordinates import SkyCoord
 import numpy as np
 import json
 
-import datetime as dt
 
 
 
@@ -47,18 +46,11 @@ dec = S200224_coord.dec.deg
 # Initialise Pointings class
 S200224 = treasuremap.Pointings("planned", graceid, instrumentid, band)
 
-# Loop over each observation and add to Pointings
-for start, dur, rms in zip(obs_start, obs_length, rms_vals):
-    start_dt = dt.datetime.strptime(start, "%Y-%m-%dT%H:%M:%S")
-    dodgy_delta = dt.datetime.strptime(
-        dur, "%H:%M:%S") - dt.datetime.strptime("00:00:00", "%H:%M:%S")
-
-    time = start_dt + dodgy_delta / 2
-    time_str = dt.datetime.strftime(time, "%Y-%m-%dT%H:%M:%S.%f")[:-4]
-
-    S200224.add_pointing(
-        ra, dec, time_str, rms.to(
-            u.Jy).value * 5, depth_unit)
+# Add all observations to Pointings, timed at the middle of each exposure
+n_obs = len(obs_start)
+S200224.add_pointings(
+    np.full(n_obs, ra), np.full(n_obs, dec), obs_start,
+    rms_vals.to(u.Jy).value * 5, depth_unit, duration=obs_length)
 
 # Build the JSON and submit
 S200224.build_json()
@@ -3,98 +3,218 @@
 
 ## USAGE:
 # S190814bv: python treasue_map_query.py --outfile S190814bv_TM_pointings.csv --start 20190813 --end 20190905 --propid 2019B-0372
+# Streaming: python treasue_map_query.py --outfile S190814bv_TM_pointings.parquet --start 20190813 --end 20190905 --propid 2019B-0372 --stream
+# Straight to Treasure Map, no file in between: replace --outfile with --submit --graceid S190814bv
+#   (acknowledged pointings are kept in --journal, so a rerun only sends what failed)
+# Only new exposures since the last run: add --incremental (state kept in --state)
+# Depths computed in Python from raw exposures cached per night: add --raw-cache exposure_cache/
+#   (then e.g. --depth-model exptime, --depth-unit flux_jy or --zero-points zps.json without touching the database)
 
-import glob
+import json
 from optparse import OptionParser
+import os
 import sys
 
-import pandas as pd
-import psycopg2
-
-# Handle command-line arguments
-parser = OptionParser(__doc__)
-parser.add_option('--outfile', default=None, help="Name of file to write pointing info")
-parser.add_option('--start', default=None, help="YYYYMMDD lower time bound of observations")
-parser.add_option('--end', default=None, help="YYYYMMDD upper time bound of observations")
-parser.add_option('--propid', default=None, help="PROPID of observations")
-options, args = parser.parse_args(sys.argv[1:])
-
-if not options.outfile:
-    print("Use '--outfile' to specify where you want the pointing info written.")
-    sys.exit()
-if not options.start:
-    print("Use '--start' to specify the date to begin the query (fmt YYYYMMDD)")
-    sys.exit()
-if not options.end:
-    print("Use '--end' to specify the date to end the query (fmt YYYYMMDD)")
-    sys.exit()
-if not options.propid:
-    print("Use '--propid' to specify the PROPID of the observations")
-    sys.exit()
-
-# Write query
-query = """
-select filter,
-       night,
-       ra, 
-       dec,
-       time,
-       sum(exptime) as sumexptime, 
-       to_char(case when filter='g' then 23.4 
-                    when filter='r' then 23.1 
-                    when filter='i' then 22.5 
-                    when filter='z' then 21.8 
-                    when filter='Y' then 20.3 
-                    end + 1.25*log(sum(qc_teff*exptime)/90.), '99.99') as depth,
-       hex 
-from (select id as expnum,
-             exptime, 
-             filter,
-             to_char(date::timestamp - interval '1 DAY' ,'YYYYMMDD') as night, 
-             to_char(date::timestamp,'HH24:MI:SS') as time,
-             qc_teff,
-             to_char(ra,'09.999999') as ra, 
-             to_char(declination,'99.99999') as dec,
-             substring(object from 'x(.......)t') as hex 
-      from exposure.exposure 
-      where flavor = 'object' and 
-            propid = '{propid}' and 
-            qc_teff>0 
-      order by id) as explist 
-where cast(night as int) < {end} and 
-      cast(night as int) > {start} 
-group by night, 
-         filter, 
-         hex, 
-         ra, 
-         dec, 
-         time
-order by night; 
-""".format(propid=options.propid, start=options.start, end=options.end)
-
-# Get DECam database password
-password = glob.glob(".*.password")[0].split('.')[1]
-
-# Execute query
-conn =  psycopg2.connect(database='decam_prd',
-                           user='decam_reader',
-                           host='des61.fnal.gov',
-                           password=password,
-                           port=5443) 
-df = pd.read_sql(query, conn)
-conn.close()
-
-# Format output DataFrame
-df['instrumentid'] = 38 # DECam
-df['date'] = pd.to_datetime(df['night'].values, format='%Y%m%d')
-df['time'] = pd.to_datetime(df['time'].values, format='%H:%M:%S')
-df['time'] = df['date'].apply(lambda x: x.strftime('%Y-%m-%d')) + 'T' + df['time'].apply(lambda x: x.strftime('%H:%M:%S') + '.0')
-df['band'] = df['filter'].values
-df['status'] = 'completed'
-df['depth_unit'] = 'ab_mag'
-
-# Select columns for printing
-cols = ['ra', 'dec', 'time', 'band', 'status', 'instrumentid', 'depth', 'depth_unit']
-
-# Save to an outfile or print
-df[cols].to_csv(options.outfile, index=False)
+from treasuremap.decam import COLUMNS, RAW_QUERY, build_query, connect, format_batch
+
+
+def load_exposures(cache, propid, start, end):
+    '''Raw exposures between start and end, only querying the nights the cache lacks'''
+    def fetch(first, last):
+        import pandas as pd
+
+        conn = connect()
+        try:
+            return pd.read_sql(RAW_QUERY.format(propid=propid, start=first, end=last), conn)
+        finally:
+            conn.close()
+
+    return cache.load(propid, start, end, fetch)
+
+
+def load_watermark(path, propid):
+    '''Last exposure id and night exported for propid, or None'''
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get(propid)
+
+
+def save_watermark(path, propid, expnum, night):
+    '''Record the last exported exposure for propid, replacing the state file atomically'''
+    state = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            state = json.load(f)
+    state[propid] = {'expnum': int(expnum), 'night': str(night)}
+
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp, path)
+
+
+def track_watermark(batches, mark):
+    '''Pass batches through, keeping the highest expnum and its night in mark'''
+    for batch in batches:
+        if len(batch):
+            i = batch['expnum'].astype(int).idxmax()
+            if mark.get('expnum') is None or int(batch['expnum'][i]) > mark['expnum']:
+                mark['expnum'] = int(batch['expnum'][i])
+                mark['night'] = batch['night'][i]
+        yield batch
+
+
+def write_batches(batches, outfile, format):
+    '''Write batches to a CSV or Parquet file as they arrive'''
+    import pandas as pd
+
+    writer = None
+    rows = 0
+    try:
+        for batch in batches:
+            if format == 'parquet':
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(batch, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(outfile, table.schema)
+                writer.write_table(table)
+            else:
+                batch.to_csv(outfile, index=False, mode='w' if rows == 0 else 'a', header=rows == 0)
+            rows += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if rows == 0 and format != 'parquet':
+        pd.DataFrame(columns=COLUMNS).to_csv(outfile, index=False)
+
+    return rows
+
+
+def main(argv):
+    # Handle command-line arguments
+    parser = OptionParser(__doc__)
+    parser.add_option('--outfile', default=None, help="Name of file to write pointing info")
+    parser.add_option('--start', default=None, help="YYYYMMDD lower time bound of observations")
+    parser.add_option('--end', default=None, help="YYYYMMDD upper time bound of observations")
+    parser.add_option('--propid', default=None, help="PROPID of observations")
+    parser.add_option('--stream', action='store_true', help="Read the query in batches with a server-side cursor")
+    parser.add_option('--batch-size', type='int', default=10000, help="Rows per batch with --stream")
+    parser.add_option('--format', default=None, help="Output format with --stream: csv or parquet (default: from --outfile)")
+    parser.add_option('--submit', action='store_true', help="With --stream, submit each batch to Treasure Map while the next ones are read, instead of writing --outfile")
+    parser.add_option('--graceid', default=None, help="Name of the GraceDB event, needed with --submit")
+    parser.add_option('--journal', default=None, help="Journal of pointings acknowledged with --submit, reruns only submit what it lacks (default logs/<graceid>.journal)")
+    parser.add_option('--incremental', action='store_true', help="Only export pointings that are new or changed since the last run")
+    parser.add_option('--state', default='.tm_watermark.json', help="File keeping the last exported exposure per PROPID for --incremental")
+    parser.add_option('--raw-cache', default=None, help="Directory caching raw exposures per night; depths are then computed in Python")
+    parser.add_option('--depth-model', default='teff', help="Depth model with --raw-cache: teff or exptime")
+    parser.add_option('--depth-unit', default='ab_mag', help="Depth unit with --raw-cache: ab_mag or flux_jy")
+    parser.add_option('--zero-points', default=None, help="JSON file of {instrumentid: {band: zero point}} for --raw-cache")
+    options, args = parser.parse_args(argv)
+
+    if not options.outfile and not options.submit:
+        print("Use '--outfile' to specify where you want the pointing info written.")
+        sys.exit()
+    if not options.start:
+        print("Use '--start' to specify the date to begin the query (fmt YYYYMMDD)")
+        sys.exit()
+    if not options.end:
+        print("Use '--end' to specify the date to end the query (fmt YYYYMMDD)")
+        sys.exit()
+    if not options.propid:
+        print("Use '--propid' to specify the PROPID of the observations")
+        sys.exit()
+    if options.submit and not ((options.stream or options.raw_cache) and options.graceid):
+        print("Use '--submit' together with '--stream' or '--raw-cache' and '--graceid'")
+        sys.exit()
+    if options.raw_cache and (options.stream or options.incremental):
+        print("Use '--raw-cache' without '--stream' and '--incremental'")
+        sys.exit()
+
+    since = None
+    if options.incremental:
+        watermark = load_watermark(options.state, options.propid)
+        if watermark is not None:
+            since = watermark['expnum']
+            print("Exporting exposures after {} (night {})".format(since, watermark['night']))
+
+    query = build_query(options.propid, options.start, options.end, since)
+
+    # pandas and psycopg2 are only loaded once the arguments check out
+    import pandas as pd
+
+    conn = None
+    source = None
+    mark = {'expnum': None}
+
+    try:
+        if options.raw_cache:
+            from treasuremap.depth import DepthEngine, ExposureCache, load_zero_points
+
+            zero_points = None
+            if options.zero_points:
+                zero_points = load_zero_points(options.zero_points)
+            engine = DepthEngine(zero_points, options.depth_model, options.depth_unit)
+
+            exposures = load_exposures(ExposureCache(options.raw_cache), options.propid,
+                                       options.start, options.end)
+            batches = (format_batch(batch) for batch in [engine.pointings(exposures)])
+        elif not options.stream:
+            # Execute query
+            conn = connect()
+            df = pd.read_sql(query, conn)
+            batches = (format_batch(batch) for batch in track_watermark([df], mark))
+        else:
+            # Read with a server-side cursor, keeping the newest exposure in source.watermark
+            from treasuremap.sources import DECamSource
+
+            source = DECamSource(options.propid, options.start, options.end, since, options.batch_size)
+            batches = source.batches()
+
+        if options.submit:
+            from treasuremap import SubmissionJournal
+            from treasuremap.pipeline import stream_submit
+
+            if options.journal is None:
+                options.journal = "logs/{}.journal".format(options.graceid)
+            if os.path.dirname(options.journal):
+                os.makedirs(os.path.dirname(options.journal), exist_ok=True)
+            journal = SubmissionJournal(options.journal)
+
+            # Each batch is uploaded while the next ones are read
+            totals = stream_submit(batches, options.graceid, api_token=os.getenv('TREASUREMAP_API'),
+                                   instrumentid=38, journal=journal)
+            print("Submitted {} pointings, {} already in {}, {} failed".format(
+                len(totals['pointing_ids']) - totals['resumed'], totals['resumed'], options.journal,
+                totals['failed']))
+        elif not options.stream:
+            # Save to an outfile or print
+            df = next(batches)
+            df.to_csv(options.outfile, index=False)
+            print("Wrote {} pointings to {}".format(len(df), options.outfile))
+        else:
+            format = options.format
+            if format is None:
+                format = 'parquet' if options.outfile.endswith(('.parquet', '.pq')) else 'csv'
+            rows = write_batches(batches, options.outfile, format)
+            print("Wrote {} pointings to {}".format(rows, options.outfile))
+
+        if source is not None:
+            mark.update(source.watermark)
+        if options.submit and totals['failed']:
+            # Keep the old watermark so the next run exports these exposures again;
+            # the journal holds back the ones already acknowledged
+            mark['expnum'] = None
+    finally:
+        if conn is not None:
+            conn.close()
+
+    if options.incremental and mark['expnum'] is not None:
+        save_watermark(options.state, options.propid, mark['expnum'], mark['night'])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
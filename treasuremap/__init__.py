@@ -0,0 +1,40 @@
+import importlib
+
+# Public names and the submodules they live in. They are imported on
+# first use, so `import treasuremap` does not pull in numpy, requests or
+# pandas until something needs them
+_EXPORTS = {
+    'ResponseCache': 'cache',
+    'TreasureMapClient': 'client',
+    'DedupIndex': 'dedup',
+    'DepthEngine': 'depth',
+    'TreasureMapError': 'exceptions',
+    'stream_submit': 'pipeline',
+    'SubmissionJournal': 'journal',
+    'RetryPolicy': 'retry',
+    'DECamSource': 'sources',
+    'FileSource': 'sources',
+    'SQLSource': 'sources',
+    'PlanSync': 'sync',
+    'Watcher': 'watch',
+    'Pointings': 'treasuremap',
+    'pointings_from_frame': 'treasuremap',
+    'submit_many': 'treasuremap',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(
+            "module 'treasuremap' has no attribute {!r}".format(name))
+
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,164 @@
+import asyncio
+import functools
+
+from .treasuremap import Pointings, _pending, _post_chunk, _results
+
+
+class AsyncPointings(Pointings):
+    '''
+    Pointings with coroutine versions of `post_pointings`, `submit`,
+    `submit_chunked`, `cancel` and `cancel_all`, named with an `a`
+    prefix
+
+    Payloads are built exactly as for `Pointings`. Requests go through
+    the same pooled session, run in an executor so that the event loop
+    is never blocked while a request is in flight. The synchronous
+    methods are left as they are, so an `AsyncPointings` can also be
+    passed to `submit_many`.
+
+    :param status: Observing status, either `planned` or `completed`
+    :type status: str
+    :param graceid: Event ID in GraceDB
+    :type graceid: str
+    :param instrumentid: Instrument ID
+    :type instrumentid: int
+    :param band: Observing band
+    :type band: str
+    :param executor: Executor the requests run in, defaults to the
+        event loop's default executor
+    :type executor: concurrent.futures.Executor, optional
+    :param kwargs: Other `Pointings` arguments, such as `retry`,
+        `compression` or `coord_decimals`
+    '''
+
+    def __init__(self, status, graceid, instrumentid, band, api_token=None,
+                 session=None, base_url=None, executor=None, **kwargs):
+        '''Constructor method
+        '''
+
+        super().__init__(status, graceid, instrumentid, band,
+                         api_token=api_token, session=session,
+                         base_url=base_url, **kwargs)
+        self.executor = executor
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor,
+                                          functools.partial(func, *args))
+
+    async def apost_pointings(self, payload):
+        '''
+        Post one payload to the `pointings` endpoint
+
+        :param payload: Submission payload
+        :type payload: dict
+        :return: Decoded server response
+        :rtype: dict
+        '''
+
+        return await self._run(self.post_pointings, payload)
+
+    async def asubmit(self):
+        '''
+        Submit pointings to treasuremap
+        '''
+
+        return await self.apost_pointings(self.json_data)
+
+    async def asubmit_chunked(self, chunk_size=500, max_workers=4,
+                              journal=None, processes=None):
+        '''
+        Submit pointings in chunks, posting up to `max_workers` chunks
+        at once
+
+        :param chunk_size: Maximum number of pointings per request,
+            defaults to 500
+        :type chunk_size: int, optional
+        :param max_workers: Maximum number of requests in flight,
+            defaults to 4
+        :type max_workers: int, optional
+        :param journal: Journal of acknowledged pointings to resume from
+            and record to, defaults to None
+        :type journal: SubmissionJournal, optional
+        :param processes: Encode the chunks in this many processes first,
+            defaults to None
+        :type processes: int, optional
+        :return: Merged response, see `treasuremap.submit_many`
+        :rtype: dict
+        '''
+
+        results = await submit_many_async([self], chunk_size, max_workers,
+                                          journal, processes)
+        return results[0]
+
+    async def acancel(self, ids):
+        '''
+        Cancel individual pointings
+
+        :param ids: list of treasuremap pointing IDs
+        :type ids: list
+        '''
+
+        return await self._run(self.cancel, ids)
+
+    async def acancel_all(self):
+        '''
+        Cancel all pointings for an event
+        '''
+
+        return await self._run(self.cancel_all)
+
+
+async def submit_many_async(pointings, chunk_size=500, max_workers=4,
+                            journal=None, processes=None):
+    '''
+    Submit several `AsyncPointings` in chunks with at most `max_workers`
+    requests in flight
+
+    Chunks are built, resumed from the `journal` and recorded to it as
+    in `treasuremap.submit_many`; building them runs in the default
+    executor so the event loop is not held up.
+
+    :param pointings: Pointings to submit
+    :type pointings: list of AsyncPointings
+    :param chunk_size: Maximum number of pointings per request,
+        defaults to 500
+    :type chunk_size: int, optional
+    :param max_workers: Maximum number of requests in flight,
+        defaults to 4
+    :type max_workers: int, optional
+    :param journal: Journal of acknowledged pointings, defaults to None
+    :type journal: SubmissionJournal, optional
+    :param processes: Number of processes encoding the payloads,
+        defaults to None to encode them as they are posted
+    :type processes: int, optional
+    :return: One merged response per `AsyncPointings`, see
+        `treasuremap.submit_many`
+    :rtype: list of dict
+    '''
+
+    loop = asyncio.get_running_loop()
+    pending = await loop.run_in_executor(
+        None, _pending, pointings, chunk_size, journal, processes)
+
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def post(p, start, stop, payload, keys):
+        async with semaphore:
+            return await p._run(_post_chunk, p, payload, keys, journal,
+                                stop - start)
+
+    responses = await asyncio.gather(
+        *(post(p, *chunk) for p, resumed, chunks in pending
+          for chunk in chunks),
+        return_exceptions=True)
+
+    outcomes = []
+    i = 0
+    for p, resumed, chunks in pending:
+        outcomes.append([(start, stop, response) for (start, stop, _, _),
+                         response in zip(chunks,
+                                         responses[i:i + len(chunks)])])
+        i += len(chunks)
+
+    return _results(pending, outcomes, journal)
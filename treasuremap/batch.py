@@ -0,0 +1,379 @@
+import concurrent.futures
+import csv
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from .journal import SubmissionJournal
+from .loaders import read_pointings
+from .treasuremap import (Pointings, _encode, _outcome, _pending, _post_chunk,
+                          merge_chunks, pointings_from_frame)
+
+
+# Columns every manifest job needs; `format` and `name` are optional
+FIELDS = ['graceid', 'instrumentid', 'infile', 'status']
+
+
+def read_manifest(path):
+    '''
+    Read the jobs of a batch submission
+
+    The manifest is either a CSV file with a header row or a JSON list
+    of objects, with the `FIELDS` columns and optionally `format` (see
+    `read_pointings`) and `name`. CSV lines starting with '#' are
+    skipped.
+
+    :param path: Manifest file
+    :type path: str
+    :return: Jobs, each a dict with a unique `name`
+    :rtype: list of dict
+    '''
+
+    if path.endswith('.json'):
+        with open(path) as f:
+            rows = json.load(f)
+    else:
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(
+                line for line in f
+                if line.strip() and not line.lstrip().startswith('#')))
+
+    jobs = []
+    names = set()
+    for n, row in enumerate(rows, 1):
+        missing = [field for field in FIELDS if not row.get(field)]
+        if missing:
+            raise ValueError("Job {} in {} lacks {}".format(
+                n, path, ', '.join(missing)))
+        if row['status'] not in ('planned', 'completed'):
+            raise ValueError("Job {} in {} has status {}, use planned or "
+                             "completed".format(n, path, row['status']))
+
+        job = {key: value.strip() if isinstance(value, str) else value
+               for key, value in row.items() if value not in (None, '')}
+        job['instrumentid'] = int(job['instrumentid'])
+        job.setdefault('name', '{}_{}_{}'.format(
+            job['graceid'], job['instrumentid'],
+            os.path.splitext(os.path.basename(job['infile']))[0]))
+        if job['name'] in names:
+            job['name'] = '{}_{}'.format(job['name'], n)
+        names.add(job['name'])
+        jobs.append(job)
+
+    return jobs
+
+
+def prepare_job(job, api_token=None, chunk_size=500, journal=None,
+                pointing_options=None):
+    '''
+    Read and encode the payloads of one job
+
+    Runs in a worker process, so only plain data goes in and out.
+
+    :param job: Job from `read_manifest`
+    :type job: dict
+    :param api_token: Treasuremap API token, defaults to None
+    :type api_token: str, optional
+    :param chunk_size: Maximum number of pointings per payload,
+        defaults to 500
+    :type chunk_size: int, optional
+    :param journal: Journal file whose pointings are left out,
+        defaults to None
+    :type journal: str, optional
+    :param pointing_options: Other `Pointings` arguments, such as
+        `coord_decimals`, defaults to None
+    :type pointing_options: dict, optional
+    :return: Pointing and resumed counts per band, the encoded `chunks`
+        with their `band`, `start`, `stop`, `count`, `body` and `keys`
+        (None without a journal), and `prepare_time` in seconds
+    :rtype: dict
+    '''
+
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    start_time = time.perf_counter()
+    df = read_pointings(job['infile'], job.get('format'))
+    pointings = pointings_from_frame(df, job['status'], job['graceid'],
+                                     job['instrumentid'], api_token,
+                                     **(pointing_options or {}))
+    if journal is not None:
+        journal = SubmissionJournal(journal)
+
+    bands = {}
+    chunks = []
+    for p, resumed, band_chunks in _pending(list(pointings.values()),
+                                            chunk_size, journal, None):
+        bands[p.band] = {'pointings': len(p), 'resumed': len(resumed)}
+        for start, stop, payload, keys in band_chunks:
+            chunks.append({
+                'band': p.band,
+                'start': start,
+                'stop': stop,
+                'count': len(payload['pointings']),
+                'body': _encode(payload),
+                'keys': keys
+            })
+
+    return {'bands': bands, 'chunks': chunks,
+            'prepare_time': time.perf_counter() - start_time}
+
+
+def run_batch(jobs, api_token=None, processes=None, max_workers=8,
+              chunk_size=500, journal_dir=None, base_url=None, session=None,
+              submit=True, pointing_options=None):
+    '''
+    Run many submission jobs through a process pool and a thread pool
+
+    Jobs are read and encoded in up to `processes` worker processes.
+    As each job is ready its payloads are queued on one thread pool of
+    `max_workers` that posts them, so encoding of later jobs overlaps
+    with the uploads of earlier ones. A job that fails does not stop
+    the others. Each job logs to `treasuremap.batch.<name>`.
+
+    :param jobs: Jobs from `read_manifest`
+    :type jobs: list of dict
+    :param api_token: Treasuremap API token, defaults to None
+    :type api_token: str, optional
+    :param processes: Number of worker processes, defaults to the
+        number of CPUs
+    :type processes: int, optional
+    :param max_workers: Maximum number of requests in flight,
+        defaults to 8
+    :type max_workers: int, optional
+    :param chunk_size: Maximum number of pointings per request,
+        defaults to 500
+    :type chunk_size: int, optional
+    :param journal_dir: Directory of per-event journals,
+        `<graceid>.journal`, defaults to None for no journals
+    :type journal_dir: str, optional
+    :param base_url: API base URL, defaults to the treasuremap.space API
+    :type base_url: str, optional
+    :param session: HTTP session, defaults to the shared one
+    :type session: requests.Session, optional
+    :param submit: Post the payloads, defaults to True; if False the
+        jobs are only prepared
+    :type submit: bool, optional
+    :param pointing_options: Other `Pointings` arguments, such as
+        `compression` or `coord_decimals`, defaults to None
+    :type pointing_options: dict, optional
+    :return: Summary, see `summarise`
+    :rtype: dict
+    '''
+
+    start_time = time.perf_counter()
+    journals = {}
+    results = {job['name']: _new_result(job) for job in jobs}
+    posts = []
+
+    def journal_path(job):
+        if journal_dir is None:
+            return None
+        return os.path.join(journal_dir, '{}.journal'.format(job['graceid']))
+
+    with concurrent.futures.ProcessPoolExecutor(processes) as procs, \
+            concurrent.futures.ThreadPoolExecutor(max_workers) as threads:
+        prepared = {
+            procs.submit(prepare_job, job, api_token, chunk_size,
+                         journal_path(job), pointing_options): job
+            for job in jobs
+        }
+
+        for future in concurrent.futures.as_completed(prepared):
+            job = prepared[future]
+            logger = job_logger(job)
+            result = results[job['name']]
+
+            try:
+                work = future.result()
+            except Exception as e:
+                logger.exception("Could not prepare {}".format(job['infile']))
+                result['error'] = repr(e)
+                continue
+
+            result['prepare_time'] = work['prepare_time']
+            result['bands'] = work['bands']
+            result['pointings'] = sum(b['pointings']
+                                      for b in work['bands'].values())
+            result['resumed'] = sum(b['resumed']
+                                    for b in work['bands'].values())
+            logger.info("Prepared {} pointings in {} requests in {:.2f} s, "
+                        "{} already acknowledged".format(
+                            result['pointings'], len(work['chunks']),
+                            work['prepare_time'], result['resumed']))
+
+            if not submit:
+                continue
+
+            path = journal_path(job)
+            journal = None
+            if path is not None:
+                if path not in journals:
+                    journals[path] = SubmissionJournal(path)
+                journal = journals[path]
+
+            clients = {}
+            for chunk in work['chunks']:
+                band = chunk['band']
+                if band not in clients:
+                    clients[band] = Pointings(
+                        job['status'], job['graceid'], job['instrumentid'],
+                        band, api_token=api_token, session=session,
+                        base_url=base_url, **(pointing_options or {}))
+                    clients[band].logger = logger
+                posts.append((job, chunk, threads.submit(
+                    _timed_post, clients[band], chunk, journal)))
+
+    for job, chunk, future in posts:
+        results[job['name']].setdefault('outcomes', []).append(
+            (chunk, _outcome(future)))
+
+    for job in jobs:
+        _finish(job, results[job['name']], start_time)
+
+    return summarise([results[job['name']] for job in jobs],
+                     time.perf_counter() - start_time)
+
+
+def job_logger(job):
+    '''
+    Logger of one batch job
+
+    :param job: Job from `read_manifest`
+    :type job: dict
+    :return: Logger named `treasuremap.batch.<name>`
+    :rtype: logging.Logger
+    '''
+
+    return logging.getLogger('treasuremap.batch.{}'.format(job['name']))
+
+
+def _new_result(job):
+    return {'name': job['name'], 'graceid': job['graceid'],
+            'instrumentid': job['instrumentid'], 'infile': job['infile'],
+            'status': job['status'], 'pointings': 0, 'submitted': 0,
+            'resumed': 0, 'failed': 0, 'requests': 0, 'prepare_time': 0.0,
+            'finish_time': 0.0, 'latencies': [], 'pointing_ids': {},
+            'error': None}
+
+
+def _timed_post(p, chunk, journal):
+    start = time.perf_counter()
+    try:
+        return _post_chunk(p, chunk['body'], chunk['keys'], journal,
+                           chunk['count'])
+    finally:
+        chunk['latency'] = time.perf_counter() - start
+        chunk['done'] = time.perf_counter()
+
+
+def _finish(job, result, start_time):
+    '''
+    Merge the responses of a job per band and log the outcome
+    '''
+
+    logger = job_logger(job)
+    outcomes = result.pop('outcomes', [])
+    if not outcomes:
+        return
+
+    by_band = {}
+    for chunk, response in outcomes:
+        by_band.setdefault(chunk['band'], []).append((chunk, response))
+        result['latencies'].append(chunk['latency'])
+        result['finish_time'] = max(result['finish_time'],
+                                    chunk['done'] - start_time)
+    result['requests'] = len(outcomes)
+
+    for band, band_outcomes in by_band.items():
+        client = Pointings(job['status'], job['graceid'],
+                           job['instrumentid'], band)
+        client.logger = logger
+        merged = merge_chunks(client, [(chunk['start'], chunk['stop'],
+                                        response)
+                                       for chunk, response in band_outcomes])
+        failed = sum(band_outcomes[f['chunk']][0]['count']
+                     for f in merged['failed'])
+        result['pointing_ids'][band] = merged['pointing_ids']
+        result['submitted'] += len(merged['pointing_ids'])
+        result['failed'] += failed
+        logger.info("{} band: {} accepted, {} failed".format(
+            band, len(merged['pointing_ids']), failed))
+
+
+def summarise(results, elapsed):
+    '''
+    Throughput and latency summary of a batch
+
+    :param results: Per-job results
+    :type results: list of dict
+    :param elapsed: Wall time of the batch in seconds
+    :type elapsed: float
+    :return: The `jobs`, total `pointings`, `submitted`, `failed` and
+        `requests`, `elapsed` seconds, `throughput` in pointings per
+        second and request `latency` percentiles in seconds
+    :rtype: dict
+    '''
+
+    latencies = [t for result in results for t in result['latencies']]
+    submitted = sum(result['submitted'] for result in results)
+
+    for result in results:
+        result['latency'] = _percentiles(result.pop('latencies'))
+
+    return {
+        'jobs': results,
+        'pointings': sum(result['pointings'] for result in results),
+        'submitted': submitted,
+        'failed': sum(result['failed'] for result in results),
+        'errors': sum(result['error'] is not None for result in results),
+        'requests': len(latencies),
+        'elapsed': elapsed,
+        'throughput': submitted / elapsed if elapsed > 0 else 0.0,
+        'latency': _percentiles(latencies)
+    }
+
+
+def _percentiles(latencies):
+    if not latencies:
+        return {'p50': None, 'p95': None, 'max': None}
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return {'p50': float(p50), 'p95': float(p95),
+            'max': float(max(latencies))}
+
+
+def format_summary(summary):
+    '''
+    Render a batch summary as a text table
+
+    :param summary: Summary from `run_batch`
+    :type summary: dict
+    :return: Table
+    :rtype: str
+    '''
+
+    def ms(value):
+        return '-' if value is None else '{:.0f}'.format(1000 * value)
+
+    lines = ['{:<40} {:>9} {:>9} {:>7} {:>8} {:>8} {:>8} {:>8}'.format(
+        'job', 'pointings', 'submitted', 'failed', 'prep s', 'done s',
+        'p50 ms', 'p95 ms')]
+    for job in summary['jobs']:
+        lines.append(
+            '{:<40} {:>9} {:>9} {:>7} {:>8.2f} {:>8.2f} {:>8} {:>8}{}'.format(
+                job['name'][:40], job['pointings'], job['submitted'],
+                job['failed'], job['prepare_time'], job['finish_time'],
+                ms(job['latency']['p50']), ms(job['latency']['p95']),
+                '' if job['error'] is None else '  ' + job['error']))
+    lines.append(
+        '{} jobs, {} of {} pointings submitted in {} requests, {:.2f} s, '
+        '{:.0f} pointings/s, latency p50 {} ms p95 {} ms max {} ms'.format(
+            len(summary['jobs']), summary['submitted'],
+            summary['pointings'], summary['requests'], summary['elapsed'],
+            summary['throughput'], ms(summary['latency']['p50']),
+            ms(summary['latency']['p95']), ms(summary['latency']['max'])))
+
+    return '\n'.join(lines)
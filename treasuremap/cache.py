@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    '''
+    On-disk cache of API responses, for `TreasureMapClient`
+
+    Bodies are stored in a SQLite table keyed by a digest of the request
+    URL, so API tokens are never written to disk. An entry is fresh for
+    `ttl` seconds after it was fetched; after that it is revalidated
+    with its ETag, if the server sent one, and only downloaded again if
+    it changed. Once there are more than `max_entries` entries the least
+    recently used ones are evicted.
+
+    :param path: SQLite file, created if it does not exist
+    :type path: str
+    :param ttl: Seconds an entry is served without asking the server,
+        defaults to 300
+    :type ttl: float, optional
+    :param max_entries: Number of entries kept, defaults to 1000
+    :type max_entries: int, optional
+    '''
+
+    def __init__(self, path, ttl=300.0, max_entries=1000):
+        '''Constructor method
+        '''
+
+        self.logger = logging.getLogger('treasuremap.ResponseCache')
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False,
+                                     timeout=30)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute("create table if not exists responses "
+                           "(key text primary key, etag text, body blob, "
+                           "fetched real, used real)")
+        self._conn.execute("create index if not exists responses_used "
+                           "on responses (used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(url):
+        '''
+        Cache key of a request URL
+
+        :param url: Full request URL, including the query string
+        :type url: str
+        :return: Hex digest
+        :rtype: str
+        '''
+
+        return hashlib.sha1(url.encode()).hexdigest()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "select count(*) from responses").fetchone()[0]
+
+    def close(self):
+        '''
+        Close the SQLite connection
+        '''
+
+        with self._lock:
+            self._conn.close()
+
+    def get(self, key):
+        '''
+        Look up an entry, marking it as used
+
+        :param key: Key from `key`
+        :type key: str
+        :return: (body, etag, fresh), or None if there is no entry
+        :rtype: tuple
+        '''
+
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "select body, etag, fetched from responses where key = ?",
+                (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("update responses set used = ? where key = ?",
+                               (now, key))
+            self._conn.commit()
+
+        body, etag, fetched = row
+        return bytes(body), etag, now - fetched < self.ttl
+
+    def put(self, key, body, etag=None):
+        '''
+        Store a freshly fetched body, evicting the least recently used
+        entries beyond `max_entries`
+
+        :param key: Key from `key`
+        :type key: str
+        :param body: Response body
+        :type body: bytes
+        :param etag: ETag the server sent with it, defaults to None
+        :type etag: str, optional
+        '''
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute("insert or replace into responses "
+                               "values (?, ?, ?, ?, ?)",
+                               (key, etag, sqlite3.Binary(body), now, now))
+            self._conn.execute(
+                "delete from responses where key in (select key from "
+                "responses order by used desc limit -1 offset ?)",
+                (self.max_entries,))
+            self._conn.commit()
+
+    def touch(self, key):
+        '''
+        Mark an entry as fetched now, after the server confirmed it is
+        unchanged
+
+        :param key: Key from `key`
+        :type key: str
+        '''
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute("update responses set fetched = ?, used = ? "
+                               "where key = ?", (now, now, key))
+            self._conn.commit()
+
+    def clear(self):
+        '''
+        Remove all entries
+        '''
+
+        with self._lock:
+            self._conn.execute("delete from responses")
+            self._conn.commit()
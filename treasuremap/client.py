@@ -0,0 +1,286 @@
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import urllib.parse
+
+import numpy as np
+
+from . import metrics
+from .exceptions import TreasureMapError
+from .retry import RetryPolicy
+from .session import TIMEOUT, get_session
+from .time import format_times
+
+
+class TreasureMapClient:
+    '''
+    Read pointings, instruments and footprints from Treasure Map
+
+    With a `cache` every response is kept on disk, so repeated lookups
+    during an event are answered locally until the entry's TTL runs out
+    and then only downloaded again if the server says it changed.
+
+    :param api_token: Treasuremap API token, defaults to None
+    :type api_token: str
+    :param session: HTTP session to use instead of the shared one,
+        defaults to None
+    :type session: requests.Session, optional
+    :param base_url: API base URL, defaults to the treasuremap.space API
+    :type base_url: str, optional
+    :param retry: Retry policy for failed requests, defaults to
+        `RetryPolicy()`
+    :type retry: RetryPolicy, optional
+    :param cache: Response cache, defaults to None for no caching
+    :type cache: ResponseCache, optional
+    :param timeout: Seconds to wait for a connection and for an answer,
+        as one number or a (connect, read) tuple, defaults to
+        `session.TIMEOUT`
+    :type timeout: float or tuple, optional
+    '''
+
+    def __init__(self, api_token=None, session=None, base_url=None,
+                 retry=None, cache=None, timeout=None):
+        '''Constructor method
+        '''
+
+        self.logger = logging.getLogger('treasuremap.TreasureMapClient')
+
+        if base_url is None:
+            self.BASE = 'http://treasuremap.space/api/v0'
+        else:
+            self.BASE = base_url.rstrip('/')
+
+        self._session = session
+
+        if retry is None:
+            self.retry = RetryPolicy()
+        else:
+            self.retry = retry
+
+        if timeout is None:
+            self.timeout = TIMEOUT
+        else:
+            self.timeout = timeout
+
+        if api_token is None:
+            self.api_token = os.getenv('TREASUREMAP_API')
+        else:
+            self.api_token = api_token
+
+        self.cache = cache
+
+    @property
+    def session(self):
+        '''
+        HTTP session used for requests, shared across instances unless
+        one was passed in
+        '''
+
+        if self._session is None:
+            return get_session()
+        return self._session
+
+    def url(self, target, params):
+        '''
+        Request URL for an endpoint, leaving out parameters that are None
+
+        :param target: Endpoint, e.g. `pointings`
+        :type target: str
+        :param params: Query parameters
+        :type params: dict
+        :return: URL with the parameters in a stable order
+        :rtype: str
+        '''
+
+        params = dict(params, api_token=self.api_token)
+        query = urllib.parse.urlencode(sorted(
+            (key, value) for key, value in params.items()
+            if value is not None))
+
+        return '{}/{}?{}'.format(self.BASE, target, query)
+
+    def get(self, target, **params):
+        '''
+        Get an endpoint, through the cache if there is one, and decode
+        the JSON response
+
+        :param target: Endpoint, e.g. `pointings`
+        :type target: str
+        :return: Decoded server response
+        :raises TreasureMapError: If the request fails or the response
+            is not JSON
+        '''
+
+        body = self._fetch(self.url(target, params))
+
+        try:
+            with metrics.span("parse"):
+                return json.loads(body)
+        except ValueError:
+            raise TreasureMapError("Response is not JSON: {!r}".format(
+                body[:200]))
+
+    def _fetch(self, url):
+        entry = None
+        headers = {}
+        if self.cache is not None:
+            key = self.cache.key(url)
+            entry = self.cache.get(key)
+            if entry is not None:
+                body, etag, fresh = entry
+                if fresh:
+                    metrics.count("cache", result="hit")
+                    return body
+                if etag is not None:
+                    headers['If-None-Match'] = etag
+
+        with metrics.span("http"):
+            r = self.retry.call(lambda: self.session.get(
+                url=url, headers=headers, timeout=self.timeout))
+        metrics.count("requests", status=r.status_code)
+
+        if r.status_code == 304 and entry is not None:
+            metrics.count("cache", result="revalidated")
+            self.cache.touch(key)
+            return entry[0]
+
+        if not r.ok:
+            raise TreasureMapError("HTTP {} {}: {}".format(
+                r.status_code, r.reason, r.text[:200]), r)
+
+        if self.cache is not None:
+            metrics.count("cache", result="miss")
+            self.cache.put(key, r.content, r.headers.get('ETag'))
+
+        return r.content
+
+    def pointings(self, graceid, status=None, band=None, instrumentid=None,
+                  **params):
+        '''
+        Get the pointings of an event
+
+        :param graceid: Event ID in GraceDB
+        :type graceid: str
+        :param status: Only pointings with this status, e.g. `planned`
+            or `completed`, defaults to None
+        :type status: str, optional
+        :param band: Only pointings in this band, defaults to None
+        :type band: str, optional
+        :param instrumentid: Only pointings of this instrument, defaults
+            to None
+        :type instrumentid: int, optional
+        :param params: Other query parameters of the API, such as
+            `completed_after` and `completed_before`
+        :return: Pointing dicts, which `DedupIndex.add_records` takes
+        :rtype: list
+        '''
+
+        return _records(self.get("pointings", graceid=graceid,
+                                 status=status, band=band,
+                                 instrument=instrumentid, **params))
+
+    def iter_pointings(self, graceid, start, end, window=86400.0,
+                       status="completed", max_workers=4, **params):
+        '''
+        Generate the pointings of an event one time window at a time
+
+        The time range is split into windows of `window` seconds, each
+        fetched (and cached) with its own request. Up to `max_workers`
+        windows are fetched ahead while earlier ones are consumed, so
+        only those windows are held in memory at once. Pointings come
+        out in window order.
+
+        :param graceid: Event ID in GraceDB
+        :type graceid: str
+        :param start: Start of the time range
+        :type start: str or numpy.datetime64
+        :param end: End of the time range
+        :type end: str or numpy.datetime64
+        :param window: Seconds per request, defaults to 86400.0
+        :type window: float, optional
+        :param status: `completed` or `planned`, which selects the time
+            the windows apply to, defaults to `completed`
+        :type status: str, optional
+        :param max_workers: Maximum number of requests in flight,
+            defaults to 4
+        :type max_workers: int, optional
+        :param params: Other filters, as for `pointings`
+        :return: Generator of pointing dicts
+        :rtype: generator
+        '''
+
+        if window <= 0:
+            raise ValueError("window must be positive")
+
+        edges = np.arange(np.datetime64(start, 'ms'), np.datetime64(end, 'ms'),
+                          np.timedelta64(int(window * 1000), 'ms'))
+        edges = format_times(np.append(edges, np.datetime64(end, 'ms')))
+
+        def fetch(after, before):
+            kwargs = {status + '_after': after, status + '_before': before}
+            kwargs.update(params)
+            return self.pointings(graceid, status=status, **kwargs)
+
+        # Window bounds are inclusive on the server, so a pointing on an
+        # edge can come back twice
+        previous = set()
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            pending = collections.deque()
+            windows = iter(zip(edges[:-1], edges[1:]))
+            while True:
+                for after, before in windows:
+                    pending.append(executor.submit(fetch, after, before))
+                    if len(pending) >= max_workers:
+                        break
+                if not pending:
+                    break
+
+                page = pending.popleft().result()
+                metrics.count("pages")
+                for pointing in page:
+                    if pointing.get("id") not in previous:
+                        yield pointing
+                previous = set(pointing.get("id") for pointing in page)
+
+    def instruments(self, instrumentid=None, name=None, type=None):
+        '''
+        Get instrument information
+
+        :param instrumentid: Instrument ID, defaults to None
+        :type instrumentid: int, optional
+        :param name: Instrument name, defaults to None
+        :type name: str, optional
+        :param type: Instrument type, e.g. `photometric`, defaults to None
+        :type type: str, optional
+        :return: Instrument dicts
+        :rtype: list
+        '''
+
+        return _records(self.get("instruments", id=instrumentid, name=name,
+                                 type=type))
+
+    def footprints(self, instrumentid=None, name=None):
+        '''
+        Get instrument footprints
+
+        :param instrumentid: Instrument ID, defaults to None
+        :type instrumentid: int, optional
+        :param name: Instrument name, defaults to None
+        :type name: str, optional
+        :return: Footprint dicts, each with an `instrumentid` and a WKT
+            `footprint` polygon
+        :rtype: list
+        '''
+
+        return _records(self.get("footprints", id=instrumentid, name=name))
+
+
+def _records(data):
+    '''
+    Decode a list response, whose items the API may send as JSON strings
+    '''
+
+    return [json.loads(item) if isinstance(item, str) else item
+            for item in data]
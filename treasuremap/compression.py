@@ -0,0 +1,102 @@
+import gzip
+import zlib
+
+
+# Content-Encoding values that request bodies can be compressed with
+ENCODINGS = ('gzip', 'zstd')
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression needs the zstandard package")
+    return zstandard
+
+
+def check_encoding(encoding):
+    '''
+    Check that bodies can be compressed with `encoding` here
+
+    :param encoding: `gzip` or `zstd`
+    :type encoding: str
+    :raises ValueError: If the encoding is unknown or needs a package
+        that is not installed
+    '''
+
+    if encoding not in ENCODINGS:
+        raise ValueError("Unknown compression {}, use one of {}".format(
+            encoding, list(ENCODINGS)))
+    if encoding == 'zstd':
+        _zstandard()
+
+
+def compress(body, encoding, level=None):
+    '''
+    Compress a request body
+
+    :param body: Encoded payload
+    :type body: bytes
+    :param encoding: `gzip` or `zstd`
+    :type encoding: str
+    :param level: Compression level, defaults to 6 for gzip and 3 for
+        zstd
+    :type level: int, optional
+    :return: Compressed body
+    :rtype: bytes
+    '''
+
+    check_encoding(encoding)
+    if encoding == 'gzip':
+        return gzip.compress(body, 6 if level is None else level, mtime=0)
+    return _zstandard().ZstdCompressor(
+        level=3 if level is None else level).compress(body)
+
+
+def decompress(body, encoding):
+    '''
+    Decompress a body compressed with `compress` or `iter_compressed`
+
+    :param body: Compressed body
+    :type body: bytes
+    :param encoding: `gzip` or `zstd`
+    :type encoding: str
+    :return: Original body
+    :rtype: bytes
+    '''
+
+    check_encoding(encoding)
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    # Streamed frames do not record their size, so decompress as a stream
+    return _zstandard().ZstdDecompressor().decompressobj().decompress(body)
+
+
+def iter_compressed(pieces, encoding, level=None):
+    '''
+    Compress a body given piece by piece, e.g. from `iter_payload`
+
+    :param pieces: Pieces of the encoded payload
+    :type pieces: iterable of bytes
+    :param encoding: `gzip` or `zstd`
+    :type encoding: str
+    :param level: Compression level, see `compress`
+    :type level: int, optional
+    :return: Generator of compressed pieces
+    :rtype: generator
+    '''
+
+    check_encoding(encoding)
+    if encoding == 'gzip':
+        # wbits 31 writes a gzip header and trailer
+        compressor = zlib.compressobj(6 if level is None else level,
+                                      zlib.DEFLATED, 31)
+    else:
+        compressor = _zstandard().ZstdCompressor(
+            level=3 if level is None else level).compressobj()
+
+    for piece in pieces:
+        out = compressor.compress(piece)
+        if out:
+            yield out
+    yield compressor.flush()
@@ -0,0 +1,151 @@
+import glob
+
+
+INSTRUMENT_ID = 38
+
+# Connection to the DECam exposure database, see `connect`
+DATABASE = {
+    'database': 'decam_prd',
+    'user': 'decam_reader',
+    'host': 'des61.fnal.gov',
+    'port': 5443,
+}
+
+# Exposures of the proposal, shared by both queries
+EXPLIST = """
+with explist as (
+      select id as expnum,
+             exptime,
+             filter,
+             to_char(date::timestamp - interval '1 DAY' ,'YYYYMMDD') as night,
+             to_char(date::timestamp,'HH24:MI:SS') as time,
+             qc_teff,
+             to_char(ra,'09.999999') as ra,
+             to_char(declination,'99.99999') as dec,
+             substring(object from 'x(.......)t') as hex
+      from exposure.exposure
+      where flavor = 'object' and
+            propid = '{propid}' and
+            qc_teff>0)
+"""
+
+# One row per pointing, with the depth from the summed effective
+# exposure time
+QUERY = EXPLIST + """select filter,
+       night,
+       ra,
+       dec,
+       time,
+       sum(exptime) as sumexptime,
+       to_char(case when filter='g' then 23.4
+                    when filter='r' then 23.1
+                    when filter='i' then 22.5
+                    when filter='z' then 21.8
+                    when filter='Y' then 20.3
+                    end + 1.25*log(sum(qc_teff*exptime)/90.), '99.99') as depth,
+       hex,
+       max(expnum) as expnum
+from explist
+where cast(night as int) < {end} and
+      cast(night as int) > {start}{touched}
+group by night,
+         filter,
+         hex,
+         ra,
+         dec,
+         time{having}
+order by night;
+"""
+
+# Restrict the query to (night, filter, hex) groups with exposures after a watermark
+TOUCHED = """ and
+      (night, filter, coalesce(hex, '')) in (select night, filter, coalesce(hex, '')
+                                             from explist
+                                             where expnum > {since})"""
+HAVING = """
+having max(expnum) > {since}"""
+
+# One row per exposure, for computing depths with treasuremap.depth
+RAW_QUERY = EXPLIST + """select *
+from explist
+where cast(night as int) < {end} and
+      cast(night as int) > {start}
+order by night;
+"""
+
+# Columns of the pointing tables made by `format_batch`
+COLUMNS = ['ra', 'dec', 'time', 'band', 'status', 'instrumentid', 'depth',
+           'depth_unit']
+
+
+def build_query(propid, start, end, since=None):
+    '''
+    Fill in the pointing query
+
+    :param propid: Proposal ID
+    :type propid: str
+    :param start: YYYYMMDD lower bound (exclusive) of the nights
+    :type start: str
+    :param end: YYYYMMDD upper bound (exclusive) of the nights
+    :type end: str
+    :param since: Only re-aggregate the groups with exposures newer than
+        this exposure ID, defaults to None for all groups
+    :type since: int, optional
+    :return: SQL query
+    :rtype: str
+    '''
+
+    if since is None:
+        touched = having = ''
+    else:
+        touched = TOUCHED.format(since=int(since))
+        having = HAVING.format(since=int(since))
+
+    return QUERY.format(propid=propid, start=start, end=end,
+                        touched=touched, having=having)
+
+
+def connect(password=None, **kwargs):
+    '''
+    Connect to the DECam database with psycopg2
+
+    :param password: Database password, defaults to the name of the
+        `.<password>.password` file in the working directory
+    :type password: str, optional
+    :param kwargs: Connection arguments replacing those in `DATABASE`
+    :return: Database connection
+    :rtype: psycopg2.extensions.connection
+    '''
+
+    import psycopg2
+
+    if password is None:
+        password = glob.glob(".*.password")[0].split('.')[1]
+
+    return psycopg2.connect(password=password, **dict(DATABASE, **kwargs))
+
+
+def format_batch(df):
+    '''
+    Turn rows of the pointing query into Treasure Map pointing columns
+
+    :param df: Rows of `QUERY`, or of `DepthEngine.pointings`
+    :type df: pandas.DataFrame
+    :return: Table with the `COLUMNS`
+    :rtype: pandas.DataFrame
+    '''
+
+    from .time import format_times, parse_durations, parse_nights
+
+    # Combine the night (YYYYMMDD) and time (HH:MM:SS) in one vectorized pass
+    date = parse_nights(df['night'].values)
+    offset = parse_durations(df['time'].values)
+
+    df['instrumentid'] = INSTRUMENT_ID
+    df['time'] = format_times(date + offset, decimals=1)
+    df['band'] = df['filter'].values
+    df['status'] = 'completed'
+    if 'depth_unit' not in df.columns:
+        df['depth_unit'] = 'ab_mag'
+
+    return df[COLUMNS]
@@ -0,0 +1,269 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+from .time import format_times
+
+
+POINT_RE = re.compile(r'POINT\s*\(\s*(\S+)\s+([^\s)]+)\s*\)')
+
+
+class DedupIndex:
+    '''
+    On-disk index of pointings already submitted to Treasure Map
+
+    Each pointing is keyed by a digest of (graceid, instrumentid, band,
+    ra, dec, time, depth), with the coordinates and depth rounded so that
+    re-encoded values still match. Keys live in a SQLite table with the
+    key as primary key, so each check is an index lookup.
+
+    :param path: SQLite file, created if it does not exist
+    :type path: str
+    :param ra_decimals: Decimal places RA and Dec are rounded to,
+        defaults to 5 (under 0.04 arcsec)
+    :type ra_decimals: int, optional
+    :param depth_decimals: Decimal places depth is rounded to, defaults to 3
+    :type depth_decimals: int, optional
+    '''
+
+    # SQLite limits the number of parameters in one statement
+    BATCH = 500
+
+    def __init__(self, path, ra_decimals=5, depth_decimals=3):
+        '''Constructor method
+        '''
+
+        self.logger = logging.getLogger('treasuremap.DedupIndex')
+        self.path = path
+        self.ra_decimals = ra_decimals
+        self.depth_decimals = depth_decimals
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("create table if not exists submitted "
+                           "(key text primary key) without rowid")
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "select count(*) from submitted").fetchone()[0]
+
+    def close(self):
+        '''
+        Close the SQLite connection
+        '''
+
+        self._conn.close()
+
+    def keys(self, graceid, instrumentid, band, ra, dec, time, depth):
+        '''
+        Keys for arrays of pointings sharing an event, instrument and band
+
+        :param graceid: Event ID in GraceDB
+        :type graceid: str
+        :param instrumentid: Instrument ID
+        :type instrumentid: int
+        :param band: Observing band
+        :type band: str
+        :param ra: Right Ascension in degrees
+        :type ra: array-like
+        :param dec: Declination in degrees
+        :type dec: array-like
+        :param time: Observation times
+        :type time: array-like of datetime64 or str
+        :param depth: Pointing depths
+        :type depth: array-like
+        :return: Hex digests
+        :rtype: list of str
+        '''
+
+        ra = np.round(np.mod(np.asarray(ra, dtype=float), 360.0),
+                      self.ra_decimals)
+        dec = np.round(np.asarray(dec, dtype=float), self.ra_decimals)
+        depth = np.round(np.asarray(depth, dtype=float), self.depth_decimals)
+        time = format_times(time)
+
+        prefix = '{}|{}|{}|'.format(graceid, instrumentid, band)
+        return [
+            hashlib.sha1('{}{!r}|{!r}|{}|{!r}'.format(
+                prefix, r, d, t, dp).encode()).hexdigest()
+            for r, d, t, dp in zip(ra.tolist(), dec.tolist(), time.tolist(),
+                                   depth.tolist())
+        ]
+
+    def pointing_keys(self, pointings, index=None):
+        '''
+        Keys for the pointings held by a `Pointings`
+
+        :param pointings: Pointings to key
+        :type pointings: Pointings
+        :param index: Rows of `pointings.table` to key, defaults to all
+        :type index: slice or array-like, optional
+        :return: Hex digests
+        :rtype: list of str
+        '''
+
+        table = pointings.table
+        if index is None:
+            index = slice(0, len(table))
+
+        return self.keys(pointings.graceid, pointings.instrumentid,
+                         pointings.band, table.ra[index], table.dec[index],
+                         table.time[index], table.depth[index])
+
+    def contains(self, keys):
+        '''
+        Check which keys are in the index
+
+        :param keys: Keys to check
+        :type keys: list of str
+        :return: Whether each key is present
+        :rtype: numpy.ndarray of bool
+        '''
+
+        found = set()
+        with self._lock:
+            for start in range(0, len(keys), self.BATCH):
+                batch = keys[start:start + self.BATCH]
+                found.update(row[0] for row in self._conn.execute(
+                    "select key from submitted where key in ({})".format(
+                        ','.join('?' * len(batch))), batch))
+
+        return np.array([key in found for key in keys], dtype=bool)
+
+    def add(self, keys):
+        '''
+        Add keys to the index
+
+        :param keys: Keys to add
+        :type keys: list of str
+        :return: Number of keys that were not already present
+        :rtype: int
+        '''
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "insert or ignore into submitted (key) values (?)",
+                ((key,) for key in keys))
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def add_pointings(self, pointings, index=None):
+        '''
+        Add the pointings held by a `Pointings`, e.g. once acknowledged
+
+        :param pointings: Submitted pointings
+        :type pointings: Pointings
+        :param index: Rows of `pointings.table` to add, defaults to all
+        :type index: slice or array-like, optional
+        :return: Number of pointings that were not already present
+        :rtype: int
+        '''
+
+        return self.add(self.pointing_keys(pointings, index))
+
+    def add_records(self, graceid, records):
+        '''
+        Add pointing dicts, as sent to or returned by the API
+
+        :param graceid: Event ID the pointings belong to
+        :type graceid: str
+        :param records: Pointing dicts with `position`, `instrumentid`,
+            `band`, `time` and `depth`
+        :type records: iterable of dict
+        :return: Number of pointings that were not already present
+        :rtype: int
+        '''
+
+        keys = []
+        for record in records:
+            match = POINT_RE.search(record.get("position", ""))
+            if match is None:
+                self.logger.warning("Skipping pointing without a position: "
+                                    "{}".format(record))
+                continue
+            ra, dec = float(match.group(1)), float(match.group(2))
+            keys.extend(self.keys(
+                record.get("graceid", graceid), record["instrumentid"],
+                record["band"], [ra], [dec], [record["time"]],
+                [np.nan if record.get("depth") is None else record["depth"]]))
+
+        return self.add(keys)
+
+    def seed_from_logs(self, paths, graceid, client=None):
+        '''
+        Seed the index from the pointings earlier submissions got
+        acknowledged
+
+        Each file may hold several JSON documents one after another, as
+        submit_tm.py writes them. Only what the server acknowledged is
+        used: the `pointing_ids` of responses (requests.json) and of
+        journal records, and lists of pointing dicts the server returned,
+        which carry an `id`. Logged payloads and pointings.json are
+        skipped, since they also hold pointings whose chunks failed.
+        Responses hold no positions, so with a `client` the event's
+        pointings are fetched and those with the acknowledged IDs added.
+
+        :param paths: Log and journal files
+        :type paths: list of str
+        :param graceid: Event ID the logged pointings belong to
+        :type graceid: str
+        :param client: Client to look the acknowledged IDs up with,
+            defaults to None
+        :type client: TreasureMapClient, optional
+        :return: Number of pointings added and the acknowledged pointing
+            IDs that could not be looked up
+        :rtype: tuple of (int, list)
+        '''
+
+        added = 0
+        ids = []
+        for path in paths:
+            for doc in _iter_json_documents(path):
+                if isinstance(doc, dict) and "pointing_ids" in doc:
+                    ids.extend(doc["pointing_ids"])
+                elif isinstance(doc, list):
+                    records = [record for record in doc
+                               if isinstance(record, dict) and "id" in record]
+                    if len(records) < len(doc):
+                        self.logger.info(
+                            "Skipping {} pointings of {} that the server "
+                            "did not return".format(len(doc) - len(records),
+                                                    path))
+                    added += self.add_records(graceid, records)
+
+        if client is not None and ids:
+            wanted = set(ids)
+            records = [record for record in client.pointings(graceid)
+                       if record.get("id") in wanted]
+            added += self.add_records(graceid, records)
+            found = set(record["id"] for record in records)
+            ids = [i for i in ids if i not in found]
+
+        return added, ids
+
+
+def _iter_json_documents(path):
+    '''
+    Generate the JSON documents written one after another to a file
+    '''
+
+    decoder = json.JSONDecoder()
+    with open(path) as f:
+        text = f.read()
+
+    position = 0
+    while True:
+        while position < len(text) and text[position].isspace():
+            position += 1
+        if position >= len(text):
+            return
+        doc, position = decoder.raw_decode(text, position)
+        yield doc
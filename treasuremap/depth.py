@@ -0,0 +1,370 @@
+import datetime
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+
+
+# AB magnitude zero points per instrument ID and band: the depth of a
+# 90 s exposure with an effective exposure time ratio (teff) of 1
+ZERO_POINTS = {
+    38: {'g': 23.4, 'r': 23.1, 'i': 22.5, 'z': 21.8, 'Y': 20.3},  # DECam
+}
+
+# Zero point of AB magnitudes in Jansky
+AB_JY = 3631.0
+
+UNITS = ('ab_mag', 'flux_jy')
+
+# Columns of a raw exposure pull, one row per exposure
+EXPOSURE_COLUMNS = ['expnum', 'exptime', 'filter', 'night', 'time',
+                    'qc_teff', 'ra', 'dec', 'hex']
+
+# Exposures in one group are summed into one pointing, as by the SQL
+# `group by` of treasue_map_query.py
+GROUP_COLUMNS = ['night', 'filter', 'hex', 'ra', 'dec', 'time']
+
+
+def teff_depth(zero_point, exptime, teff_exptime, reference=90.0):
+    '''
+    Depth from the summed effective exposure time, as used for DECam:
+    m = zp + 1.25 log10(sum(teff * exptime) / reference)
+
+    :param zero_point: Zero points in AB magnitudes
+    :type zero_point: array-like
+    :param exptime: Summed exposure times in seconds (unused)
+    :type exptime: array-like
+    :param teff_exptime: Summed teff * exposure time in seconds
+    :type teff_exptime: array-like
+    :param reference: Exposure time of the zero point, defaults to 90.0
+    :type reference: float, optional
+    :return: Depths in AB magnitudes
+    :rtype: numpy.ndarray
+    '''
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return zero_point + 1.25 * np.log10(
+            np.asarray(teff_exptime, dtype=float) / reference)
+
+
+def exptime_depth(zero_point, exptime, teff_exptime, reference=90.0):
+    '''
+    Depth from the summed exposure time alone, ignoring observing
+    conditions: m = zp + 1.25 log10(sum(exptime) / reference)
+
+    Takes the same arguments as `teff_depth`.
+    '''
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return zero_point + 1.25 * np.log10(
+            np.asarray(exptime, dtype=float) / reference)
+
+
+MODELS = {
+    'teff': teff_depth,
+    'exptime': exptime_depth,
+}
+
+
+def convert(depth, from_unit, to_unit):
+    '''
+    Convert depths between AB magnitudes and fluxes in Jansky
+
+    :param depth: Depths
+    :type depth: array-like
+    :param from_unit: Unit of `depth`, `ab_mag` or `flux_jy`
+    :type from_unit: str
+    :param to_unit: Unit to convert to, `ab_mag` or `flux_jy`
+    :type to_unit: str
+    :return: Converted depths
+    :rtype: numpy.ndarray
+    '''
+
+    for unit in (from_unit, to_unit):
+        if unit not in UNITS:
+            raise ValueError("Cannot convert depths in {}, use one of {}"
+                             .format(unit, list(UNITS)))
+
+    depth = np.asarray(depth, dtype=float)
+    if from_unit == to_unit:
+        return depth
+    if to_unit == 'flux_jy':
+        return AB_JY * 10 ** (-0.4 * depth)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return -2.5 * np.log10(depth / AB_JY)
+
+
+def load_zero_points(path):
+    '''
+    Read zero points from a JSON file of {instrumentid: {band: zp}}
+
+    :param path: JSON file
+    :type path: str
+    :return: Zero points keyed by integer instrument ID and band
+    :rtype: dict
+    '''
+
+    with open(path) as f:
+        data = json.load(f)
+
+    return {int(instrumentid): {band: float(zp) for band, zp in bands.items()}
+            for instrumentid, bands in data.items()}
+
+
+class DepthEngine:
+    '''
+    Compute pointing depths from raw exposure columns
+
+    Exposures are grouped into pointings and their exposure times
+    summed with one pandas group-by, then each depth comes from the
+    zero point of its instrument and band and the depth `model`, all as
+    array operations. Bands without a zero point get a missing depth.
+
+    :param zero_points: Zero points keyed by instrument ID and band,
+        defaults to `ZERO_POINTS`
+    :type zero_points: dict, optional
+    :param model: Name of a depth model in `MODELS`, defaults to 'teff'
+    :type model: str, optional
+    :param unit: Unit of the depths returned, `ab_mag` or `flux_jy`,
+        defaults to 'ab_mag'
+    :type unit: str, optional
+    :param reference: Exposure time of the zero points in seconds,
+        defaults to 90.0
+    :type reference: float, optional
+    '''
+
+    def __init__(self, zero_points=None, model='teff', unit='ab_mag',
+                 reference=90.0):
+        '''Constructor method
+        '''
+
+        if model not in MODELS:
+            raise ValueError("Unknown depth model {}, use one of {}".format(
+                model, sorted(MODELS)))
+        if unit not in UNITS:
+            raise ValueError("Unknown depth unit {}, use one of {}".format(
+                unit, list(UNITS)))
+
+        if zero_points is None:
+            self.zero_points = ZERO_POINTS
+        else:
+            self.zero_points = zero_points
+
+        self.model = model
+        self.unit = unit
+        self.reference = reference
+
+    def zero_point(self, instrumentid, band):
+        '''
+        Zero point of each band
+
+        :param instrumentid: Instrument ID
+        :type instrumentid: int
+        :param band: Bands
+        :type band: array-like of str
+        :return: Zero points, NaN for bands without one
+        :rtype: numpy.ndarray
+        '''
+
+        band = np.asarray(band, dtype=object)
+        zp = np.full(len(band), np.nan)
+        for name, value in self.zero_points.get(instrumentid, {}).items():
+            zp[band == name] = value
+
+        return zp
+
+    def depths(self, instrumentid, band, exptime, teff_exptime):
+        '''
+        Depth of each pointing from its summed exposure times
+
+        :param instrumentid: Instrument ID
+        :type instrumentid: int
+        :param band: Band of each pointing
+        :type band: array-like of str
+        :param exptime: Summed exposure times in seconds
+        :type exptime: array-like
+        :param teff_exptime: Summed teff * exposure time in seconds
+        :type teff_exptime: array-like
+        :return: Depths in `self.unit`
+        :rtype: numpy.ndarray
+        '''
+
+        with metrics.span("depth", model=self.model):
+            depth = MODELS[self.model](self.zero_point(instrumentid, band),
+                                       exptime, teff_exptime, self.reference)
+            depth = np.where(np.isfinite(depth), depth, np.nan)
+            return convert(depth, 'ab_mag', self.unit)
+
+    def pointings(self, exposures, instrumentid=38):
+        '''
+        Group raw exposures into pointings and compute their depths
+
+        :param exposures: Raw exposures with `EXPOSURE_COLUMNS`
+        :type exposures: pandas.DataFrame
+        :param instrumentid: Instrument ID, defaults to 38 (DECam)
+        :type instrumentid: int, optional
+        :return: One row per pointing with the `GROUP_COLUMNS`,
+            `sumexptime`, `depth`, `depth_unit` and the latest `expnum`,
+            ordered by night
+        :rtype: pandas.DataFrame
+        '''
+
+        exposures = exposures.assign(
+            teff_exptime=exposures['qc_teff'].astype(float) *
+            exposures['exptime'].astype(float),
+            hex=exposures['hex'].fillna(''))
+
+        grouped = exposures.groupby(GROUP_COLUMNS, sort=False).agg(
+            sumexptime=('exptime', 'sum'),
+            teff_exptime=('teff_exptime', 'sum'),
+            expnum=('expnum', 'max')).reset_index()
+
+        depth = self.depths(instrumentid, grouped['filter'].values,
+                            grouped['sumexptime'].values,
+                            grouped['teff_exptime'].values)
+        if self.unit == 'ab_mag':
+            # As to_char(..., '99.99') did in the SQL
+            depth = np.round(depth, 2)
+
+        grouped['depth'] = depth
+        grouped['depth_unit'] = self.unit
+        grouped['hex'] = grouped['hex'].where(grouped['hex'] != '', None)
+
+        return grouped.drop(columns='teff_exptime').sort_values(
+            'night', kind='stable', ignore_index=True)
+
+
+class ExposureCache:
+    '''
+    Local copy of raw exposure pulls, one Parquet file per proposal and
+    night
+
+    Nights already pulled are read from disk, so depths can be
+    recomputed with another model or zero points without querying the
+    database. Nights that may still be observed (from yesterday on) are
+    never cached. Needs pyarrow.
+
+    :param directory: Cache directory, created if it does not exist
+    :type directory: str
+    '''
+
+    def __init__(self, directory):
+        '''Constructor method
+        '''
+
+        self.logger = logging.getLogger('treasuremap.ExposureCache')
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, propid, night):
+        return os.path.join(self.directory, '{}_{}.parquet'.format(
+            propid, night))
+
+    @staticmethod
+    def nights(start, end):
+        '''
+        Nights strictly between `start` and `end`, as YYYYMMDD strings
+
+        :param start: YYYYMMDD lower bound
+        :type start: str
+        :param end: YYYYMMDD upper bound
+        :type end: str
+        :return: Nights
+        :rtype: list of str
+        '''
+
+        days = np.arange(_day(start) + 1, _day(end), dtype='datetime64[D]')
+        return [_night(day) for day in days]
+
+    def missing(self, propid, start, end):
+        '''
+        Nights between `start` and `end` that are not cached
+
+        :return: Nights as YYYYMMDD strings
+        :rtype: list of str
+        '''
+
+        return [night for night in self.nights(start, end)
+                if not os.path.exists(self.path(propid, night))]
+
+    def load(self, propid, start, end, fetch):
+        '''
+        Raw exposures of the nights strictly between `start` and `end`
+
+        Nights that are not cached are pulled with one call to `fetch`
+        per run of consecutive missing nights, then stored per night,
+        including nights without exposures.
+
+        :param propid: Proposal ID
+        :type propid: str
+        :param start: YYYYMMDD lower bound
+        :type start: str
+        :param end: YYYYMMDD upper bound
+        :type end: str
+        :param fetch: Function of (start, end) returning the raw
+            exposures of the nights strictly between them
+        :type fetch: callable
+        :return: Raw exposures with `EXPOSURE_COLUMNS`
+        :rtype: pandas.DataFrame
+        '''
+
+        missing = self.missing(propid, start, end)
+        frames = []
+
+        # Nights from two days ago on may still get exposures
+        recent = _night(np.datetime64(
+            datetime.datetime.now(datetime.timezone.utc).date()) - 2)
+
+        for first, last in _runs(missing):
+            self.logger.info("Pulling nights {} to {} of {} from the "
+                             "database".format(first, last, propid))
+            with metrics.span("pull"):
+                pulled = fetch(_night(_day(first) - 1),
+                               _night(_day(last) + 1))
+            pulled = pulled.astype({'night': str})
+            frames.append(pulled)
+
+            by_night = dict(tuple(pulled.groupby('night')))
+            for night in self.nights(_night(_day(first) - 1),
+                                     _night(_day(last) + 1)):
+                if night < recent:
+                    by_night.get(night, pulled.iloc[:0]).to_parquet(
+                        self.path(propid, night), index=False)
+
+        missing = set(missing)
+        cached = [night for night in self.nights(start, end)
+                  if night not in missing]
+        frames.extend(pd.read_parquet(self.path(propid, night))
+                      for night in cached)
+        metrics.count("nights_cached", len(cached))
+
+        if not frames:
+            return pd.DataFrame(columns=EXPOSURE_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+
+def _day(night):
+    return np.datetime64(datetime.datetime.strptime(str(night), '%Y%m%d'),
+                         'D')
+
+
+def _night(day):
+    return str(day).replace('-', '')
+
+
+def _runs(nights):
+    '''
+    (first, last) of each run of consecutive nights
+    '''
+
+    runs = []
+    for night in nights:
+        if runs and _day(night) - _day(runs[-1][1]) == 1:
+            runs[-1][1] = night
+        else:
+            runs.append([night, night])
+    return runs
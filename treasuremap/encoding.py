@@ -0,0 +1,74 @@
+import json
+
+
+def iter_payload(graceid, api_token, pointings, buffer_size=65536):
+    '''
+    Encode a submission payload piece by piece
+
+    Pointings are taken from `pointings` one at a time and encoded into
+    a buffer that is handed out whenever it reaches `buffer_size`, so
+    memory use does not grow with the number of pointings. The JSON is
+    written without optional whitespace and, as in
+    `Pointings.post_pointings`, NaN and infinite values raise a
+    ValueError.
+
+    :param graceid: Event ID in GraceDB
+    :type graceid: str
+    :param api_token: Treasuremap API token
+    :type api_token: str
+    :param pointings: Pointing dicts
+    :type pointings: iterable
+    :param buffer_size: Approximate size in bytes of the pieces yielded,
+        defaults to 65536
+    :type buffer_size: int, optional
+    :return: Generator of UTF-8 encoded pieces of the JSON payload
+    :rtype: generator
+    '''
+
+    buffer = ['{"graceid":', json.dumps(graceid),
+              ',"api_token":', json.dumps(api_token),
+              ',"pointings":[']
+    size = 0
+    separator = ''
+
+    for pointing in pointings:
+        encoded = json.dumps(pointing, allow_nan=False,
+                             separators=(',', ':'))
+        buffer.append(separator)
+        buffer.append(encoded)
+        separator = ','
+        size += len(encoded) + 1
+
+        if size >= buffer_size:
+            yield ''.join(buffer).encode()
+            buffer = []
+            size = 0
+
+    buffer.append(']}')
+    yield ''.join(buffer).encode()
+
+
+def write_payload(f, graceid, api_token, pointings, buffer_size=65536):
+    '''
+    Write a submission payload to a file without building it in memory
+
+    :param f: Binary file object
+    :type f: file
+    :param graceid: Event ID in GraceDB
+    :type graceid: str
+    :param api_token: Treasuremap API token
+    :type api_token: str
+    :param pointings: Pointing dicts
+    :type pointings: iterable
+    :param buffer_size: Approximate size in bytes of each write,
+        defaults to 65536
+    :type buffer_size: int, optional
+    :return: Number of bytes written
+    :rtype: int
+    '''
+
+    written = 0
+    for piece in iter_payload(graceid, api_token, pointings, buffer_size):
+        f.write(piece)
+        written += len(piece)
+    return written
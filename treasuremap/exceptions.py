@@ -0,0 +1,18 @@
+class TreasureMapError(Exception):
+    '''
+    A request to the Treasure Map API failed
+
+    :param message: Description of the failure
+    :type message: str
+    :param response: Server response, if one was received, defaults to None
+    :type response: requests.Response, optional
+    :param uncertain: Whether the server may have processed the request
+        all the same, so that sending it again could duplicate what it
+        stored, defaults to False
+    :type uncertain: bool, optional
+    '''
+
+    def __init__(self, message, response=None, uncertain=False):
+        super().__init__(message)
+        self.response = response
+        self.uncertain = uncertain
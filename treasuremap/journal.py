@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+class SubmissionJournal:
+    '''
+    Append-only record of the pointings Treasure Map has acknowledged
+
+    Each acknowledged chunk is written as one JSON line holding a key per
+    accepted pointing and the pointing IDs returned for the chunk.
+    Rerunning a submission with the same journal skips the pointings
+    already in it, so only the unacknowledged remainder is sent again.
+
+    :param path: Journal file, created if it does not exist
+    :type path: str
+    '''
+
+    def __init__(self, path):
+        '''Constructor method
+        '''
+
+        self.logger = logging.getLogger('treasuremap.SubmissionJournal')
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = []
+        self._index = {}
+
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A partial last line from an interrupted write
+                        continue
+                    self._add(entry)
+
+    def _add(self, entry):
+        n = len(self._entries)
+        self._entries.append(entry)
+        for key in entry["keys"]:
+            self._index[key] = n
+
+    @staticmethod
+    def key(graceid, pointing):
+        '''
+        Key identifying one pointing of an event
+
+        :param graceid: Event ID in GraceDB
+        :type graceid: str
+        :param pointing: Pointing dict as built by `Pointings`
+        :type pointing: dict
+        :return: Hex digest
+        :rtype: str
+        '''
+
+        data = json.dumps([graceid, pointing], sort_keys=True)
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def pointing_ids(self, keys):
+        '''
+        Pointing IDs recorded for the given keys, in order of first
+        appearance and with each journal entry counted once
+
+        :param keys: Pointing keys
+        :type keys: list of str
+        :return: Pointing IDs
+        :rtype: list
+        '''
+
+        ids = []
+        seen = set()
+        for key in keys:
+            n = self._index.get(key)
+            if n is None or n in seen:
+                continue
+            seen.add(n)
+            ids.extend(self._entries[n]["pointing_ids"])
+        return ids
+
+    def record(self, graceid, keys, response):
+        '''
+        Record the pointings of a chunk that Treasure Map accepted
+
+        Pointings the response lists in `ERRORS` were rejected and are
+        left out, so that a rerun sends them again. If the rejected ones
+        cannot be told apart, nothing is recorded and the chunk is
+        logged for checking by hand.
+
+        :param graceid: Event ID in GraceDB
+        :type graceid: str
+        :param keys: Keys of the pointings in the chunk
+        :type keys: list of str
+        :param response: Decoded server response for the chunk
+        :type response: dict
+        :return: Keys recorded
+        :rtype: list of str
+        '''
+
+        accepted = accepted_keys(graceid, keys, response)
+        if accepted is None:
+            self.logger.warning(
+                "Cannot tell which of {} pointings were accepted with "
+                "pointing IDs {}, not recording them: {}".format(
+                    len(keys), response["pointing_ids"],
+                    response.get("ERRORS")))
+            return []
+        if not accepted:
+            return []
+
+        entry = {
+            "time": time.time(),
+            "graceid": graceid,
+            "keys": accepted,
+            "pointing_ids": response["pointing_ids"]
+        }
+        line = json.dumps(entry) + '\n'
+
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._add(entry)
+
+        return accepted
+
+
+def accepted_keys(graceid, keys, response):
+    '''
+    Keys of the pointings of a chunk that the server accepted
+
+    Treasure Map lists each rejected pointing in `ERRORS` as
+    ["Object: <pointing JSON>", [reasons]] and returns IDs for the
+    others only, in order.
+
+    :param graceid: Event ID in GraceDB
+    :type graceid: str
+    :param keys: Keys of the pointings sent, see `SubmissionJournal.key`
+    :type keys: list of str
+    :param response: Decoded server response
+    :type response: dict
+    :return: Accepted keys, or None if the `ERRORS` do not account for
+        the pointings without IDs
+    :rtype: list of str
+    '''
+
+    ids = response["pointing_ids"]
+    errors = response.get("ERRORS") or []
+    if not errors and len(ids) == len(keys):
+        return list(keys)
+
+    rejected = set()
+    for error in errors:
+        obj = error[0] if isinstance(error, (list, tuple)) and error else error
+        if isinstance(obj, str):
+            try:
+                obj = json.loads(obj.partition('Object:')[2] or obj)
+            except ValueError:
+                return None
+        if not isinstance(obj, dict):
+            return None
+        rejected.add(SubmissionJournal.key(graceid, obj))
+
+    accepted = [key for key in keys if key not in rejected]
+    if len(accepted) != len(ids):
+        return None
+    return accepted
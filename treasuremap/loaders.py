@@ -0,0 +1,205 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+
+
+# Columns read from pointing tables; any others are never loaded
+COLUMNS = ['ra', 'dec', 'time', 'band', 'depth', 'depth_unit']
+OPTIONAL_COLUMNS = ['pos_angle']
+
+# Types of the columns when read from text
+DTYPES = {'ra': np.float64, 'dec': np.float64, 'depth': np.float64,
+          'pos_angle': np.float64, 'band': str, 'depth_unit': str,
+          'time': str}
+
+FORMATS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow',
+    '.fits': 'fits',
+    '.fit': 'fits',
+    '.fts': 'fits'
+}
+
+
+def guess_format(path):
+    '''
+    Guess a table format from a file name
+
+    :param path: File name, optionally ending in .gz
+    :type path: str
+    :return: One of 'csv', 'parquet', 'arrow' or 'fits'
+    :rtype: str
+    '''
+
+    root, ext = os.path.splitext(path.lower())
+    if ext == '.gz':
+        ext = os.path.splitext(root)[1]
+
+    try:
+        return FORMATS[ext]
+    except KeyError:
+        raise ValueError("Cannot tell the format of {}, use one of {}".format(
+            path, sorted(set(FORMATS.values()))))
+
+
+def read_pointings(path, format=None, columns=None):
+    '''
+    Read a pointing table, loading only the columns `Pointings` needs
+
+    Parquet, Arrow and FITS files are memory mapped rather than read
+    into memory up front.
+
+    :param path: Table file
+    :type path: str
+    :param format: 'csv', 'parquet', 'arrow' or 'fits', defaults to
+        guessing from the file name
+    :type format: str, optional
+    :param columns: Columns to load, defaults to `COLUMNS` plus any
+        of `OPTIONAL_COLUMNS` that are present
+    :type columns: list, optional
+    :return: Pointing table
+    :rtype: pandas.DataFrame
+    '''
+
+    if format is None:
+        format = guess_format(path)
+
+    readers = {
+        'csv': read_csv,
+        'parquet': read_parquet,
+        'arrow': read_arrow,
+        'fits': read_fits
+    }
+
+    try:
+        reader = readers[format]
+    except KeyError:
+        raise ValueError("Unknown format {}, use one of {}".format(
+            format, sorted(readers)))
+
+    with metrics.span("read", format=format):
+        df = reader(path, columns)
+    metrics.count("rows_read", len(df))
+
+    return df
+
+
+def _select(available, columns):
+    '''
+    Pick the columns to load from those available in a file
+    '''
+
+    if columns is None:
+        wanted = COLUMNS
+        optional = OPTIONAL_COLUMNS
+    else:
+        wanted = columns
+        optional = []
+
+    missing = [c for c in wanted if c not in available]
+    if missing:
+        raise KeyError("Missing columns: {}".format(', '.join(missing)))
+
+    return list(wanted) + [c for c in optional if c in available]
+
+
+def read_csv(path, columns=None):
+    '''
+    Read the pointing columns of a CSV file
+
+    :param path: CSV file
+    :type path: str
+    :param columns: Columns to load, see `read_pointings`
+    :type columns: list, optional
+    :return: Pointing table
+    :rtype: pandas.DataFrame
+    '''
+
+    header = pd.read_csv(path, nrows=0).columns
+    selected = _select(header, columns)
+
+    return pd.read_csv(path, usecols=selected, memory_map=True,
+                       dtype={c: t for c, t in DTYPES.items()
+                              if c in selected})[selected]
+
+
+def read_parquet(path, columns=None):
+    '''
+    Read the pointing columns of a Parquet file
+
+    :param path: Parquet file
+    :type path: str
+    :param columns: Columns to load, see `read_pointings`
+    :type columns: list, optional
+    :return: Pointing table
+    :rtype: pandas.DataFrame
+    '''
+
+    import pyarrow.parquet as pq
+
+    selected = _select(pq.read_schema(path).names, columns)
+    return pq.read_table(path, columns=selected,
+                         memory_map=True).to_pandas()
+
+
+def read_arrow(path, columns=None):
+    '''
+    Read the pointing columns of an Arrow IPC (Feather v2) file
+
+    :param path: Arrow file
+    :type path: str
+    :param columns: Columns to load, see `read_pointings`
+    :type columns: list, optional
+    :return: Pointing table
+    :rtype: pandas.DataFrame
+    '''
+
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    with pa.memory_map(path) as source:
+        names = pa.ipc.open_file(source).schema.names
+
+    selected = _select(names, columns)
+    return feather.read_table(path, columns=selected,
+                              memory_map=True).to_pandas()
+
+
+def read_fits(path, columns=None, hdu=1):
+    '''
+    Read the pointing columns of a FITS binary table
+
+    :param path: FITS file
+    :type path: str
+    :param columns: Columns to load, see `read_pointings`
+    :type columns: list, optional
+    :param hdu: HDU holding the table, defaults to 1
+    :type hdu: int or str, optional
+    :return: Pointing table
+    :rtype: pandas.DataFrame
+    '''
+
+    from astropy.io import fits
+
+    with fits.open(path, memmap=True) as hdul:
+        data = hdul[hdu].data
+        selected = _select(data.columns.names, columns)
+
+        table = {}
+        for name in selected:
+            values = np.asarray(data[name])
+            if values.dtype.kind in 'SU':
+                values = np.char.strip(values.astype(str)).astype(object)
+            else:
+                # FITS is big-endian, pandas wants native byte order
+                values = values.astype(values.dtype.newbyteorder('='))
+            table[name] = values
+
+    return pd.DataFrame(table, columns=selected)
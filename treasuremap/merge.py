@@ -0,0 +1,180 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from .table import PointingTable
+
+
+# Depths are 5 sigma limits, so the noise of stacked exposures adds in
+# quadrature: 10**(0.8 m) for magnitudes and f**-2 for fluxes
+MAGNITUDES = ('ab_mag', 'vega_mag')
+FLUXES = ('flux_erg', 'flux_jy')
+
+
+def cluster(ra, dec, time, radius, window=None, groups=None):
+    '''
+    Label pointings that lie within `radius` of each other in space and
+    `window` in time
+
+    Close pairs come from a k-d tree on unit vectors and clusters are
+    the connected components of those pairs, so chains of pointings
+    that are each close to the next end up in one cluster.
+
+    :param ra: Right Ascension in degrees
+    :type ra: array-like
+    :param dec: Declination in degrees
+    :type dec: array-like
+    :param time: Observation times
+    :type time: array-like of datetime64
+    :param radius: Largest separation in degrees
+    :type radius: float
+    :param window: Largest time difference in seconds, defaults to None
+        for no limit
+    :type window: float, optional
+    :param groups: Labels of pointings that may never be merged with one
+        another, e.g. depth unit codes, defaults to None
+    :type groups: array-like, optional
+    :return: Cluster of each pointing, numbered in order of first member
+    :rtype: numpy.ndarray of int
+    '''
+
+    ra = np.radians(np.asarray(ra, dtype=float))
+    dec = np.radians(np.asarray(dec, dtype=float))
+    n = len(ra)
+    if n == 0:
+        return np.zeros(0, dtype=int)
+
+    vectors = np.column_stack([np.cos(dec) * np.cos(ra),
+                               np.cos(dec) * np.sin(ra),
+                               np.sin(dec)])
+    tree = cKDTree(vectors)
+    pairs = tree.query_pairs(2 * np.sin(np.radians(radius) / 2),
+                             output_type='ndarray')
+
+    keep = np.ones(len(pairs), dtype=bool)
+    if window is not None:
+        ms = np.asarray(time, dtype='datetime64[ms]').astype(np.int64)
+        keep &= np.abs(ms[pairs[:, 0]] - ms[pairs[:, 1]]) <= window * 1000
+    if groups is not None:
+        groups = np.asarray(groups)
+        keep &= groups[pairs[:, 0]] == groups[pairs[:, 1]]
+    pairs = pairs[keep]
+
+    graph = coo_matrix((np.ones(len(pairs), dtype=np.int8),
+                        (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+
+    # Renumber so clusters keep the order of the input
+    _, first, inverse = np.unique(labels, return_index=True,
+                                  return_inverse=True)
+    order = np.argsort(np.argsort(first))
+    return order[inverse.ravel()]
+
+
+def combine_depths(depth, depth_unit, labels):
+    '''
+    Combined depth of each cluster of pointings
+
+    Magnitudes combine as m = 1.25 log10(sum 10**(0.8 m_i)) and fluxes
+    as f = (sum f_i**-2)**-0.5. Missing depths are ignored; a cluster
+    with none has a missing depth. Pointings alone in their cluster
+    keep their depth whatever its unit.
+
+    :param depth: Pointing depths
+    :type depth: array-like
+    :param depth_unit: Depth unit of each pointing, the same within
+        each cluster
+    :type depth_unit: array-like of str
+    :param labels: Cluster of each pointing, from 0 to nclusters - 1
+    :type labels: array-like of int
+    :return: Depth per cluster
+    :rtype: numpy.ndarray
+    '''
+
+    depth = np.asarray(depth, dtype=float)
+    depth_unit = np.asarray(depth_unit, dtype=object)
+    labels = np.asarray(labels)
+    nclusters = labels.max() + 1 if len(labels) else 0
+
+    size = np.bincount(labels, minlength=nclusters)
+    single = size[labels] == 1
+
+    magnitude = np.isin(depth_unit, MAGNITUDES)
+    flux = np.isin(depth_unit, FLUXES)
+    unknown = ~(magnitude | flux | single)
+    if unknown.any():
+        raise ValueError("Cannot combine depths in {}, use one of {}".format(
+            sorted(set(depth_unit[unknown])), list(MAGNITUDES + FLUXES)))
+
+    with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+        weight = np.where(magnitude, 10 ** (0.8 * depth), depth ** -2.0)
+    present = ~np.isnan(weight) & ~single
+
+    total = np.bincount(labels[present], weights=weight[present],
+                        minlength=nclusters)
+    count = np.bincount(labels[present], minlength=nclusters)
+
+    cluster_magnitude = np.zeros(nclusters, dtype=bool)
+    cluster_magnitude[labels[magnitude]] = True
+
+    with np.errstate(divide='ignore'):
+        combined = np.where(cluster_magnitude, 1.25 * np.log10(total),
+                            total ** -0.5)
+    combined[count == 0] = np.nan
+
+    # Lone pointings keep their depth as it was
+    combined[labels[single]] = depth[single]
+    return combined
+
+
+def merge_table(table, radius, window=None):
+    '''
+    Collapse clusters of nearby pointings in a `PointingTable`
+
+    Each cluster becomes one pointing at the mean position of its
+    members, with the time and position angle of its earliest member
+    and the combined depth. Pointings with different depth units are
+    never merged.
+
+    :param table: Pointings to merge
+    :type table: PointingTable
+    :param radius: Largest separation in degrees
+    :type radius: float
+    :param window: Largest time difference in seconds, defaults to None
+        for no limit
+    :type window: float, optional
+    :return: Merged table and the cluster of each original pointing
+    :rtype: tuple of (PointingTable, numpy.ndarray)
+    '''
+
+    labels = cluster(table.ra, table.dec, table.time, radius, window,
+                     groups=table.unit)
+    if len(labels) == 0:
+        return table.take(slice(0, 0)), labels
+    nclusters = labels.max() + 1
+
+    a, d = np.radians(table.ra), np.radians(table.dec)
+    x = np.bincount(labels, np.cos(d) * np.cos(a), nclusters)
+    y = np.bincount(labels, np.cos(d) * np.sin(a), nclusters)
+    z = np.bincount(labels, np.sin(d), nclusters)
+    ra = np.degrees(np.arctan2(y, x)) % 360.0
+    dec = np.degrees(np.arctan2(z, np.hypot(x, y)))
+
+    # Lone pointings keep their position as it was
+    single = np.bincount(labels, minlength=nclusters)[labels] == 1
+    ra[labels[single]] = table.ra[single]
+    dec[labels[single]] = table.dec[single]
+
+    # Earliest member of each cluster
+    order = np.lexsort((table.time, labels))
+    starts = np.r_[0, np.flatnonzero(np.diff(labels[order])) + 1]
+    first = order[starts]
+
+    merged = PointingTable(capacity=nclusters)
+    merged.extend(ra, dec, table.time[first],
+                  combine_depths(table.depth, table.depth_unit, labels),
+                  table.depth_unit[first],
+                  table.pos_angle[first])
+
+    return merged, labels
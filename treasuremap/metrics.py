@@ -0,0 +1,370 @@
+import json
+import os
+import threading
+import time
+
+
+class Metrics:
+    '''
+    Counters and timing spans for the submission pipeline
+
+    Counters add up values such as pointings or bytes sent; spans time
+    stages such as reading, encoding or an HTTP round trip; gauges hold
+    the latest value of a level such as a queue depth. All take
+    optional labels. Finished spans are handed to each sink's `emit`
+    as they end, and `flush` hands a snapshot of all totals to each
+    sink's `flush`.
+
+    Instrumented code calls the module-level `count`, `span`, `gauge`
+    and `observe`, which do nothing until a registry is installed with
+    `enable`.
+
+    :param sinks: Objects with `emit(event)` and `flush(snapshot)`
+        methods, e.g. `JSONLinesSink` or `PrometheusSink`, defaults to
+        None
+    :type sinks: list, optional
+    '''
+
+    def __init__(self, sinks=None):
+        '''Constructor method
+        '''
+
+        self.sinks = list(sinks or [])
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.timings = {}
+        self.gauges = {}
+
+    def count(self, name, value=1, **labels):
+        '''
+        Add to a counter
+
+        :param name: Counter name
+        :type name: str
+        :param value: Amount to add, defaults to 1
+        :type value: int or float, optional
+        '''
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def span(self, name, **labels):
+        '''
+        Context manager timing one stage
+
+        :param name: Span name
+        :type name: str
+        :return: Span
+        :rtype: Span
+        '''
+
+        return Span(self, name, labels)
+
+    def gauge(self, name, value, **labels):
+        '''
+        Set a gauge
+
+        :param name: Gauge name
+        :type name: str
+        :param value: Current value
+        :type value: int or float
+        '''
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] = value
+
+    def observe(self, name, seconds, **labels):
+        '''
+        Record a duration measured elsewhere, such as the time from an
+        exposure to its acknowledgement, as a span ending now
+
+        :param name: Span name
+        :type name: str
+        :param seconds: Duration
+        :type seconds: float
+        '''
+
+        self.record(name, labels, time.time() - seconds, seconds)
+
+    def record(self, name, labels, start, duration):
+        '''
+        Record a finished span
+        '''
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = self.timings[key] = [0, 0.0, duration, duration]
+            timing[0] += 1
+            timing[1] += duration
+            timing[2] = min(timing[2], duration)
+            timing[3] = max(timing[3], duration)
+
+        if self.sinks:
+            event = {"type": "span", "name": name, "start": start,
+                     "duration": duration}
+            if labels:
+                event["labels"] = labels
+            for sink in self.sinks:
+                sink.emit(event)
+
+    def snapshot(self):
+        '''
+        Totals of all counters and spans
+
+        :return: `counters` and `gauges` as {name, labels, value} and
+            `timings` as {name, labels, count, total, min, max}, in
+            seconds
+        :rtype: dict
+        '''
+
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels),
+                         "value": value}
+                        for (name, labels), value in self.counters.items()]
+            timings = [{"name": name, "labels": dict(labels), "count": n,
+                        "total": total, "min": low, "max": high}
+                       for (name, labels), (n, total, low, high)
+                       in self.timings.items()]
+            gauges = [{"name": name, "labels": dict(labels), "value": value}
+                      for (name, labels), value in self.gauges.items()]
+
+        return {"time": time.time(), "counters": counters,
+                "timings": timings, "gauges": gauges}
+
+    def flush(self):
+        '''
+        Hand a snapshot to every sink
+        '''
+
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.flush(snapshot)
+        return snapshot
+
+
+class Span:
+    '''
+    Timing of one stage, see `Metrics.span`
+    '''
+
+    __slots__ = ('metrics', 'name', 'labels', 'start', '_t0')
+
+    def __init__(self, metrics, name, labels):
+        '''Constructor method
+        '''
+
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, self.labels, self.start,
+                            time.perf_counter() - self._t0)
+
+
+class _NullSpan:
+    '''
+    Span that does nothing, used while metrics are disabled
+    '''
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class JSONLinesSink:
+    '''
+    Write spans as they end and snapshots on flush, one JSON object per
+    line
+
+    :param path: File to append to
+    :type path: str
+    '''
+
+    def __init__(self, path):
+        '''Constructor method
+        '''
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+
+    def emit(self, event):
+        line = json.dumps(event) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def flush(self, snapshot):
+        line = json.dumps(dict(snapshot, type="snapshot")) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class PrometheusSink:
+    '''
+    Write snapshots in the Prometheus text format, for the node_exporter
+    textfile collector
+
+    The file is replaced atomically on each flush. Counters become
+    `<prefix>_<name>_total`, spans `<prefix>_<name>_seconds` summaries
+    with `_sum` and `_count` and gauges `<prefix>_<name>`.
+
+    :param path: Output file, conventionally ending in .prom
+    :type path: str
+    :param prefix: Metric name prefix, defaults to 'treasuremap'
+    :type prefix: str, optional
+    '''
+
+    def __init__(self, path, prefix='treasuremap'):
+        '''Constructor method
+        '''
+
+        self.path = path
+        self.prefix = prefix
+
+    def emit(self, event):
+        pass
+
+    def flush(self, snapshot):
+        lines = []
+        for name, series in _by_name(snapshot["counters"]):
+            metric = '{}_{}_total'.format(self.prefix, name)
+            lines.append('# TYPE {} counter'.format(metric))
+            for entry in series:
+                lines.append('{}{} {}'.format(
+                    metric, _labels(entry["labels"]), entry["value"]))
+
+        for name, series in _by_name(snapshot["timings"]):
+            metric = '{}_{}_seconds'.format(self.prefix, name)
+            lines.append('# TYPE {} summary'.format(metric))
+            for entry in series:
+                labels = _labels(entry["labels"])
+                lines.append('{}_sum{} {!r}'.format(metric, labels,
+                                                    entry["total"]))
+                lines.append('{}_count{} {}'.format(metric, labels,
+                                                    entry["count"]))
+
+        for name, series in _by_name(snapshot["gauges"]):
+            metric = '{}_{}'.format(self.prefix, name)
+            lines.append('# TYPE {} gauge'.format(metric))
+            for entry in series:
+                lines.append('{}{} {!r}'.format(
+                    metric, _labels(entry["labels"]), entry["value"]))
+
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, self.path)
+
+
+def _by_name(entries):
+    grouped = {}
+    for entry in entries:
+        grouped.setdefault(entry["name"], []).append(entry)
+    return sorted(grouped.items())
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in sorted(labels.items())) + '}'
+
+
+_NULL_SPAN = _NullSpan()
+_registry = None
+
+
+def enable(sinks=None):
+    '''
+    Start collecting metrics
+
+    :param sinks: Sinks for a new registry, see `Metrics`,
+        defaults to None
+    :type sinks: list, optional
+    :return: The registry now in use
+    :rtype: Metrics
+    '''
+
+    global _registry
+    _registry = Metrics(sinks)
+    return _registry
+
+
+def disable():
+    '''
+    Stop collecting metrics
+
+    :return: The registry that was in use, or None
+    :rtype: Metrics
+    '''
+
+    global _registry
+    registry, _registry = _registry, None
+    return registry
+
+
+def registry():
+    '''
+    The registry in use, or None while metrics are disabled
+    '''
+
+    return _registry
+
+
+def count(name, value=1, **labels):
+    '''
+    Add to a counter of the registry in use, if any
+    '''
+
+    if _registry is not None:
+        _registry.count(name, value, **labels)
+
+
+def span(name, **labels):
+    '''
+    Time a stage with the registry in use, if any
+
+    :return: Context manager
+    '''
+
+    if _registry is None:
+        return _NULL_SPAN
+    return _registry.span(name, **labels)
+
+
+def gauge(name, value, **labels):
+    '''
+    Set a gauge of the registry in use, if any
+    '''
+
+    if _registry is not None:
+        _registry.gauge(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    '''
+    Record a duration with the registry in use, if any
+    '''
+
+    if _registry is not None:
+        _registry.observe(name, seconds, **labels)
@@ -0,0 +1,409 @@
+import datetime
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .compression import ENCODINGS, decompress
+
+
+POINT_RE = re.compile(r'POINT\s*\(\s*\S+\s+[^\s)]+\s*\)')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    '''
+    Request handler for `MockTreasureMap`
+    '''
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.mock.lock:
+            self.server.mock.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            return self._read_chunked()
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length)
+
+    def _read_chunked(self):
+        pieces = []
+        while True:
+            size = int(self.rfile.readline().split(b';')[0], 16)
+            if size == 0:
+                # Skip any trailers up to the closing blank line
+                while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(pieces)
+            pieces.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    def _reply(self, code, data, headers=None):
+        self._reply_body(code, json.dumps(data).encode(), headers)
+
+    def _reply_body(self, code, body, headers=None):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        mock = self.server.mock
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        body = self._read_body()
+        encoding = self.headers.get('Content-Encoding')
+
+        with mock.lock:
+            mock.bytes_received += len(body)
+
+        if encoding is not None:
+            if encoding not in mock.encodings:
+                self._reply(415, {"message": "Unsupported Content-Encoding "
+                                             "{}".format(encoding)})
+                return
+            try:
+                body = decompress(body, encoding)
+            except Exception as e:
+                self._reply(400, {"message": "Cannot decode {} body: {!r}"
+                                             .format(encoding, e)})
+                return
+
+        with mock.lock:
+            mock.requests.append((url.path, params, body))
+
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        if mock.fail():
+            headers = {}
+            if mock.retry_after is not None:
+                headers['Retry-After'] = str(mock.retry_after)
+            self._reply(mock.error_status, {"message": "Service unavailable"},
+                        headers)
+            return
+
+        target = url.path[len(mock.prefix):].strip('/')
+
+        if target == 'pointings':
+            reply = mock.add_pointings(json.loads(body))
+            if mock.fail_after():
+                # The pointings are stored, but the client never hears
+                self._reply(500, {"message": "Internal server error"})
+                return
+            self._reply(*reply)
+        elif target == 'updated_pointings':
+            self._reply(*mock.update_pointings(params))
+        elif target == 'cancel_all':
+            self._reply(*mock.cancel_all(params))
+        else:
+            self._reply(404, {"message": "Unknown endpoint"})
+
+    def do_GET(self):
+        mock = self.server.mock
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+
+        with mock.lock:
+            mock.requests.append((url.path, params, b''))
+
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        if mock.fail():
+            headers = {}
+            if mock.retry_after is not None:
+                headers['Retry-After'] = str(mock.retry_after)
+            self._reply(mock.error_status, {"message": "Service unavailable"},
+                        headers)
+            return
+
+        target = url.path[len(mock.prefix):].strip('/')
+
+        if target == 'pointings':
+            data = mock.get_pointings(params)
+        elif target == 'instruments':
+            data = mock.get_instruments(params)
+        elif target == 'footprints':
+            data = mock.get_footprints(params)
+        else:
+            self._reply(404, {"message": "Unknown endpoint"})
+            return
+
+        body = json.dumps(data).encode()
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self._reply_body(200, body, {'ETag': etag})
+
+
+class MockTreasureMap:
+    '''
+    Local stand-in for the Treasure Map API, served from a background
+    thread
+
+    It implements the `pointings`, `updated_pointings` and `cancel_all`
+    endpoints, keeps the submitted pointings in memory and counts the
+    TCP connections opened by clients. GET requests to `pointings`,
+    `instruments` and `footprints` are answered from memory with an
+    ETag, and with HTTP 304 if the client already holds that version.
+    Request bodies in one of `encodings` are decompressed before they
+    are recorded; other Content-Encodings get HTTP 415. Pointings
+    without a valid status, position or time are rejected and listed
+    in `ERRORS` as the real API does.
+
+    :param host: Interface to listen on, defaults to '127.0.0.1'
+    :type host: str, optional
+    :param port: Port to listen on, defaults to 0 for any free port
+    :type port: int, optional
+    :param latency: Seconds to wait before answering each request,
+        defaults to 0.0
+    :type latency: float, optional
+    :param error_rate: Fraction of requests answered with
+        `error_status` before they are processed, defaults to 0.0
+    :type error_rate: float, optional
+    :param error_status: HTTP status of those answers, defaults to 503
+    :type error_status: int, optional
+    :param late_error_rate: Fraction of pointing submissions answered
+        with HTTP 500 after their pointings were stored, defaults to 0.0
+    :type late_error_rate: float, optional
+    :param retry_after: Retry-After value sent with the error responses,
+        defaults to None
+    :type retry_after: float, optional
+    :param seed: Seed for choosing which requests fail, defaults to None
+    :type seed: int, optional
+    :param encodings: Content-Encodings accepted for request bodies,
+        defaults to gzip and zstd
+    :type encodings: tuple, optional
+    '''
+
+    prefix = '/api/v0'
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0,
+                 error_rate=0.0, retry_after=None, seed=None,
+                 encodings=ENCODINGS, error_status=503,
+                 late_error_rate=0.0):
+        '''Constructor method
+        '''
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.late_error_rate = late_error_rate
+        self.retry_after = retry_after
+        self.encodings = encodings
+        self._random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.bytes_received = 0
+        self.requests = []
+        self.pointings = {}
+        self._ids = itertools.count(1)
+        self.instruments = {
+            38: {"id": 38, "instrument_name": "Dark Energy Camera",
+                 "nickname": "DECam", "instrument_type": "photometric"}}
+        self.footprints = {
+            38: ["POLYGON((-1.1 -1.1, 1.1 -1.1, 1.1 1.1, -1.1 1.1, "
+                 "-1.1 -1.1))"]}
+
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        '''
+        Base URL to pass to `Pointings`
+        '''
+
+        host, port = self.httpd.server_address[:2]
+        return 'http://{}:{}{}'.format(host, port, self.prefix)
+
+    def start(self):
+        '''
+        Start serving in a daemon thread
+        '''
+
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        '''
+        Stop serving and close the listening socket
+        '''
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def fail(self):
+        '''
+        Whether to answer the current request with an error
+        '''
+
+        if not self.error_rate:
+            return False
+        with self.lock:
+            return self._random.random() < self.error_rate
+
+    def fail_after(self):
+        '''
+        Whether to answer a processed submission with an error
+        '''
+
+        if not self.late_error_rate:
+            return False
+        with self.lock:
+            return self._random.random() < self.late_error_rate
+
+    def add_pointings(self, data):
+        pointings = data.get("pointings", [])
+        ids = []
+        errors = []
+        with self.lock:
+            for pointing in pointings:
+                reasons = _validate(pointing)
+                if reasons:
+                    errors.append(["Object: " + json.dumps(pointing),
+                                   reasons])
+                    continue
+                pointing_id = next(self._ids)
+                record = dict(pointing, id=pointing_id,
+                              graceid=data.get("graceid"))
+                self.pointings[pointing_id] = record
+                ids.append(pointing_id)
+
+        return 200, {"pointing_ids": ids, "ERRORS": errors, "WARNINGS": []}
+
+    def update_pointings(self, params):
+        ids = json.loads(params.get("ids", "[]"))
+        updated = []
+        with self.lock:
+            for pointing_id in ids:
+                if pointing_id in self.pointings:
+                    self.pointings[pointing_id]["status"] = params["status"]
+                    updated.append(pointing_id)
+
+        return 200, {"message": "Updated {} Pointings successfully".format(
+            len(updated)), "updated_pointings": updated}
+
+    def cancel_all(self, params):
+        cancelled = 0
+        with self.lock:
+            for record in self.pointings.values():
+                if (record.get("graceid") == params.get("graceid") and
+                        str(record.get("instrumentid")) ==
+                        params.get("instrumentid") and
+                        record.get("status") == "planned"):
+                    record["status"] = "cancelled"
+                    cancelled += 1
+
+        return 200, {"message": "Successfully cancelled {} Pointings".format(
+            cancelled)}
+
+    def get_pointings(self, params):
+        status = params.get("status")
+        after = before = None
+        if status is not None and status + "_after" in params:
+            after = _parse_time(params[status + "_after"])
+        if status is not None and status + "_before" in params:
+            before = _parse_time(params[status + "_before"])
+
+        with self.lock:
+            records = list(self.pointings.values())
+
+        selected = []
+        for record in records:
+            if "graceid" in params and record.get("graceid") != params["graceid"]:
+                continue
+            if status is not None and record.get("status") != status:
+                continue
+            if "band" in params and record.get("band") != params["band"]:
+                continue
+            if ("instrument" in params and
+                    str(record.get("instrumentid")) != params["instrument"]):
+                continue
+            if after is not None or before is not None:
+                when = _parse_time(record["time"])
+                if ((after is not None and when < after) or
+                        (before is not None and when > before)):
+                    continue
+            selected.append(record)
+
+        return selected
+
+    def get_instruments(self, params):
+        selected = []
+        for instrument in self.instruments.values():
+            if "id" in params and str(instrument["id"]) != params["id"]:
+                continue
+            if "name" in params and params["name"] not in (
+                    instrument["instrument_name"], instrument["nickname"]):
+                continue
+            if ("type" in params and
+                    instrument["instrument_type"] != params["type"]):
+                continue
+            selected.append(instrument)
+
+        return selected
+
+    def get_footprints(self, params):
+        selected = []
+        for instrument in self.get_instruments(params):
+            for footprint in self.footprints.get(instrument["id"], []):
+                selected.append({"instrumentid": instrument["id"],
+                                 "footprint": footprint})
+
+        return selected
+
+
+def _parse_time(value):
+    return datetime.datetime.fromisoformat(value)
+
+
+def _validate(pointing):
+    '''
+    Reasons the real API would reject a pointing, empty if it is valid
+    '''
+
+    reasons = []
+    if pointing.get("status") not in ("planned", "completed"):
+        reasons.append("Invalid status")
+    if not POINT_RE.fullmatch(str(pointing.get("position", ""))):
+        reasons.append("Invalid position")
+    try:
+        _parse_time(pointing["time"])
+    except (KeyError, TypeError, ValueError):
+        reasons.append("Invalid time format. Required format is "
+                       "%Y-%m-%dT%H:%M:%S.%f")
+    return reasons
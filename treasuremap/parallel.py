@@ -0,0 +1,257 @@
+import concurrent.futures
+import contextlib
+import json
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import metrics
+from .journal import SubmissionJournal
+from .table import PointingTable
+
+
+# PointingTable columns copied to shared memory
+COLUMNS = ('_ra', '_dec', '_time', '_depth', '_pos_angle', '_unit')
+
+# Fewest rows worth a process pool. Starting the pool and copying the
+# tables to shared memory costs 30-50 ms with fork and several times that
+# with spawn, and the bodies are pickled back; against about 7 us per row
+# to encode in-process, smaller jobs came out slower with the pool even
+# on several cores (see benchmarks/bench_parallel.py)
+MIN_ROWS = 50000
+
+
+def share_table(table):
+    '''
+    Copy the columns of a `PointingTable` into one shared memory block
+
+    :param table: Table to share
+    :type table: PointingTable
+    :return: The block, which the caller must close and unlink, and a
+        picklable description of it for `attach_table`
+    :rtype: tuple of (multiprocessing.shared_memory.SharedMemory, dict)
+    '''
+
+    n = len(table)
+    layout = []
+    offset = 0
+    for name in COLUMNS:
+        column = getattr(table, name)[:n]
+        layout.append((name, column.dtype.str, offset))
+        # Keep every column 8-byte aligned
+        offset += -(-column.nbytes // 8) * 8
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, dtype, start in layout:
+        column = getattr(table, name)[:n]
+        np.ndarray(n, dtype, shm.buf, start)[:] = column
+
+    return shm, {'name': shm.name, 'n': n, 'layout': layout,
+                 'units': list(table.units)}
+
+
+@contextlib.contextmanager
+def attach_table(spec):
+    '''
+    `PointingTable` whose columns are views of a block made by
+    `share_table`, valid inside the `with` block only
+    '''
+
+    shm = shared_memory.SharedMemory(name=spec['name'])
+    table = PointingTable(capacity=0)
+    try:
+        for name, dtype, start in spec['layout']:
+            setattr(table, name, np.ndarray(spec['n'], dtype, shm.buf, start))
+        table._n = spec['n']
+        table.units = list(spec['units'])
+        table._unit_codes = {unit: code for code, unit in
+                             enumerate(table.units)}
+        yield table
+    finally:
+        # The views must go before the block can be closed
+        for name in COLUMNS:
+            setattr(table, name, None)
+        shm.close()
+
+
+def _fields(p):
+    return {'graceid': p.graceid, 'api_token': p.api_token,
+            'status': p.status, 'instrumentid': p.instrumentid,
+            'band': p.band, 'coord_decimals': p.coord_decimals,
+            'depth_decimals': p.depth_decimals}
+
+
+def _records(table, fields, index):
+    return table.records(fields['status'], fields['instrumentid'],
+                         fields['band'], index,
+                         coord_decimals=fields['coord_decimals'],
+                         depth_decimals=fields['depth_decimals'])
+
+
+def _keys(table, fields, start, stop):
+    return [SubmissionJournal.key(fields['graceid'], record)
+            for record in _records(table, fields, slice(start, stop))]
+
+
+def _bodies(table, fields, indexes):
+    # Encoded as Pointings.post_pointings does, in one json.dumps call
+    return [json.dumps({"graceid": fields['graceid'],
+                        "api_token": fields['api_token'],
+                        "pointings": list(_records(table, fields, index))},
+                       allow_nan=False, separators=(',', ':')).encode()
+            for index in indexes]
+
+
+def _keys_task(spec, fields, start, stop):
+    with attach_table(spec) as table:
+        return _keys(table, fields, start, stop)
+
+
+def _encode_task(spec, fields, indexes):
+    with attach_table(spec) as table:
+        return _bodies(table, fields, indexes)
+
+
+def _ranges(n, size):
+    return [(start, min(start + size, n)) for start in range(0, n, size)]
+
+
+def prepare_chunks(pointings, chunk_size=500, processes=None, journal=None,
+                   chunks_per_task=8, min_rows=MIN_ROWS):
+    '''
+    Encode the chunk payloads of several `Pointings` in a process pool
+
+    Each table is copied once into shared memory, which the workers
+    read directly; only row ranges go to the workers and only the
+    encoded JSON bodies come back. The bodies are the same bytes
+    `Pointings.post_pointings` would send for each chunk.
+
+    With a `journal`, the workers first compute the key of every row
+    so that rows the journal holds are left out, as in `submit_many`.
+
+    No more workers than CPUs are started. With fewer than `min_rows`
+    rows in all, or a single worker, the pool would cost more than it
+    saves and the payloads are encoded in this process instead.
+
+    :param pointings: Pointings to encode
+    :type pointings: list of Pointings
+    :param chunk_size: Maximum number of pointings per payload,
+        defaults to 500
+    :type chunk_size: int, optional
+    :param processes: Number of worker processes, defaults to the
+        number of CPUs
+    :type processes: int, optional
+    :param journal: Journal of acknowledged pointings, defaults to None
+    :type journal: SubmissionJournal, optional
+    :param chunks_per_task: Chunks encoded per worker task, defaults
+        to 8
+    :type chunks_per_task: int, optional
+    :param min_rows: Fewest rows encoded in a pool, defaults to
+        `MIN_ROWS`
+    :type min_rows: int, optional
+    :return: One (pointings, resumed keys, chunks) per `Pointings`,
+        where each chunk is (start, stop, body, keys) and keys is None
+        without a journal
+    :rtype: list of tuple
+    '''
+
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    cpus = os.cpu_count() or 1
+    if processes is None:
+        processes = cpus
+    processes = min(processes, cpus)
+
+    if processes < 2 or sum(len(p) for p in pointings) < min_rows:
+        return [_prepare_here(p, chunk_size, journal) for p in pointings]
+
+    shared = []
+    try:
+        for p in pointings:
+            shared.append(share_table(p.table))
+
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            keys = [None] * len(pointings)
+            if journal is not None:
+                with metrics.span("prepare_keys"):
+                    futures = [[executor.submit(_keys_task, spec, _fields(p),
+                                                start, stop)
+                                for start, stop in _ranges(
+                                    len(p), chunk_size * chunks_per_task)]
+                               for p, (shm, spec) in zip(pointings, shared)]
+                    keys = [[key for future in band for key in future.result()]
+                            for band in futures]
+
+            pending = []
+            for p, (shm, spec), band_keys in zip(pointings, shared, keys):
+                resumed, indexes = _split(p, band_keys, journal, chunk_size)
+                tasks = [executor.submit(_encode_task, spec, _fields(p),
+                                         indexes[n:n + chunks_per_task])
+                         for n in range(0, len(indexes), chunks_per_task)]
+                pending.append((p, resumed, band_keys, indexes, tasks))
+
+            prepared = []
+            with metrics.span("prepare_encode"):
+                for p, resumed, band_keys, indexes, tasks in pending:
+                    bodies = [body for task in tasks
+                              for body in task.result()]
+                    prepared.append((p, resumed, _chunks(indexes, bodies,
+                                                         band_keys)))
+    finally:
+        for shm, spec in shared:
+            shm.close()
+            shm.unlink()
+
+    return prepared
+
+
+def _prepare_here(p, chunk_size, journal):
+    '''
+    What `prepare_chunks` gives for one `Pointings`, encoded in this
+    process
+    '''
+
+    fields = _fields(p)
+    band_keys = None
+    if journal is not None:
+        band_keys = _keys(p.table, fields, 0, len(p))
+    resumed, indexes = _split(p, band_keys, journal, chunk_size)
+    return p, resumed, _chunks(indexes, _bodies(p.table, fields, indexes),
+                               band_keys)
+
+
+def _split(p, band_keys, journal, chunk_size):
+    '''
+    Keys the journal already holds and row indexes of each chunk of the
+    rest, for `prepare_chunks` and `submit_many` alike
+    '''
+
+    if band_keys is None:
+        resumed = []
+        todo = np.arange(len(p))
+    else:
+        resumed = [key for key in band_keys if key in journal]
+        todo = np.array([i for i, key in enumerate(band_keys)
+                         if key not in journal], dtype=np.intp)
+        if resumed:
+            p.logger.info("Skipping {} pointings already "
+                          "acknowledged".format(len(resumed)))
+
+    return resumed, [todo[start:stop]
+                     for start, stop in _ranges(len(todo), chunk_size)]
+
+
+def _chunks(indexes, bodies, band_keys):
+    '''
+    (start, stop, body, keys) per chunk, where a body is an encoded
+    payload or, from `submit_many`, a payload dict
+    '''
+
+    chunks = []
+    for index, body in zip(indexes, bodies):
+        chunk_keys = None
+        if band_keys is not None:
+            chunk_keys = [band_keys[i] for i in index]
+        chunks.append((int(index[0]), int(index[-1]) + 1, body, chunk_keys))
+    return chunks
@@ -0,0 +1,141 @@
+import logging
+import queue
+import threading
+
+from . import metrics
+from .treasuremap import pointings_from_frame, submit_many
+
+
+logger = logging.getLogger('treasuremap.pipeline')
+
+# Put on the queue after the last batch
+_DONE = object()
+
+
+def stream_submit(source, graceid, api_token=None, status=None,
+                  instrumentid=None, chunk_size=500, max_workers=4,
+                  queue_size=4, journal=None, **kwargs):
+    '''
+    Submit the pointings of a source while it is still being read
+
+    A reader thread takes batches from the source and puts them on a
+    queue of at most `queue_size` batches, blocking while it is full,
+    so a slow upload holds the reader back instead of letting batches
+    pile up in memory. Each batch is submitted with `submit_many` as
+    soon as it is taken off the queue, while the next ones are read.
+
+    :param source: Source of pointing tables, or any iterable of them
+    :type source: sources.Source or iterable of pandas.DataFrame
+    :param graceid: Event ID in GraceDB
+    :type graceid: str
+    :param api_token: Treasuremap API token, defaults to None
+    :type api_token: str, optional
+    :param status: Observing status, defaults to the source's
+    :type status: str, optional
+    :param instrumentid: Instrument ID, defaults to the source's
+    :type instrumentid: int, optional
+    :param chunk_size: Maximum number of pointings per request,
+        defaults to 500
+    :type chunk_size: int, optional
+    :param max_workers: Maximum number of requests in flight,
+        defaults to 4
+    :type max_workers: int, optional
+    :param queue_size: Maximum number of batches read ahead, defaults
+        to 4
+    :type queue_size: int, optional
+    :param journal: Journal of acknowledged pointings, defaults to None
+    :type journal: SubmissionJournal, optional
+    :param kwargs: Other `Pointings` arguments, such as `base_url`
+    :return: Totals with the number of `batches` and `pointings` read,
+        the `pointing_ids` accepted, the number of pointings `resumed`
+        from the journal and the number in `failed` chunks
+    :rtype: dict
+    '''
+
+    if status is None:
+        status = getattr(source, 'status', 'completed')
+    if instrumentid is None:
+        instrumentid = getattr(source, 'instrumentid', None)
+    if instrumentid is None:
+        raise ValueError("instrumentid is needed for a source without one")
+    if queue_size < 1:
+        raise ValueError("queue_size must be at least 1")
+
+    batches = queue.Queue(queue_size)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read, args=(source, batches, stop),
+                              name='treasuremap-source', daemon=True)
+    reader.start()
+
+    totals = {"batches": 0, "pointings": 0, "pointing_ids": [],
+              "resumed": 0, "failed": 0}
+    try:
+        while True:
+            with metrics.span("wait_source"):
+                batch = batches.get()
+            if batch is _DONE:
+                break
+            if isinstance(batch, BaseException):
+                raise batch
+
+            totals["batches"] += 1
+            totals["pointings"] += len(batch)
+            if not len(batch):
+                continue
+
+            pointings = pointings_from_frame(batch, status, graceid,
+                                             instrumentid, api_token,
+                                             **kwargs)
+            for result in submit_many(list(pointings.values()), chunk_size,
+                                      max_workers, journal):
+                totals["pointing_ids"].extend(result["pointing_ids"])
+                totals["resumed"] += result["resumed"]
+                totals["failed"] += sum(f["count"] for f in result["failed"])
+
+            logger.info("Batch {}: {} pointings submitted, {} accepted so "
+                        "far".format(totals["batches"], len(batch),
+                                     len(totals["pointing_ids"])))
+    finally:
+        stop.set()
+        reader.join()
+
+    return totals
+
+
+def _read(source, batches, stop):
+    '''
+    Reader thread of `stream_submit`
+    '''
+
+    try:
+        source = iter(source)
+        for batch in source:
+            metrics.count("batches_read")
+            with metrics.span("wait_upload"):
+                if not _put(batches, batch, stop):
+                    return
+    except BaseException as e:
+        _put(batches, e, stop)
+    else:
+        _put(batches, _DONE, stop)
+    finally:
+        # Lets a source generator close its connection or file now
+        if hasattr(source, 'close'):
+            source.close()
+
+
+def _put(batches, item, stop):
+    '''
+    Put `item` on the queue, waiting for room unless `stop` is set
+
+    :return: Whether the item was put
+    :rtype: bool
+    '''
+
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
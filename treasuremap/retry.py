@@ -0,0 +1,173 @@
+import email.utils
+import itertools
+import logging
+import random
+import time
+
+from . import metrics
+from .exceptions import TreasureMapError
+
+
+class RetryPolicy:
+    '''
+    Retry transient request failures with jittered exponential backoff
+
+    Connection errors, timeouts and responses with a status in
+    `statuses` are retried. The wait before retry `n` is drawn uniformly
+    from [0, min(`max_backoff`, `backoff` * 2 ** n)], unless the server
+    sent a Retry-After header, which is honoured instead.
+
+    Requests that are not idempotent, such as posting pointings, are
+    only retried when the server cannot have processed them: when no
+    connection could be made, or on a status in `unsent_statuses`. A
+    read timeout or a dropped connection raises a `TreasureMapError`
+    marked `uncertain` straight away, since sending the request again
+    could store its pointings twice.
+
+    :param retries: Maximum number of retries, defaults to 5
+    :type retries: int, optional
+    :param backoff: Base backoff in seconds, defaults to 0.5
+    :type backoff: float, optional
+    :param max_backoff: Cap on a single wait in seconds, defaults to 30.0
+    :type max_backoff: float, optional
+    :param statuses: HTTP statuses to retry, defaults to 429 and 5xx
+        gateway/availability errors
+    :type statuses: tuple, optional
+    :param unsent_statuses: HTTP statuses to retry requests that are not
+        idempotent on, for which the server did not process the request,
+        defaults to 429 and 503
+    :type unsent_statuses: tuple, optional
+    '''
+
+    def __init__(self, retries=5, backoff=0.5, max_backoff=30.0,
+                 statuses=(429, 500, 502, 503, 504),
+                 unsent_statuses=(429, 503)):
+        '''Constructor method
+        '''
+
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+        self.unsent_statuses = unsent_statuses
+        self.logger = logging.getLogger('treasuremap.RetryPolicy')
+
+    def delay(self, attempt, retry_after=None):
+        '''
+        Seconds to wait before the next attempt
+
+        :param attempt: Number of attempts made so far, minus one
+        :type attempt: int
+        :param retry_after: Value of the Retry-After header, defaults to None
+        :type retry_after: str, optional
+        :return: Wait in seconds
+        :rtype: float
+        '''
+
+        if retry_after is not None:
+            wait = parse_retry_after(retry_after)
+            if wait is not None:
+                return min(wait, self.max_backoff)
+
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def call(self, send, idempotent=True):
+        '''
+        Call `send` until it succeeds or the retries run out
+
+        :param send: Function making the request and returning a
+            `requests.Response`
+        :type send: callable
+        :param idempotent: Whether the request can safely be made twice,
+            defaults to True
+        :type idempotent: bool, optional
+        :return: The last response received
+        :rtype: requests.Response
+        :raises TreasureMapError: If the last attempt raised a connection
+            error or timeout, or a request that is not idempotent may
+            have reached the server
+        '''
+
+        # Only loaded once a request is actually made
+        import requests
+
+        if idempotent:
+            statuses = self.statuses
+        else:
+            statuses = self.unsent_statuses
+
+        for attempt in itertools.count():
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not (idempotent or not_sent(e)):
+                    raise TreasureMapError(
+                        "Request failed after it may have been processed, "
+                        "not retrying: {!r}".format(e), uncertain=True) from e
+                if attempt >= self.retries:
+                    raise TreasureMapError(
+                        "Request failed after {} attempts: {!r}".format(
+                            attempt + 1, e)) from e
+                wait = self.delay(attempt)
+                reason = repr(e)
+            else:
+                if (response.status_code not in statuses or
+                        attempt >= self.retries):
+                    return response
+                wait = self.delay(attempt,
+                                  response.headers.get('Retry-After'))
+                reason = "HTTP {}".format(response.status_code)
+
+            self.logger.warning("Attempt {} failed ({}), retrying in {:.2f} s"
+                                .format(attempt + 1, reason, wait))
+            metrics.count("retries")
+            time.sleep(wait)
+
+
+def not_sent(error):
+    '''
+    Whether a request that raised `error` certainly never reached the
+    server, because no connection could be made
+
+    :param error: Exception raised by `requests`
+    :type error: requests.RequestException
+    :return: True if the request was not sent
+    :rtype: bool
+    '''
+
+    import requests
+    from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.Timeout):
+        return False
+
+    # requests wraps urllib3's MaxRetryError, whose reason is the failure
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, (ConnectTimeoutError, NewConnectionError))
+
+
+def parse_retry_after(value):
+    '''
+    Parse a Retry-After header given in seconds or as an HTTP date
+
+    :param value: Header value
+    :type value: str
+    :return: Seconds to wait, or None if the value cannot be parsed
+    :rtype: float
+    '''
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, when.timestamp() - time.time())
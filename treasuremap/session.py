@@ -0,0 +1,104 @@
+import threading
+
+
+# Seconds to wait for a connection and for the server to answer, as
+# passed to requests' `timeout`
+TIMEOUT = (10.0, 120.0)
+
+_lock = threading.Lock()
+_session = None
+
+
+def make_session(pool_connections=4, pool_maxsize=16, adapter=None):
+    '''
+    Make a `requests.Session` with a pooled transport adapter
+
+    Connections are kept alive and reused for every request made with
+    the session, up to `pool_maxsize` connections per host.
+
+    :param pool_connections: Number of host pools to cache, defaults to 4
+    :type pool_connections: int, optional
+    :param pool_maxsize: Connections kept alive per host, defaults to 16
+    :type pool_maxsize: int, optional
+    :param adapter: Transport adapter to mount instead of the default
+        `HTTPAdapter`, defaults to None
+    :type adapter: requests.adapters.BaseAdapter, optional
+    :return: Configured session
+    :rtype: requests.Session
+    '''
+
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    if adapter is None:
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Connection'] = 'keep-alive'
+
+    return session
+
+
+def configure_session(pool_connections=4, pool_maxsize=16,
+                      adapter=None, session=None):
+    '''
+    Replace the session shared by all `Pointings` in this process
+
+    :param pool_connections: Number of host pools to cache, defaults to 4
+    :type pool_connections: int, optional
+    :param pool_maxsize: Connections kept alive per host, defaults to 16
+    :type pool_maxsize: int, optional
+    :param adapter: Transport adapter to mount, defaults to None
+    :type adapter: requests.adapters.BaseAdapter, optional
+    :param session: Use this session as is instead of making one,
+        defaults to None
+    :type session: requests.Session, optional
+    :return: The new shared session
+    :rtype: requests.Session
+    '''
+
+    global _session
+
+    if session is None:
+        session = make_session(pool_connections, pool_maxsize, adapter)
+
+    with _lock:
+        old, _session = _session, session
+
+    if old is not None and old is not session:
+        old.close()
+
+    return session
+
+
+def get_session():
+    '''
+    Get the shared session, making it on first use
+
+    :return: Shared session
+    :rtype: requests.Session
+    '''
+
+    global _session
+
+    with _lock:
+        if _session is None:
+            _session = make_session()
+        return _session
+
+
+def close_session():
+    '''
+    Close the shared session and its pooled connections
+    '''
+
+    global _session
+
+    with _lock:
+        old, _session = _session, None
+
+    if old is not None:
+        old.close()
@@ -0,0 +1,229 @@
+import abc
+
+import pandas as pd
+
+from . import decam, metrics
+from .loaders import DTYPES, _select, guess_format, read_pointings
+
+
+class Source(abc.ABC):
+    '''
+    Base class of the adapters feeding pointing tables to
+    `pipeline.stream_submit`
+
+    A source reads its rows in batches, each a DataFrame with the
+    `loaders.COLUMNS` (`ra`, `dec`, `time`, `band`, `depth` and
+    `depth_unit`) and optionally `pos_angle`. Subclasses implement
+    `batches`, which is run in the pipeline's reader thread, so any
+    connection has to be opened there.
+
+    :param status: Observing status of the pointings, defaults to
+        'completed'
+    :type status: str, optional
+    :param instrumentid: Instrument ID of the pointings, defaults to None
+    :type instrumentid: int, optional
+    '''
+
+    def __init__(self, status='completed', instrumentid=None):
+        '''Constructor method
+        '''
+
+        self.status = status
+        self.instrumentid = instrumentid
+
+    @abc.abstractmethod
+    def batches(self):
+        '''
+        Read the pointings
+
+        :return: Generator of pointing tables
+        :rtype: generator
+        '''
+
+    def __iter__(self):
+        return self.batches()
+
+
+class FileSource(Source):
+    '''
+    Pointings from a table file, see `loaders.read_pointings`
+
+    CSV and Parquet files are read `batch_size` rows at a time; other
+    formats are memory mapped and handed out in slices.
+
+    :param path: Table file
+    :type path: str
+    :param format: 'csv', 'parquet', 'arrow' or 'fits', defaults to
+        guessing from the file name
+    :type format: str, optional
+    :param batch_size: Rows per batch, defaults to 100000
+    :type batch_size: int, optional
+    :param kwargs: `Source` arguments
+    '''
+
+    def __init__(self, path, format=None, batch_size=100000, **kwargs):
+        '''Constructor method
+        '''
+
+        super().__init__(**kwargs)
+        self.path = path
+        self.format = guess_format(path) if format is None else format
+        self.batch_size = batch_size
+
+    def batches(self):
+        if self.format == 'csv':
+            selected = _select(pd.read_csv(self.path, nrows=0).columns, None)
+            reader = pd.read_csv(self.path, usecols=selected,
+                                 chunksize=self.batch_size,
+                                 dtype={c: t for c, t in DTYPES.items()
+                                        if c in selected})
+            with reader:
+                for batch in reader:
+                    metrics.count("rows_read", len(batch), source='file')
+                    yield batch[selected]
+        elif self.format == 'parquet':
+            import pyarrow.parquet as pq
+
+            parquet = pq.ParquetFile(self.path, memory_map=True)
+            selected = _select(parquet.schema_arrow.names, None)
+            for batch in parquet.iter_batches(self.batch_size,
+                                              columns=selected):
+                metrics.count("rows_read", batch.num_rows, source='file')
+                yield batch.to_pandas()
+        else:
+            df = read_pointings(self.path, self.format)
+            for start in range(0, len(df), self.batch_size):
+                yield df.iloc[start:start + self.batch_size]
+
+
+class SQLSource(Source):
+    '''
+    Pointings from a SQL query, through any DB-API connection
+
+    With psycopg2 the query runs on a named (server-side) cursor, so
+    only one batch is held in memory at a time. Drivers without named
+    cursors, such as sqlite3, fall back to a plain cursor read with
+    fetchmany.
+
+    :param connect: Function returning a new database connection, which
+        the source closes when done
+    :type connect: callable
+    :param query: Query returning the pointing columns, or the columns
+        `transform` turns into them
+    :type query: str
+    :param batch_size: Rows per batch, defaults to 10000
+    :type batch_size: int, optional
+    :param transform: Function applied to each batch, defaults to None
+    :type transform: callable, optional
+    :param kwargs: `Source` arguments
+    '''
+
+    def __init__(self, connect, query, batch_size=10000, transform=None,
+                 **kwargs):
+        '''Constructor method
+        '''
+
+        super().__init__(**kwargs)
+        self.connect = connect
+        self.query = query
+        self.batch_size = batch_size
+        self.transform = transform
+
+    def batches(self):
+        conn = self.connect()
+        try:
+            for batch in iter_query(conn, self.query, self.batch_size):
+                metrics.count("rows_read", len(batch), source='sql')
+                yield self.format(batch)
+        finally:
+            conn.close()
+
+    def format(self, batch):
+        '''
+        Turn a batch of query rows into a pointing table
+        '''
+
+        if self.transform is None:
+            return batch
+        return self.transform(batch)
+
+
+class DECamSource(SQLSource):
+    '''
+    DECam pointings of a proposal, grouped and with depths computed by
+    the database as in `decam.QUERY`
+
+    The newest exposure read is kept in `watermark`, as a dict of
+    `expnum` and `night`, to resume from with `since`.
+
+    :param propid: Proposal ID
+    :type propid: str
+    :param start: YYYYMMDD lower bound (exclusive) of the nights
+    :type start: str
+    :param end: YYYYMMDD upper bound (exclusive) of the nights
+    :type end: str
+    :param since: Only read the groups with exposures newer than this
+        exposure ID, defaults to None
+    :type since: int, optional
+    :param batch_size: Rows per batch, defaults to 10000
+    :type batch_size: int, optional
+    :param connect: Function returning a new database connection,
+        defaults to `decam.connect`
+    :type connect: callable, optional
+    '''
+
+    def __init__(self, propid, start, end, since=None, batch_size=10000,
+                 connect=None):
+        '''Constructor method
+        '''
+
+        if connect is None:
+            connect = decam.connect
+
+        super().__init__(connect, decam.build_query(propid, start, end, since),
+                         batch_size, instrumentid=decam.INSTRUMENT_ID)
+        self.watermark = {'expnum': None, 'night': None}
+
+    def format(self, batch):
+        if len(batch):
+            i = batch['expnum'].astype(int).idxmax()
+            expnum = int(batch['expnum'][i])
+            if (self.watermark['expnum'] is None or
+                    expnum > self.watermark['expnum']):
+                self.watermark = {'expnum': expnum,
+                                  'night': batch['night'][i]}
+
+        return decam.format_batch(batch)
+
+
+def iter_query(conn, query, batch_size=10000, name='tm_source'):
+    '''
+    Run a query and yield the result in DataFrames of up to
+    `batch_size` rows
+
+    :param conn: DB-API connection
+    :param query: SQL query
+    :type query: str
+    :param batch_size: Rows per batch, defaults to 10000
+    :type batch_size: int, optional
+    :param name: Name of the server-side cursor, defaults to 'tm_source'
+    :type name: str, optional
+    :return: Generator of DataFrames
+    :rtype: generator
+    '''
+
+    try:
+        cursor = conn.cursor(name=name)
+        cursor.itersize = batch_size
+    except TypeError:
+        cursor = conn.cursor()
+
+    try:
+        cursor.execute(query)
+        rows = cursor.fetchmany(batch_size)
+        columns = [d[0] for d in cursor.description]
+        while rows:
+            yield pd.DataFrame.from_records(rows, columns=columns)
+            rows = cursor.fetchmany(batch_size)
+    finally:
+        cursor.close()
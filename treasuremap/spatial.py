@@ -0,0 +1,650 @@
+import itertools
+import re
+
+import healpy as hp
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+POLYGON_RE = re.compile(r'POLYGON\s*\(\((.*?)\)\)')
+
+
+def radec_to_vec(ra, dec):
+    '''
+    Convert coordinates in degrees to unit vectors
+
+    :param ra: Right Ascension in degrees
+    :type ra: array-like
+    :param dec: Declination in degrees
+    :type dec: array-like
+    :return: Unit vectors with shape (..., 3)
+    :rtype: numpy.ndarray
+    '''
+
+    ra = np.radians(ra)
+    dec = np.radians(dec)
+    return np.stack([np.cos(dec) * np.cos(ra),
+                     np.cos(dec) * np.sin(ra),
+                     np.sin(dec)], axis=-1)
+
+
+def vec_to_radec(vec):
+    '''
+    Convert vectors to coordinates in degrees
+
+    :param vec: Vectors with shape (..., 3), need not be normalised
+    :type vec: numpy.ndarray
+    :return: Right Ascension in [0, 360) and Declination in degrees
+    :rtype: tuple of numpy.ndarray
+    '''
+
+    vec = np.asarray(vec, dtype=float)
+    ra = np.degrees(np.arctan2(vec[..., 1], vec[..., 0])) % 360.0
+    dec = np.degrees(np.arctan2(vec[..., 2],
+                                np.hypot(vec[..., 0], vec[..., 1])))
+    return ra, dec
+
+
+def chord(angle):
+    '''
+    Chord length on the unit sphere for an angle in degrees
+    '''
+
+    return 2 * np.sin(np.radians(angle) / 2)
+
+
+class Footprint:
+    '''
+    Instrument footprint made of one or more polygons
+
+    Vertices are (x, y) offsets in degrees from the pointing centre at
+    position angle 0, with x towards the east and y towards the north,
+    as in the footprints Treasure Map stores for each instrument.
+
+    :param polygons: Polygons, each an (n, 2) array of vertices
+    :type polygons: list of array-like
+    '''
+
+    def __init__(self, polygons):
+        '''Constructor method
+        '''
+
+        self.polygons = [np.asarray(p, dtype=float) for p in polygons]
+
+        # Treasure Map closes its polygons by repeating the first vertex
+        self.polygons = [p[:-1] if len(p) > 3 and np.allclose(p[0], p[-1])
+                         else p for p in self.polygons]
+
+    @classmethod
+    def rectangle(cls, width, height):
+        '''
+        Rectangular footprint centred on the pointing
+
+        :param width: Width in degrees along x
+        :type width: float
+        :param height: Height in degrees along y
+        :type height: float
+        :return: Footprint
+        :rtype: Footprint
+        '''
+
+        x, y = width / 2.0, height / 2.0
+        return cls([[(-x, -y), (x, -y), (x, y), (-x, y)]])
+
+    @classmethod
+    def circle(cls, radius, nvertices=32):
+        '''
+        Circular footprint approximated by a regular polygon
+
+        :param radius: Radius in degrees
+        :type radius: float
+        :param nvertices: Number of polygon vertices, defaults to 32
+        :type nvertices: int, optional
+        :return: Footprint
+        :rtype: Footprint
+        '''
+
+        theta = np.linspace(0, 2 * np.pi, nvertices, endpoint=False)
+        return cls([np.column_stack([radius * np.cos(theta),
+                                     radius * np.sin(theta)])])
+
+    @classmethod
+    def from_wkt(cls, polygons):
+        '''
+        Footprint from WKT 'POLYGON((x y, ...))' strings
+
+        :param polygons: WKT polygons
+        :type polygons: list of str
+        :return: Footprint
+        :rtype: Footprint
+        '''
+
+        vertices = []
+        for polygon in polygons:
+            match = POLYGON_RE.search(polygon)
+            if match is None:
+                raise ValueError("Not a WKT polygon: {}".format(polygon))
+            vertices.append([tuple(map(float, point.split()))
+                             for point in match.group(1).split(',')])
+        return cls(vertices)
+
+    @property
+    def radius(self):
+        '''
+        Largest distance of a vertex from the centre in degrees
+        '''
+
+        return max(np.hypot(p[:, 0], p[:, 1]).max() for p in self.polygons)
+
+    @property
+    def inner_radius(self):
+        '''
+        Radius in degrees of the largest circle around the centre that
+        lies inside one polygon, 0 if the centre is not covered
+        '''
+
+        for polygon in self.polygons:
+            if _in_polygon(np.zeros(1), np.zeros(1), polygon)[0]:
+                edge = np.roll(polygon, -1, axis=0) - polygon
+                t = np.clip(-np.einsum('ij,ij->i', polygon, edge) /
+                            np.einsum('ij,ij->i', edge, edge), 0, 1)
+                closest = polygon + t[:, None] * edge
+                return float(np.hypot(closest[:, 0], closest[:, 1]).min())
+        return 0.0
+
+    def project(self, ra, dec, pos_angle=0.0):
+        '''
+        Place the footprint on the sky at many pointings at once
+
+        :param ra: Right Ascension of the pointing centres in degrees
+        :type ra: array-like
+        :param dec: Declination of the pointing centres in degrees
+        :type dec: array-like
+        :param pos_angle: Position angles in degrees, defaults to 0.0
+        :type pos_angle: float or array-like, optional
+        :return: One (npointings, nvertices, 3) array of vertex unit
+            vectors per polygon
+        :rtype: list of numpy.ndarray
+        '''
+
+        ra, dec = np.broadcast_arrays(np.atleast_1d(ra).astype(float),
+                                      np.atleast_1d(dec).astype(float))
+        pos_angle = np.broadcast_to(
+            np.radians(np.nan_to_num(np.asarray(pos_angle, dtype=float))),
+            ra.shape)
+
+        a, d = np.radians(ra), np.radians(dec)
+        centre = radec_to_vec(ra, dec)
+        east = np.stack([-np.sin(a), np.cos(a), np.zeros_like(a)], axis=-1)
+        north = np.stack([-np.sin(d) * np.cos(a), -np.sin(d) * np.sin(a),
+                          np.cos(d)], axis=-1)
+
+        cos_pa = np.cos(pos_angle)[:, None]
+        sin_pa = np.sin(pos_angle)[:, None]
+
+        projected = []
+        for polygon in self.polygons:
+            x = np.radians(polygon[:, 0])[None, :]
+            y = np.radians(polygon[:, 1])[None, :]
+            xi = x * cos_pa - y * sin_pa
+            eta = x * sin_pa + y * cos_pa
+
+            # Inverse gnomonic projection from the tangent plane
+            vec = (centre[:, None, :] + xi[..., None] * east[:, None, :] +
+                   eta[..., None] * north[:, None, :])
+            projected.append(vec / np.linalg.norm(vec, axis=-1,
+                                                  keepdims=True))
+
+        return projected
+
+
+class SpatialIndex:
+    '''
+    Spatial index of pointing centres and footprints
+
+    Centres are held in a k-d tree on unit vectors for neighbour
+    queries. Coverage is computed for all pointings at once by testing
+    HEALPix pixel centres against their nearest footprints, and overlaps
+    by testing candidate pairs from the tree against each other, with
+    `healpy.query_polygon` kept for single footprints.
+
+    :param ra: Right Ascension of the pointing centres in degrees
+    :type ra: array-like
+    :param dec: Declination of the pointing centres in degrees
+    :type dec: array-like
+    :param pos_angle: Position angles in degrees, defaults to 0.0
+    :type pos_angle: float or array-like, optional
+    :param footprint: Instrument footprint, defaults to None for
+        centre-only queries
+    :type footprint: Footprint, optional
+    '''
+
+    def __init__(self, ra, dec, pos_angle=0.0, footprint=None):
+        '''Constructor method
+        '''
+
+        self.ra, self.dec = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(ra, dtype=float)),
+            np.atleast_1d(np.asarray(dec, dtype=float)))
+        self.pos_angle = np.broadcast_to(
+            np.asarray(pos_angle, dtype=float), self.ra.shape)
+        self.footprint = footprint
+
+        self.vectors = radec_to_vec(self.ra, self.dec)
+        self.tree = cKDTree(self.vectors)
+        self._vertices = None
+
+    @classmethod
+    def from_pointings(cls, pointings, footprint=None):
+        '''
+        Index the pointings held by a `Pointings`
+
+        :param pointings: Pointings to index
+        :type pointings: Pointings
+        :param footprint: Instrument footprint, defaults to None
+        :type footprint: Footprint, optional
+        :return: Index
+        :rtype: SpatialIndex
+        '''
+
+        table = pointings.table
+        return cls(table.ra, table.dec, table.pos_angle, footprint)
+
+    def __len__(self):
+        return len(self.ra)
+
+    @property
+    def vertices(self):
+        '''
+        Footprint vertices of every pointing, see `Footprint.project`
+        '''
+
+        if self.footprint is None:
+            raise ValueError("A footprint is needed for coverage queries")
+        if self._vertices is None:
+            self._vertices = self.footprint.project(self.ra, self.dec,
+                                                    self.pos_angle)
+        return self._vertices
+
+    def pixels(self, i, nside, nest=False):
+        '''
+        HEALPix pixels whose centres fall in the footprint of pointing `i`
+
+        :param i: Pointing number
+        :type i: int
+        :param nside: HEALPix resolution
+        :type nside: int
+        :param nest: Use NESTED ordering, defaults to False
+        :type nest: bool, optional
+        :return: Pixel numbers
+        :rtype: numpy.ndarray
+        '''
+
+        pixels = [hp.query_polygon(nside, polygon[i], nest=nest)
+                  for polygon in self.vertices]
+        if len(pixels) == 1:
+            return pixels[0]
+        return np.unique(np.concatenate(pixels))
+
+    def coverage_map(self, nside, nest=False, index=None):
+        '''
+        Number of pointings covering each HEALPix pixel
+
+        :param nside: HEALPix resolution
+        :type nside: int
+        :param nest: Use NESTED ordering, defaults to False
+        :type nest: bool, optional
+        :param index: Pointings to include, defaults to all
+        :type index: array-like, optional
+        :return: Counts per pixel
+        :rtype: numpy.ndarray
+        '''
+
+        counts = np.zeros(hp.nside2npix(nside), dtype=np.int32)
+        for i in self._rows(index):
+            counts[self.pixels(i, nside, nest)] += 1
+        return counts
+
+    def covered(self, nside, nest=False, index=None, k=8,
+                block_size=1 << 18):
+        '''
+        Mask of HEALPix pixels covered by at least one pointing
+
+        Works on pixels rather than pointings, descending the NESTED
+        hierarchy from a coarse grid. At each level the k-d tree gives
+        each pixel's distance to the nearest pointing centre: pixels out
+        of reach of every footprint are dropped, and pixels wholly
+        within the inner radius of a footprint are taken with all their
+        children. The pixels left at `nside` are tested in the tangent
+        plane against the footprints of their `k` nearest centres and,
+        if none holds them, of every centre in reach, all as array
+        operations.
+
+        :param nside: HEALPix resolution
+        :type nside: int
+        :param nest: Use NESTED ordering, defaults to False
+        :type nest: bool, optional
+        :param index: Pointings to include, defaults to all
+        :type index: array-like, optional
+        :param k: Neighbouring centres tested per pixel, defaults to 8
+        :type k: int, optional
+        :param block_size: Pixels processed at a time, defaults to 2**18
+        :type block_size: int, optional
+        :return: Mask per pixel
+        :rtype: numpy.ndarray of bool
+        '''
+
+        rows = np.asarray(self._rows(index))
+        mask = np.zeros(hp.nside2npix(nside), dtype=bool)
+        if len(rows) == 0:
+            return mask
+
+        if index is None:
+            tree = self.tree
+        else:
+            tree = cKDTree(self.vectors[rows])
+
+        radius = self.footprint.radius
+        # Sky angle of the inner radius, which gnomonic projection
+        # stretches
+        inner = np.degrees(np.arctan(np.radians(
+            self.footprint.inner_radius)))
+
+        # Finest grid whose pixels are wider than the reach, so that a
+        # pointing's pixel and its neighbours hold its whole footprint
+        level = nside
+        while (level > 1 and
+               hp.nside2resol(level, arcmin=True) / 60 < 2 * radius):
+            level //= 2
+
+        pixels = np.unique(hp.ang2pix(level, self.ra[rows], self.dec[rows],
+                                      nest=True, lonlat=True))
+        neighbours = hp.get_all_neighbours(level, pixels, nest=True).ravel()
+        pixels = np.union1d(pixels, neighbours[neighbours >= 0])
+
+        hits = [np.zeros(0, dtype=np.int64)]
+        while level < nside:
+            pixrad = np.degrees(hp.max_pixrad(level))
+            distance, _ = tree.query(
+                np.column_stack(hp.pix2vec(level, pixels, nest=True)),
+                distance_upper_bound=chord(radius + pixrad))
+            near = np.isfinite(distance)
+            if inner > pixrad:
+                whole = distance <= chord(inner - pixrad)
+                hits.append(_children(pixels[whole], (nside // level) ** 2))
+                near &= ~whole
+            pixels = _children(pixels[near], 4)
+            level *= 2
+
+        reach = chord(radius)
+        k = min(k, len(rows))
+        for start in range(0, len(pixels), block_size):
+            block = pixels[start:start + block_size]
+            vec = np.column_stack(hp.pix2vec(nside, block, nest=True))
+
+            distance, neighbour = tree.query(vec, k=k,
+                                             distance_upper_bound=reach)
+            distance = distance.reshape(len(block), k)
+            neighbour = neighbour.reshape(len(block), k)
+
+            inside = np.zeros(len(block), dtype=bool)
+            for j in range(k):
+                test = (neighbour[:, j] < len(rows)) & ~inside
+                inside[test] = self.contains(rows[neighbour[test, j]],
+                                             vec[test])
+
+            # Pixels with more than k centres in reach
+            crowded = np.nonzero(np.isfinite(distance[:, -1]) & ~inside)[0]
+            for n in range(0, len(crowded), 4096):
+                some = crowded[n:n + 4096]
+                near = tree.query_ball_point(vec[some], reach)
+                counts = np.fromiter(map(len, near), dtype=np.intp,
+                                     count=len(near))
+                near = np.fromiter(itertools.chain.from_iterable(near),
+                                   dtype=np.intp, count=counts.sum())
+                owner = np.repeat(np.arange(len(some)), counts)
+                held = self.contains(rows[near], vec[some][owner])
+                inside[some] = np.bincount(owner[held],
+                                           minlength=len(some)) > 0
+
+            hits.append(block[inside])
+
+        hits = np.concatenate(hits)
+        if not nest:
+            hits = hp.nest2ring(nside, hits)
+        mask[hits] = True
+
+        return mask
+
+    def contains(self, rows, vec):
+        '''
+        Whether each vector lies inside the footprint of the matching
+        pointing
+
+        :param rows: Pointing numbers
+        :type rows: array-like of int
+        :param vec: Unit vectors, one per entry of `rows`
+        :type vec: numpy.ndarray
+        :return: Whether each vector is inside
+        :rtype: numpy.ndarray of bool
+        '''
+
+        rows = np.asarray(rows, dtype=int)
+        if self.footprint is None:
+            raise ValueError("A footprint is needed for coverage queries")
+
+        x, y, front = self._plane(rows, vec)
+        inside = np.zeros(len(rows), dtype=bool)
+        for polygon in self.footprint.polygons:
+            inside |= _in_polygon(x, y, polygon)
+
+        return inside & front
+
+    def _plane(self, rows, vec):
+        '''
+        Footprint coordinates in degrees of each vector in the tangent
+        plane of the matching pointing, and whether it lies in front
+        '''
+
+        a = np.radians(self.ra[rows])
+        d = np.radians(self.dec[rows])
+        pa = np.radians(np.nan_to_num(self.pos_angle[rows]))
+
+        centre = radec_to_vec(self.ra[rows], self.dec[rows])
+        east = np.stack([-np.sin(a), np.cos(a), np.zeros_like(a)], axis=-1)
+        north = np.stack([-np.sin(d) * np.cos(a), -np.sin(d) * np.sin(a),
+                          np.cos(d)], axis=-1)
+
+        # Gnomonic projection maps the great-circle edges to straight lines
+        z = np.einsum('ij,ij->i', vec, centre)
+        front = z > 0
+        z = np.where(front, z, 1.0)
+        xi = np.einsum('ij,ij->i', vec, east) / z
+        eta = np.einsum('ij,ij->i', vec, north) / z
+
+        # Undo the position angle rotation to reach footprint coordinates
+        x = np.degrees(xi * np.cos(pa) + eta * np.sin(pa))
+        y = np.degrees(-xi * np.sin(pa) + eta * np.cos(pa))
+
+        return x, y, front
+
+    def covered_probability(self, skymap, nest=False, index=None):
+        '''
+        Total sky map probability inside the union of the footprints
+
+        :param skymap: HEALPix probability map, e.g. from
+            `healpy.read_map`
+        :type skymap: numpy.ndarray
+        :param nest: Whether `skymap` is in NESTED ordering,
+            defaults to False
+        :type nest: bool, optional
+        :param index: Pointings to include, defaults to all
+        :type index: array-like, optional
+        :return: Covered probability
+        :rtype: float
+        '''
+
+        skymap = np.asarray(skymap)
+        nside = hp.npix2nside(len(skymap))
+        return float(skymap[self.covered(nside, nest, index)].sum())
+
+    def _rows(self, index):
+        if index is None:
+            return range(len(self))
+        return np.arange(len(self))[index]
+
+    def nearest(self, ra, dec, k=1):
+        '''
+        Nearest indexed pointings to the given positions
+
+        :param ra: Right Ascension in degrees
+        :type ra: array-like
+        :param dec: Declination in degrees
+        :type dec: array-like
+        :param k: Number of neighbours, defaults to 1
+        :type k: int, optional
+        :return: Separations in degrees and pointing numbers
+        :rtype: tuple of numpy.ndarray
+        '''
+
+        distance, index = self.tree.query(radec_to_vec(ra, dec), k=k)
+        separation = np.degrees(2 * np.arcsin(np.clip(distance / 2, 0, 1)))
+        return separation, index
+
+    def within(self, ra, dec, radius):
+        '''
+        Indexed pointings whose centres lie within `radius` of positions
+
+        :param ra: Right Ascension in degrees
+        :type ra: array-like
+        :param dec: Declination in degrees
+        :type dec: array-like
+        :param radius: Search radius in degrees
+        :type radius: float
+        :return: Pointing numbers for each position
+        :rtype: list of list
+        '''
+
+        return self.tree.query_ball_point(radec_to_vec(ra, dec),
+                                          chord(radius))
+
+    def pairs(self, radius):
+        '''
+        Pairs of pointings whose centres are within `radius` degrees
+
+        :param radius: Separation in degrees
+        :type radius: float
+        :return: (npairs, 2) array of pointing numbers with i < j
+        :rtype: numpy.ndarray
+        '''
+
+        return self.tree.query_pairs(chord(radius), output_type='ndarray')
+
+    def overlaps(self, block_size=1 << 16):
+        '''
+        Pairs of pointings whose footprints overlap
+
+        Candidate pairs come from the k-d tree, within twice the
+        footprint radius. Each is then tested exactly in the tangent
+        plane of its first pointing, where the edges of both footprints
+        are straight: they overlap if a vertex of one lies inside the
+        other or two of their edges cross. The pairs are tested
+        `block_size` at a time as array operations.
+
+        :param block_size: Pairs tested at a time, defaults to 2**16
+        :type block_size: int, optional
+        :return: (npairs, 2) array of pointing numbers with i < j
+        :rtype: numpy.ndarray
+        '''
+
+        candidates = self.pairs(2 * self.footprint.radius)
+        keep = np.zeros(len(candidates), dtype=bool)
+        for start in range(0, len(candidates), block_size):
+            i, j = candidates[start:start + block_size].T
+            keep[start:start + block_size] = self._overlap(i, j)
+        return candidates[keep].reshape(-1, 2)
+
+    def _overlap(self, i, j):
+        '''
+        Whether the footprints of pointings `i` and `j` overlap
+        '''
+
+        hit = np.zeros(len(i), dtype=bool)
+        for other in self.vertices:
+            nv = other.shape[1]
+            x, y, front = self._plane(np.repeat(i, nv),
+                                      other[j].reshape(-1, 3))
+            x = x.reshape(-1, nv)
+            y = y.reshape(-1, nv)
+            # Only footprints wider than a hemisphere reach behind
+            valid = front.reshape(-1, nv).all(axis=1)
+
+            for polygon in self.footprint.polygons:
+                test = np.nonzero(valid & ~hit)[0]
+                hit[test] = _polygons_meet(polygon, x[test], y[test])
+
+        return hit
+
+
+def _in_polygon(x, y, polygon):
+    '''
+    Even-odd test of points against a polygon in the plane
+    '''
+
+    inside = np.zeros(len(x), dtype=bool)
+    x0, y0 = polygon[-1]
+    for x1, y1 in polygon:
+        crosses = (y1 > y) != (y0 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            at = (x0 - x1) * (y - y1) / (y0 - y1) + x1
+        inside ^= crosses & (x < at)
+        x0, y0 = x1, y1
+    return inside
+
+
+def _children(pixels, n):
+    '''
+    NESTED pixels `n` times finer that make up each of `pixels`
+    '''
+
+    return (pixels[:, None] * n + np.arange(n)).ravel()
+
+
+def _polygons_meet(polygon, x, y):
+    '''
+    Whether a polygon overlaps each of the polygons with vertices
+    (`x`, `y`), given as arrays of shape (n, nvertices)
+    '''
+
+    n, nv = x.shape
+    px, py = polygon[:, 0], polygon[:, 1]
+
+    # A vertex of one inside the other
+    meet = _in_polygon(x.ravel(), y.ravel(), polygon).reshape(n, nv).any(1)
+    inside = np.zeros((n, len(polygon)), dtype=bool)
+    x0, y0 = x[:, -1:], y[:, -1:]
+    for m in range(nv):
+        x1, y1 = x[:, m:m + 1], y[:, m:m + 1]
+        crosses = (y1 > py) != (y0 > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            at = (x0 - x1) * (py - y1) / (y0 - y1) + x1
+        inside ^= crosses & (px < at)
+        x0, y0 = x1, y1
+    meet |= inside.any(1)
+
+    # Two edges crossing, with the ends of each on either side of the
+    # other
+    ax, ay = px[:, None], py[:, None]
+    bx, by = np.roll(px, -1)[:, None], np.roll(py, -1)[:, None]
+    cx, cy = x[:, None, :], y[:, None, :]
+    dx = np.roll(x, -1, axis=1)[:, None, :]
+    dy = np.roll(y, -1, axis=1)[:, None, :]
+
+    def side(x0, y0, x1, y1, x2, y2):
+        return (x1 - x0) * (y2 - y0) - (y1 - y0) * (x2 - x0)
+
+    cross = ((side(ax, ay, bx, by, cx, cy) *
+              side(ax, ay, bx, by, dx, dy) < 0) &
+             (side(cx, cy, dx, dy, ax, ay) *
+              side(cx, cy, dx, dy, bx, by) < 0))
+    return meet | cross.any(axis=(1, 2))
@@ -0,0 +1,282 @@
+import concurrent.futures
+import copy
+import json
+import logging
+import os
+import threading
+import time
+
+from .journal import SubmissionJournal, accepted_keys
+from .treasuremap import submit_many
+
+
+class PlanSync:
+    '''
+    Local mapping of planned pointings to their Treasure Map pointing IDs
+
+    Each planned pointing is keyed by its content, as in
+    `SubmissionJournal`. Syncing a new plan submits only the pointings
+    whose keys are not mapped yet and cancels only the IDs whose keys
+    are no longer in the plan, instead of cancelling and resubmitting
+    everything. Identical pointings within a plan count as one.
+
+    The mapping is kept in an append-only JSON-lines file, written as
+    each chunk is acknowledged or cancelled, so an interrupted sync
+    picks up where it stopped.
+
+    :param path: State file, created if it does not exist
+    :type path: str
+    :param graceid: Event ID in GraceDB
+    :type graceid: str
+    :param instrumentid: Instrument ID
+    :type instrumentid: int
+    '''
+
+    key = staticmethod(SubmissionJournal.key)
+
+    def __init__(self, path, graceid, instrumentid):
+        '''Constructor method
+        '''
+
+        self.logger = logging.getLogger('treasuremap.PlanSync')
+        self.path = path
+        self.graceid = graceid
+        self.instrumentid = instrumentid
+
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._orphans = []
+
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A partial last line from an interrupted write
+                        continue
+                    self._apply(entry)
+        else:
+            self._write({"op": "open", "graceid": graceid,
+                         "instrumentid": instrumentid})
+
+    def _apply(self, entry):
+        op = entry["op"]
+        if op == "open":
+            if (entry["graceid"] != self.graceid or
+                    entry["instrumentid"] != self.instrumentid):
+                raise ValueError(
+                    "{} holds the plan of {} on instrument {}".format(
+                        self.path, entry["graceid"], entry["instrumentid"]))
+        elif op == "add":
+            for key, pointing_id in zip(entry["keys"],
+                                        entry["pointing_ids"]):
+                self._ids[key] = pointing_id
+        elif op == "orphan":
+            self._orphans.extend(entry["pointing_ids"])
+        elif op == "cancel":
+            cancelled = set(entry["pointing_ids"])
+            self._ids = {key: pointing_id for key, pointing_id
+                         in self._ids.items() if pointing_id not in cancelled}
+            self._orphans = [pointing_id for pointing_id in self._orphans
+                             if pointing_id not in cancelled]
+
+    def _write(self, entry):
+        entry["time"] = time.time()
+        line = json.dumps(entry) + '\n'
+        with open(self.path, 'a') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _log(self, entry):
+        with self._lock:
+            self._write(entry)
+            self._apply(entry)
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def pointing_ids(self, keys):
+        '''
+        Pointing IDs mapped to the given keys
+
+        :param keys: Pointing keys
+        :type keys: list of str
+        :return: Pointing IDs, skipping keys that are not mapped
+        :rtype: list
+        '''
+
+        return [self._ids[key] for key in keys if key in self._ids]
+
+    def record(self, graceid, keys, response):
+        '''
+        Map the keys of an acknowledged chunk to the IDs returned for it
+
+        Called by `submit_many` as each chunk is acknowledged. Pointings
+        the response lists in `ERRORS` were rejected; they stay unmapped,
+        so the next sync tries them again. If the rejected ones cannot be
+        told apart the IDs cannot be matched to keys; they are then kept
+        as orphans, cancelled on the next sync, and the pointings are
+        submitted again.
+
+        :param graceid: Event ID in GraceDB
+        :type graceid: str
+        :param keys: Keys of the pointings in the chunk
+        :type keys: list of str
+        :param response: Decoded server response for the chunk
+        :type response: dict
+        :return: Keys mapped
+        :rtype: list of str
+        '''
+
+        ids = response["pointing_ids"]
+        accepted = accepted_keys(graceid, keys, response)
+        if accepted is None:
+            self.logger.warning(
+                "Got {} pointing IDs for {} pointings, they will be "
+                "replaced on the next sync".format(len(ids), len(keys)))
+            self._log({"op": "orphan", "pointing_ids": ids})
+            return []
+
+        if len(accepted) < len(keys):
+            self.logger.warning("{} of {} pointings were rejected: {}".format(
+                len(keys) - len(accepted), len(keys), response.get("ERRORS")))
+        if accepted:
+            self._log({"op": "add", "keys": accepted, "pointing_ids": ids})
+        return accepted
+
+    def plan_keys(self, pointings):
+        '''
+        Keys of the pointings in a plan
+
+        :param pointings: Planned pointings, e.g. one per band
+        :type pointings: list of Pointings
+        :return: One list of keys per `Pointings`
+        :rtype: list of list
+        '''
+
+        return [[self.key(p.graceid, record) for record in p.records()]
+                for p in pointings]
+
+    def diff(self, pointings, keys=None):
+        '''
+        Changes needed to bring the server in line with a plan
+
+        :param pointings: Planned pointings, e.g. one per band
+        :type pointings: list of Pointings
+        :param keys: Keys from `plan_keys`, defaults to computing them
+        :type keys: list of list, optional
+        :return: Number of pointings to submit, pointing IDs to cancel
+            and number of pointings already on the server
+        :rtype: tuple of (int, list, int)
+        '''
+
+        if keys is None:
+            keys = self.plan_keys(pointings)
+
+        for p in pointings:
+            if (p.graceid != self.graceid or
+                    p.instrumentid != self.instrumentid):
+                raise ValueError("Plan is for {} on instrument {}, not {} on "
+                                 "instrument {}".format(
+                                     self.graceid, self.instrumentid,
+                                     p.graceid, p.instrumentid))
+            if p.status != "planned":
+                raise ValueError("Can only sync planned pointings")
+
+        plan = set(key for band in keys for key in band)
+        unchanged = sum(1 for key in plan if key in self._ids)
+        cancel = [pointing_id for key, pointing_id in self._ids.items()
+                  if key not in plan] + list(self._orphans)
+
+        return len(plan) - unchanged, cancel, unchanged
+
+    def sync(self, pointings, chunk_size=500, max_workers=4, cancel_size=200):
+        '''
+        Submit the new pointings of a plan and cancel the dropped ones
+
+        New pointings are submitted first, through `submit_many`, so the
+        server never goes without a plan. Dropped IDs are then cancelled
+        `cancel_size` at a time through the same number of workers.
+
+        :param pointings: Planned pointings, e.g. one per band; pass
+            empty `Pointings` to cancel the whole plan
+        :type pointings: list of Pointings
+        :param chunk_size: Maximum number of pointings per request,
+            defaults to 500
+        :type chunk_size: int, optional
+        :param max_workers: Maximum number of requests in flight,
+            defaults to 4
+        :type max_workers: int, optional
+        :param cancel_size: Maximum number of IDs per cancel request,
+            defaults to 200
+        :type cancel_size: int, optional
+        :return: `submitted`, `cancelled` and `unchanged` counts, the
+            new `pointing_ids`, the `cancelled_ids` and the `failed`
+            submit chunks and cancel batches
+        :rtype: dict
+        '''
+
+        if not pointings:
+            raise ValueError("Need at least one Pointings to sync")
+
+        keys = self.plan_keys(pointings)
+        _, cancel, unchanged = self.diff(pointings, keys)
+
+        result = {"submitted": 0, "cancelled": 0, "unchanged": unchanged,
+                  "pointing_ids": [], "cancelled_ids": [], "failed": []}
+
+        # Only the new rows go to submit_many, which keys them again
+        todo = [_new_rows(p, band, self._ids)
+                for p, band in zip(pointings, keys)]
+        todo = [p for p in todo if len(p)]
+        if todo:
+            for response in submit_many(todo, chunk_size, max_workers,
+                                        journal=self):
+                new = response["pointing_ids"][response["resumed"]:]
+                result["pointing_ids"].extend(new)
+                result["failed"].extend(response["failed"])
+        result["submitted"] = len(result["pointing_ids"])
+
+        batches = [cancel[n:n + cancel_size]
+                   for n in range(0, len(cancel), cancel_size)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            futures = [executor.submit(pointings[0].cancel, batch)
+                       for batch in batches]
+
+        for n, (batch, future) in enumerate(zip(batches, futures)):
+            error = future.exception()
+            if error is not None:
+                self.logger.error("Cancel batch {} failed: {!r}".format(
+                    n, error))
+                result["failed"].append({"cancel": n, "pointing_ids": batch,
+                                         "error": repr(error)})
+                continue
+            self._log({"op": "cancel", "pointing_ids": batch})
+            result["cancelled_ids"].extend(batch)
+        result["cancelled"] = len(result["cancelled_ids"])
+
+        self.logger.info("Submitted {submitted}, cancelled {cancelled}, kept "
+                         "{unchanged} planned pointings".format(**result))
+        return result
+
+
+def _new_rows(p, keys, mapped):
+    '''
+    `p` holding only the first of each pointing whose key is not in
+    `mapped`, sharing everything but the table
+    '''
+
+    seen = set(mapped)
+    new = [i for i, key in enumerate(keys)
+           if not (key in seen or seen.add(key))]
+    if len(new) == len(keys):
+        return p
+
+    subset = copy.copy(p)
+    subset.table = p.table.take(new)
+    return subset
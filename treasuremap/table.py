@@ -0,0 +1,272 @@
+import numpy as np
+
+from .time import format_times, parse_times
+
+
+class PointingTable:
+    '''
+    Growable column store of the per-pointing fields
+
+    Each field is kept in a typed NumPy array: `ra`, `dec`, `depth` and
+    `pos_angle` as float64, `time` as datetime64[ms] and `depth_unit` as
+    small integer codes into `units`. Arrays grow by doubling, so
+    appending is amortised O(1).
+
+    :param capacity: Number of rows to allocate up front, defaults to 64
+    :type capacity: int, optional
+    '''
+
+    def __init__(self, capacity=64):
+        '''Constructor method
+        '''
+
+        self._n = 0
+        self._ra = np.empty(capacity, dtype=np.float64)
+        self._dec = np.empty(capacity, dtype=np.float64)
+        self._time = np.empty(capacity, dtype='datetime64[ms]')
+        self._depth = np.empty(capacity, dtype=np.float64)
+        self._pos_angle = np.empty(capacity, dtype=np.float64)
+        self._unit = np.empty(capacity, dtype=np.int16)
+        self.units = []
+        self._unit_codes = {}
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def ra(self):
+        return self._ra[:self._n]
+
+    @property
+    def dec(self):
+        return self._dec[:self._n]
+
+    @property
+    def time(self):
+        return self._time[:self._n]
+
+    @property
+    def depth(self):
+        return self._depth[:self._n]
+
+    @property
+    def pos_angle(self):
+        return self._pos_angle[:self._n]
+
+    @property
+    def unit(self):
+        return self._unit[:self._n]
+
+    @property
+    def depth_unit(self):
+        '''
+        Depth unit of each row as an object array of str
+        '''
+
+        return np.asarray(self.units, dtype=object)[self.unit]
+
+    @property
+    def nbytes(self):
+        '''
+        Bytes allocated for the columns
+        '''
+
+        return sum(getattr(self, '_' + name).nbytes for name in
+                   ('ra', 'dec', 'time', 'depth', 'pos_angle', 'unit'))
+
+    def _reserve(self, n):
+        needed = self._n + n
+        capacity = len(self._ra)
+        if needed <= capacity:
+            return
+
+        while capacity < needed:
+            capacity = max(2 * capacity, 64)
+
+        for name in ('_ra', '_dec', '_time', '_depth', '_pos_angle',
+                     '_unit'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._n] = old[:self._n]
+            setattr(self, name, new)
+
+    def _codes(self, depth_unit, n):
+        depth_unit = np.asarray(depth_unit, dtype=object)
+        if depth_unit.ndim == 0:
+            return np.full(n, self._code(depth_unit.item()), dtype=np.int16)
+
+        uniques, inverse = np.unique(depth_unit.astype(str),
+                                     return_inverse=True)
+        codes = np.array([self._code(u) for u in uniques.tolist()],
+                         dtype=np.int16)
+        return codes[inverse.ravel()]
+
+    def _code(self, unit):
+        code = self._unit_codes.get(unit)
+        if code is None:
+            code = len(self.units)
+            self.units.append(unit)
+            self._unit_codes[unit] = code
+        return code
+
+    def append(self, ra, dec, time, depth, depth_unit, pos_angle=0.0):
+        '''
+        Append one row
+
+        :param ra: Right Ascension in degrees
+        :type ra: float
+        :param dec: Declination in degrees
+        :type dec: float
+        :param time: Observation time
+        :type time: str, datetime or numpy.datetime64
+        :param depth: Pointing depth
+        :type depth: float
+        :param depth_unit: Depth unit
+        :type depth_unit: str
+        :param pos_angle: Position angle, None if unknown, defaults to 0.0
+        :type pos_angle: float, optional
+        '''
+
+        self._reserve(1)
+        i = self._n
+        self._ra[i] = ra
+        self._dec[i] = dec
+        self._time[i] = parse_times(time)
+        self._depth[i] = np.nan if depth is None else depth
+        self._pos_angle[i] = np.nan if pos_angle is None else pos_angle
+        self._unit[i] = self._code(depth_unit)
+        self._n += 1
+
+    def extend(self, ra, dec, time, depth, depth_unit, pos_angle=0.0):
+        '''
+        Append many rows; scalars are broadcast to the length of `ra`
+
+        Takes the same arguments as `append`, as arrays.
+        '''
+
+        ra = np.atleast_1d(np.asarray(ra, dtype=np.float64))
+        n = len(ra)
+
+        columns = {
+            '_ra': ra,
+            '_dec': np.broadcast_to(np.asarray(dec, dtype=np.float64), (n,)),
+            '_time': np.broadcast_to(parse_times(time), (n,)),
+            '_depth': np.broadcast_to(
+                np.asarray(depth, dtype=np.float64), (n,)),
+            '_pos_angle': np.broadcast_to(
+                np.asarray(pos_angle, dtype=np.float64), (n,)),
+            '_unit': self._codes(depth_unit, n)
+        }
+
+        self._reserve(n)
+        for name, values in columns.items():
+            getattr(self, name)[self._n:self._n + n] = values
+        self._n += n
+
+    def take(self, index):
+        '''
+        Copy of the table holding only the given rows
+
+        :param index: Rows to keep, as a slice, index array or boolean mask
+        :type index: slice or array-like
+        :return: New table
+        :rtype: PointingTable
+        '''
+
+        table = PointingTable(capacity=0)
+        for name in ('_ra', '_dec', '_time', '_depth', '_pos_angle',
+                     '_unit'):
+            setattr(table, name, getattr(self, name)[:self._n][index].copy())
+        table._n = len(table._ra)
+        table.units = list(self.units)
+        table._unit_codes = dict(self._unit_codes)
+        return table
+
+    def records(self, status, instrumentid, band, index=None,
+                block_size=4096, coord_decimals=None, depth_decimals=None):
+        '''
+        Generate pointing dicts in the form the API expects
+
+        Dicts and WKT strings are only made here, `block_size` rows at
+        a time. Coordinates and depths can be rounded on the way, which
+        shortens their text in the payload.
+
+        :param status: Observing status
+        :type status: str
+        :param instrumentid: Instrument ID
+        :type instrumentid: int
+        :param band: Observing band
+        :type band: str
+        :param index: Rows to generate, as a slice or index array,
+            defaults to all rows
+        :type index: slice or array-like, optional
+        :param block_size: Rows converted at a time, defaults to 4096
+        :type block_size: int, optional
+        :param coord_decimals: Decimal places RA and Dec are rounded to,
+            defaults to None for full precision
+        :type coord_decimals: int, optional
+        :param depth_decimals: Decimal places depths are rounded to,
+            defaults to None for full precision
+        :type depth_decimals: int, optional
+        :return: Generator of pointing dicts
+        :rtype: generator
+        '''
+
+        if index is None:
+            index = slice(0, self._n)
+        rows = np.arange(self._n)[index]
+
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+
+            ra = self._ra[block]
+            dec = self._dec[block]
+            depth = self._depth[block]
+            if coord_decimals is not None:
+                ra = ra.round(coord_decimals)
+                dec = dec.round(coord_decimals)
+            if depth_decimals is not None:
+                depth = depth.round(depth_decimals)
+
+            ra = ra.tolist()
+            dec = dec.tolist()
+            time = _nullable_times(self._time[block])
+            depth = _nullable(depth)
+            pos_angle = _nullable(self._pos_angle[block])
+            units = [self.units[c] for c in self._unit[block].tolist()]
+
+            for r, d, t, dp, du, pa in zip(ra, dec, time, depth, units,
+                                           pos_angle):
+                yield {
+                    "status": status,
+                    "position": "POINT({} {})".format(r, d),
+                    "instrumentid": instrumentid,
+                    "pos_angle": pa,
+                    "time": t,
+                    "band": band,
+                    "depth": dp,
+                    "depth_unit": du
+                }
+
+
+def _nullable(values):
+    '''
+    Convert a float array to a list with NaN replaced by None
+    '''
+
+    out = values.tolist()
+    if np.isnan(values).any():
+        out = [None if v != v else v for v in out]
+    return out
+
+
+def _nullable_times(times):
+    '''
+    Format a datetime64 array as a list with NaT replaced by None
+    '''
+
+    out = format_times(times).tolist()
+    missing = np.isnat(times)
+    if missing.any():
+        out = [None if m else t for t, m in zip(out, missing.tolist())]
+    return out
@@ -0,0 +1,101 @@
+import numpy as np
+
+
+def parse_times(times):
+    '''
+    Parse observation times in one array operation
+
+    :param times: ISO 8601 strings ('YYYY-MM-DDTHH:MM:SS[.fff]', a space
+        may replace the 'T'), datetimes or datetime64 values, e.g. a
+        pandas column
+    :type times: str, datetime or array-like
+    :return: Times
+    :rtype: numpy.ndarray of datetime64[ms]
+    '''
+
+    return np.asarray(times, dtype='datetime64[ms]')
+
+
+def parse_durations(durations):
+    '''
+    Parse exposure durations in one array operation
+
+    :param durations: 'HH:MM:SS[.fff]' strings, where the hours may
+        exceed 24, numbers of seconds, timedeltas or timedelta64 values
+    :type durations: str, float or array-like
+    :return: Durations
+    :rtype: numpy.ndarray of timedelta64[ms]
+    '''
+
+    durations = np.asarray(durations)
+    if (durations.dtype.kind == 'O' and durations.size and
+            isinstance(durations.flat[0], str)):
+        # e.g. a pandas column of strings
+        durations = durations.astype(str)
+    if durations.dtype.kind not in 'US':
+        if durations.dtype.kind in 'iuf':
+            return np.round(durations * 1000.0).astype('timedelta64[ms]')
+        return durations.astype('timedelta64[ms]')
+
+    flat = durations.astype(str).ravel()
+    hours, _, rest = np.char.partition(flat, ':').T
+    minutes, _, seconds = np.char.partition(rest, ':').T
+    if (seconds == '').any():
+        raise ValueError("Durations must be formatted as 'HH:MM:SS'")
+
+    ms = ((hours.astype(np.int64) * 60 + minutes.astype(np.int64)) * 60000 +
+          np.round(seconds.astype(np.float64) * 1000).astype(np.int64))
+    return ms.reshape(durations.shape).astype('timedelta64[ms]')
+
+
+def parse_nights(nights):
+    '''
+    Parse DECam nights given as YYYYMMDD
+
+    :param nights: Nights as strings or integers
+    :type nights: str, int or array-like
+    :return: Dates
+    :rtype: numpy.ndarray of datetime64[D]
+    '''
+
+    nights = np.asarray(nights).astype(np.int64)
+    months = ((nights // 10000 - 1970) * 12 +
+              nights // 100 % 100 - 1).astype('datetime64[M]')
+    return months.astype('datetime64[D]') + (nights % 100 - 1)
+
+
+def midpoints(start, duration):
+    '''
+    Midpoints of exposures from their start times and durations
+
+    :param start: Start times, see `parse_times`
+    :type start: array-like
+    :param duration: Durations, see `parse_durations`
+    :type duration: array-like
+    :return: Midpoints, rounded down to the millisecond
+    :rtype: numpy.ndarray of datetime64[ms]
+    '''
+
+    return parse_times(start) + parse_durations(duration) // 2
+
+
+def format_times(times, decimals=2):
+    '''
+    Format times as Treasure Map expects, 'YYYY-MM-DDTHH:MM:SS.FF'
+
+    :param times: Times, see `parse_times`
+    :type times: array-like
+    :param decimals: Decimal places of the seconds, which are truncated,
+        from 0 to 3, defaults to 2
+    :type decimals: int, optional
+    :return: Formatted times
+    :rtype: numpy.ndarray of str
+    '''
+
+    if not 0 <= decimals <= 3:
+        raise ValueError("decimals must be between 0 and 3")
+
+    # Casting to a shorter string type drops the last digits
+    width = 19 + decimals + (decimals > 0)
+    return np.datetime_as_string(parse_times(times),
+                                 unit='ms').astype('U{}'.format(width))
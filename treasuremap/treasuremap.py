@@ -1,9 +1,22 @@
-import requests
+import concurrent.futures
 import urllib.parse
 import os
 import sys
 import json
 import logging
+import threading
+
+import numpy as np
+
+from . import metrics
+from .compression import check_encoding, compress, iter_compressed
+from .encoding import iter_payload, write_payload
+from .exceptions import TreasureMapError
+from .parallel import MIN_ROWS, _chunks, _split, prepare_chunks
+from .retry import RetryPolicy
+from .session import TIMEOUT, get_session
+from .table import PointingTable, _nullable_times
+from .time import midpoints, parse_times
 
 
 class Pointings:
@@ -20,15 +33,60 @@ class Pointings:
     :type band: str
     :param api_token: Treasuremap API token, defaults to None
     :type api_token: str
+    :param session: HTTP session to use instead of the shared one,
+        defaults to None
+    :type session: requests.Session, optional
+    :param base_url: API base URL, defaults to the treasuremap.space API
+    :type base_url: str, optional
+    :param retry: Retry policy for failed requests, defaults to
+        `RetryPolicy()`
+    :type retry: RetryPolicy, optional
+    :param compression: Compress request bodies with `gzip` or `zstd`
+        (which needs the zstandard package), defaults to None. If the
+        server answers HTTP 415 the body is sent again uncompressed and
+        compression stays off for that server.
+    :type compression: str, optional
+    :param compression_level: Compression level, defaults to the
+        codec's default
+    :type compression_level: int, optional
+    :param coord_decimals: Decimal places RA and Dec are rounded to in
+        payloads, defaults to None for full precision (5 decimals is
+        under 0.04 arcsec)
+    :type coord_decimals: int, optional
+    :param depth_decimals: Decimal places depths are rounded to in
+        payloads, defaults to None for full precision
+    :type depth_decimals: int, optional
+    :param timeout: Seconds to wait for a connection and for an answer,
+        as one number or a (connect, read) tuple, defaults to
+        `session.TIMEOUT`
+    :type timeout: float or tuple, optional
     '''
 
-    def __init__(self, status, graceid, instrumentid, band, api_token=None):
+    def __init__(self, status, graceid, instrumentid, band, api_token=None,
+                 session=None, base_url=None, retry=None, compression=None,
+                 compression_level=None, coord_decimals=None,
+                 depth_decimals=None, timeout=None):
         '''Constructor method
         '''
 
         self.logger = logging.getLogger('treasuremap.Pointings')
 
-        self.BASE = 'http://treasuremap.space/api/v0'
+        if base_url is None:
+            self.BASE = 'http://treasuremap.space/api/v0'
+        else:
+            self.BASE = base_url.rstrip('/')
+
+        self._session = session
+
+        if retry is None:
+            self.retry = RetryPolicy()
+        else:
+            self.retry = retry
+
+        if timeout is None:
+            self.timeout = TIMEOUT
+        else:
+            self.timeout = timeout
 
         assert status in [
             "planned", "completed"], "Status must be planned or completed"
@@ -43,7 +101,100 @@ class Pointings:
         else:
             self.api_token = api_token
 
-        self.pointings = []
+        if compression is not None:
+            check_encoding(compression)
+        self.compression = compression
+        self.compression_level = compression_level
+        self.coord_decimals = coord_decimals
+        self.depth_decimals = depth_decimals
+
+        # Payload bytes before and after compression, for reporting
+        self.bytes_raw = 0
+        self.bytes_sent = 0
+        self._bytes_lock = threading.Lock()
+
+        self.table = PointingTable()
+
+    @property
+    def session(self):
+        '''
+        HTTP session used for requests, shared across instances unless
+        one was passed in
+        '''
+
+        if self._session is None:
+            return get_session()
+        return self._session
+
+    def _post(self, url, idempotent=True, **kwargs):
+        '''
+        Post to the API, retrying transient failures, and decode the
+        JSON response
+
+        :raises TreasureMapError: If the request fails or the response
+            is not JSON
+        '''
+
+        return self._send(lambda: self.session.post(
+            url=url, timeout=self.timeout, **kwargs), idempotent=idempotent)
+
+    def _send(self, send, retry=None, idempotent=True):
+        '''
+        Make a request with `send`, retrying transient failures with
+        `retry` (defaults to `self.retry`), and decode the JSON response
+
+        A request that is not idempotent is only retried when it cannot
+        have been processed, see `RetryPolicy.call`.
+        '''
+
+        if retry is None:
+            retry = self.retry
+
+        with metrics.span("http"):
+            r = retry.call(send, idempotent)
+        metrics.count("requests", status=r.status_code)
+        self.logger.info(r.text)
+
+        if not r.ok:
+            # A server error may come after the pointings were stored
+            uncertain = (not idempotent and r.status_code >= 500 and
+                         r.status_code not in retry.unsent_statuses)
+            raise TreasureMapError("HTTP {} {}: {}".format(
+                r.status_code, r.reason, r.text[:200]), r, uncertain)
+
+        try:
+            with metrics.span("parse"):
+                return json.loads(r.text)
+        except ValueError:
+            raise TreasureMapError(
+                "Response is not JSON: {}".format(r.text[:200]), r)
+
+    def __len__(self):
+        return len(self.table)
+
+    @property
+    def pointings(self):
+        '''
+        Pointing dicts in the form the API expects, built from
+        `self.table` on each access
+        '''
+
+        return list(self.records())
+
+    def records(self, index=None):
+        '''
+        Generate pointing dicts from `self.table`
+
+        :param index: Rows to generate, as a slice or index array,
+            defaults to all rows
+        :type index: slice or array-like, optional
+        :return: Generator of pointing dicts
+        :rtype: generator
+        '''
+
+        return self.table.records(self.status, self.instrumentid, self.band,
+                                  index, coord_decimals=self.coord_decimals,
+                                  depth_decimals=self.depth_decimals)
 
     def add_pointing(self, ra, dec, time, depth,
                      depth_unit, pos_angle=0.0):
@@ -64,40 +215,435 @@ class Pointings:
         :type pos_angle: float, optional
         '''
 
-        pointing = {
+        self.table.append(ra, dec, time, depth, depth_unit, pos_angle)
+        metrics.count("pointings_added")
+
+    def make_pointing(self, ra, dec, time, depth,
+                      depth_unit, pos_angle=0.0):
+        '''
+        Make a pointing dict without storing it, for use with
+        `submit_stream` and `write_json`
+
+        Takes the same arguments as `add_pointing`.
+
+        :return: Pointing
+        :rtype: dict
+        '''
+
+        return {
             "status": self.status,
-            "position": "POINT({} {})".format(ra, dec),
+            "position": "POINT({} {})".format(float(ra), float(dec)),
             "instrumentid": self.instrumentid,
-            "pos_angle": pos_angle,
-            "time": time,
+            "pos_angle": None if pos_angle is None else float(pos_angle),
+            "time": _nullable_times(parse_times([time]))[0],
             "band": self.band,
-            "depth": depth,
+            "depth": None if depth is None else float(depth),
             "depth_unit": depth_unit
         }
 
-        self.pointings.append(pointing)
+    def add_pointings(self, ra, dec, time, depth,
+                      depth_unit, pos_angle=0.0, duration=None):
+        '''
+        Add many pointings at once
+
+        Coordinates are normalised to ICRS degrees in a single array
+        operation (RA wrapped to [0, 360), Dec checked to lie within
+        [-90, 90]), matching what a per-row `SkyCoord` would produce.
+
+        :param ra: Right Ascension of pointing centres in degrees
+        :type ra: array-like
+        :param dec: Declination of pointing centres in degrees
+        :type dec: array-like
+        :param time: Observation times, or start times with `duration`
+        :type time: array-like of str, formatted as 'YYYY-MM-DDTHH:MM:SS.FF'
+        :param depth: Pointing depths (5 sigma image RMS)
+        :type depth: array-like
+        :param depth_unit: Depth unit, either one for all pointings or
+            one per pointing
+        :type depth_unit: str or array-like
+        :param pos_angle: Pointing position angles, defaults to 0.0
+        :type pos_angle: float or array-like, optional
+        :param duration: Exposure durations as 'HH:MM:SS' or seconds; if
+            given, each pointing is timed at the middle of its exposure,
+            defaults to None
+        :type duration: array-like, optional
+        :return: Number of pointings added
+        :rtype: int
+        '''
+
+        ra, dec = normalise_coords(ra, dec)
+        if duration is not None:
+            time = midpoints(time, duration)
+        self.table.extend(ra, dec, time, depth, depth_unit, pos_angle)
+        metrics.count("pointings_added", len(ra))
+
+        return len(ra)
+
+    def add_pointings_from_frame(self, df):
+        '''
+        Add all pointings from a DataFrame
+
+        The frame needs `ra`, `dec`, `time`, `depth` and `depth_unit`
+        columns and may have a `pos_angle` column. If it has a `duration`
+        column, `time` holds start times and pointings are timed at the
+        middle of their exposures. If it has a `band` column only the
+        rows in this object's band are added.
+
+        :param df: Pointing table
+        :type df: pandas.DataFrame
+        :return: Number of pointings added
+        :rtype: int
+        '''
+
+        if 'band' in df.columns:
+            df = df[df['band'].values == self.band]
+
+        if 'pos_angle' in df.columns:
+            pos_angle = df['pos_angle'].values
+        else:
+            pos_angle = 0.0
+
+        if 'duration' in df.columns:
+            duration = df['duration'].values
+        else:
+            duration = None
+
+        return self.add_pointings(ra=df['ra'].values,
+                                  dec=df['dec'].values,
+                                  time=df['time'].values,
+                                  depth=df['depth'].values,
+                                  depth_unit=df['depth_unit'].values,
+                                  pos_angle=pos_angle,
+                                  duration=duration)
+
+    def drop_duplicates(self, index):
+        '''
+        Remove pointings that a `DedupIndex` says were already submitted
+
+        :param index: Index of submitted pointings
+        :type index: DedupIndex
+        :return: Number of pointings removed
+        :rtype: int
+        '''
+
+        seen = index.contains(index.pointing_keys(self))
+        if seen.any():
+            self.table = self.table.take(~seen)
+
+        return int(seen.sum())
+
+    def merge_nearby(self, radius, window=None):
+        '''
+        Collapse pointings within `radius` and `window` of each other
+        into one pointing with their combined depth
+
+        Meant for dithered exposures of one field, which would otherwise
+        be submitted as many nearly identical pointings. See
+        `treasuremap.merge.merge_table`, which needs SciPy.
+
+        :param radius: Largest separation in degrees
+        :type radius: float
+        :param window: Largest time difference in seconds, defaults to
+            None for no limit
+        :type window: float, optional
+        :return: Number of pointings removed
+        :rtype: int
+        '''
+
+        from .merge import merge_table
+
+        before = len(self.table)
+        self.table, _ = merge_table(self.table, radius, window)
+        self.logger.debug("Merged {} pointings into {}".format(
+            before, len(self.table)))
+
+        return before - len(self.table)
 
     def build_json(self):
         '''
         Build the json data
         '''
 
-        self.json_data = {
+        self.json_data = self.payload(self.pointings)
+
+    def payload(self, pointings):
+        '''
+        Wrap a list of pointings in a submission payload
+
+        :param pointings: Pointing dicts
+        :type pointings: list
+        :return: Payload for the `pointings` endpoint
+        :rtype: dict
+        '''
+
+        return {
             "graceid": self.graceid,
             "api_token": self.api_token,
-            "pointings": self.pointings
+            "pointings": pointings
         }
 
+    def chunks(self, chunk_size):
+        '''
+        Split the pointings into payloads of at most `chunk_size` pointings
+
+        :param chunk_size: Maximum number of pointings per payload
+        :type chunk_size: int
+        :return: Generator of (start, stop, payload), where start and stop
+            are row numbers in `self.table`
+        :rtype: generator
+        '''
+
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+
+        for start in range(0, len(self), chunk_size):
+            stop = min(start + chunk_size, len(self))
+            with metrics.span("build"):
+                pointings = list(self.records(slice(start, stop)))
+            yield start, stop, self.payload(pointings)
+
+    def prepare_chunks(self, chunk_size=500, processes=None,
+                       min_rows=MIN_ROWS):
+        '''
+        Encode the payloads of `chunks` in a process pool, for tables too
+        large to encode quickly in one process
+
+        The columns go to the workers through shared memory, see
+        `treasuremap.parallel.prepare_chunks`. Tables of fewer than
+        `min_rows` rows are encoded in this process.
+
+        :param chunk_size: Maximum number of pointings per payload,
+            defaults to 500
+        :type chunk_size: int, optional
+        :param processes: Number of worker processes, defaults to the
+            number of CPUs
+        :type processes: int, optional
+        :param min_rows: Fewest rows encoded in a pool, defaults to
+            `treasuremap.parallel.MIN_ROWS`
+        :type min_rows: int, optional
+        :return: (start, stop, body) per chunk, where body is the JSON
+            payload ready for `post_body`
+        :rtype: list of tuple
+        '''
+
+        p, resumed, chunks = prepare_chunks([self], chunk_size, processes,
+                                            min_rows=min_rows)[0]
+        return [(start, stop, body) for start, stop, body, keys in chunks]
+
+    def post_pointings(self, payload):
+        '''
+        Post one payload to the `pointings` endpoint
+
+        :param payload: Submission payload
+        :type payload: dict
+        :return: Decoded server response
+        :rtype: dict
+        '''
+
+        with metrics.span("encode"):
+            body = _encode(payload)
+        metrics.count("pointings_sent", len(payload["pointings"]))
+
+        return self.post_body(body)
+
+    def post_body(self, body):
+        '''
+        Post an already encoded payload to the `pointings` endpoint,
+        compressed if `compression` is set
+
+        :param body: JSON payload, e.g. joined from `iter_json`
+        :type body: bytes
+        :return: Decoded server response
+        :rtype: dict
+        '''
+
+        TARGET = 'pointings'
+        url = '{}/{}'.format(self.BASE, TARGET)
+
+        headers = {'Content-Type': 'application/json'}
+        encoding = self._encoding()
+        data = body
+        if encoding is not None:
+            with metrics.span("compress", encoding=encoding):
+                data = compress(body, encoding, self.compression_level)
+            headers['Content-Encoding'] = encoding
+
+        self._count_payload(len(body), len(data))
+        try:
+            return self._post(url, idempotent=False, data=data,
+                              headers=headers)
+        except TreasureMapError as e:
+            if not self._refused(e, encoding):
+                raise
+            return self.post_body(body)
+
+    def _encoding(self):
+        '''
+        Compression to use, None once the server refused it
+        '''
+
+        if (self.compression is None or
+                (self.BASE, self.compression) in _REFUSED):
+            return None
+        return self.compression
+
+    def _refused(self, error, encoding):
+        '''
+        Whether `error` is the server refusing `encoding`, which is then
+        not used for it again
+        '''
+
+        if (encoding is None or error.response is None or
+                error.response.status_code != 415):
+            return False
+
+        if (self.BASE, encoding) not in _REFUSED:
+            self.logger.warning("{} does not accept {} request bodies, "
+                                "sending them uncompressed".format(
+                                    self.BASE, encoding))
+            _REFUSED.add((self.BASE, encoding))
+        return True
+
+    def _count_payload(self, raw, sent):
+        metrics.count("bytes_raw", raw)
+        metrics.count("bytes_sent", sent)
+        with self._bytes_lock:
+            self.bytes_raw += raw
+            self.bytes_sent += sent
+
+    def _count_pieces(self, pieces, which):
+        '''
+        Pass encoded pieces through, adding their size to the `raw` or
+        `sent` byte counts
+        '''
+
+        for piece in pieces:
+            metrics.count("bytes_" + which, len(piece))
+            with self._bytes_lock:
+                if which == 'raw':
+                    self.bytes_raw += len(piece)
+                else:
+                    self.bytes_sent += len(piece)
+            yield piece
+
     def submit(self):
         '''
         Submit pointings to treasuremap
         '''
+
+        return self.post_pointings(self.json_data)
+
+    def iter_json(self, pointings=None):
+        '''
+        Encode the submission payload piece by piece
+
+        :param pointings: Pointing dicts to encode instead of
+            `self.pointings`, defaults to None
+        :type pointings: iterable, optional
+        :return: Generator of UTF-8 encoded pieces of the JSON payload
+        :rtype: generator
+        '''
+
+        if pointings is None:
+            pointings = self.records()
+
+        return iter_payload(self.graceid, self.api_token, pointings)
+
+    def write_json(self, f, pointings=None):
+        '''
+        Write the submission payload to a file, encoding one pointing at
+        a time
+
+        :param f: Binary file object or path
+        :type f: file or str
+        :param pointings: Pointing dicts to write instead of
+            `self.pointings`, defaults to None
+        :type pointings: iterable, optional
+        :return: Number of bytes written
+        :rtype: int
+        '''
+
+        if pointings is None:
+            pointings = self.records()
+
+        if isinstance(f, (str, os.PathLike)):
+            with open(f, 'wb') as fobj:
+                return write_payload(fobj, self.graceid, self.api_token,
+                                     pointings)
+
+        return write_payload(f, self.graceid, self.api_token, pointings)
+
+    def submit_stream(self, pointings=None):
+        '''
+        Submit pointings with the payload encoded while it is sent, using
+        chunked transfer encoding
+
+        Peak memory does not depend on the number of pointings, which
+        are encoded straight from `self.table` or from `pointings` if it
+        is a generator. A generator can only be sent once,
+        so failed requests are not retried in that case.
+
+        :param pointings: Pointing dicts to submit instead of
+            `self.pointings`, e.g. from `make_pointing`, defaults to None
+        :type pointings: iterable, optional
+        :return: Decoded server response
+        :rtype: dict
+        '''
+
         TARGET = 'pointings'
         url = '{}/{}'.format(self.BASE, TARGET)
-        r = requests.post(url=url, json=self.json_data)
-        self.logger.info(r.text)
 
-        return json.loads(r.text)
+        retry = None
+        resendable = pointings is None or iter(pointings) is not pointings
+        if not resendable:
+            retry = RetryPolicy(retries=0)
+
+        headers = {'Content-Type': 'application/json'}
+        encoding = self._encoding()
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+
+        def send():
+            pieces = self._count_pieces(self.iter_json(pointings), 'raw')
+            if encoding is not None:
+                pieces = iter_compressed(pieces, encoding,
+                                         self.compression_level)
+            return self.session.post(url=url,
+                                     data=self._count_pieces(pieces, 'sent'),
+                                     headers=headers, timeout=self.timeout)
+
+        try:
+            return self._send(send, retry, idempotent=False)
+        except TreasureMapError as e:
+            if not (self._refused(e, encoding) and resendable):
+                raise
+            return self.submit_stream(pointings)
+
+    def submit_chunked(self, chunk_size=500, max_workers=4, journal=None,
+                       processes=None):
+        '''
+        Submit pointings in chunks, posting up to `max_workers` chunks
+        at once
+
+        :param chunk_size: Maximum number of pointings per request,
+            defaults to 500
+        :type chunk_size: int, optional
+        :param max_workers: Maximum number of requests in flight,
+            defaults to 4
+        :type max_workers: int, optional
+        :param journal: Journal of acknowledged pointings to resume from
+            and record to, defaults to None
+        :type journal: SubmissionJournal, optional
+        :param processes: Encode the chunks in this many processes first,
+            see `prepare_chunks`, defaults to None to encode each chunk
+            as it is posted
+        :type processes: int, optional
+        :return: Merged response, see `submit_many`
+        :rtype: dict
+        '''
+
+        return submit_many([self], chunk_size, max_workers, journal,
+                           processes)[0]
 
     def cancel(self, ids):
         '''
@@ -105,12 +651,14 @@ class Pointings:
 
         :param ids: list of treasuremap pointing IDs
         :type ids: list
+        :return: Decoded server response
+        :rtype: dict
         '''
 
         TARGET = "updated_pointings"
 
         if self.status != "planned":
-            logger.critical("Can only cancel planned pointings")
+            self.logger.critical("Can only cancel planned pointings")
             return
 
         params = {
@@ -122,28 +670,266 @@ class Pointings:
         url = "{}/{}?{}".format(self.BASE, TARGET,
                                 urllib.parse.urlencode(params))
 
-        r = requests.post(url=url)
-        self.logger.info(r.text)
+        return self._post(url)
 
     def cancel_all(self):
         '''
         Cancel all pointings for an event
+
+        :return: Decoded server response
+        :rtype: dict
         '''
 
         TARGET = "cancel_all"
 
         if self.status != "planned":
-            logger.critical("Can only cancel planned pointings")
+            self.logger.critical("Can only cancel planned pointings")
             return
 
         params = {
             "api_token": self.api_token,
             "graceid": self.graceid,
-            "status": self.instrumentid
+            "instrumentid": self.instrumentid
         }
 
         url = "{}/{}?{}".format(self.BASE, TARGET,
                                 urllib.parse.urlencode(params))
 
-        r = requests.post(url=url)
-        self.logger.info(r.text)
+        return self._post(url)
+
+
+# (base URL, encoding) pairs a server refused with HTTP 415
+_REFUSED = set()
+
+
+def normalise_coords(ra, dec):
+    '''
+    Normalise arrays of ICRS coordinates in degrees
+
+    :param ra: Right Ascension in degrees
+    :type ra: array-like
+    :param dec: Declination in degrees
+    :type dec: array-like
+    :return: RA wrapped to [0, 360) and Dec as float arrays
+    :rtype: tuple of numpy.ndarray
+    '''
+
+    with metrics.span("normalise"):
+        ra, dec = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(ra, dtype=float)),
+            np.atleast_1d(np.asarray(dec, dtype=float)))
+
+        if np.any(np.abs(dec) > 90.0):
+            raise ValueError("Declinations must be within -90 and 90 degrees")
+
+        return np.mod(ra, 360.0), dec
+
+
+def pointings_from_frame(df, status, graceid, instrumentid, api_token=None,
+                         **kwargs):
+    '''
+    Build one `Pointings` per band from a DataFrame
+
+    :param df: Pointing table with `ra`, `dec`, `time`, `band`, `depth`
+        and `depth_unit` columns
+    :type df: pandas.DataFrame
+    :param status: Observing status, either `planned` or `completed`
+    :type status: str
+    :param graceid: Event ID in GraceDB
+    :type graceid: str
+    :param instrumentid: Instrument ID
+    :type instrumentid: int
+    :param api_token: Treasuremap API token, defaults to None
+    :type api_token: str
+    :param kwargs: Other `Pointings` arguments, such as `base_url`
+    :return: Pointings keyed by band
+    :rtype: dict
+    '''
+
+    pointings = {}
+    for band, group in df.groupby('band', sort=False):
+        pointings[band] = Pointings(status=status,
+                                    graceid=graceid,
+                                    instrumentid=instrumentid,
+                                    band=band,
+                                    api_token=api_token,
+                                    **kwargs)
+        pointings[band].add_pointings_from_frame(group)
+
+    return pointings
+
+
+def submit_many(pointings, chunk_size=500, max_workers=4, journal=None,
+                processes=None):
+    '''
+    Submit several `Pointings` in chunks through one bounded thread pool
+
+    Chunks from all of the `Pointings` are sent concurrently. A chunk
+    that raises or gets a response without `pointing_ids` is reported in
+    `failed` and does not stop the other chunks.
+
+    With a `journal`, pointings it already holds are not sent again and
+    their recorded IDs come first in `pointing_ids`; the pointings the
+    server accepted in each chunk are added to it as soon as its
+    response arrives.
+
+    With `processes`, all payloads are encoded up front in a process
+    pool reading the tables from shared memory, which pays off for
+    hundreds of thousands of pointings; see `parallel.prepare_chunks`.
+
+    :param pointings: Pointings to submit
+    :type pointings: list of Pointings
+    :param chunk_size: Maximum number of pointings per request,
+        defaults to 500
+    :type chunk_size: int, optional
+    :param max_workers: Maximum number of requests in flight,
+        defaults to 4
+    :type max_workers: int, optional
+    :param journal: Journal of acknowledged pointings, defaults to None
+    :type journal: SubmissionJournal, optional
+    :param processes: Number of processes encoding the payloads,
+        defaults to None to encode them in the posting threads
+    :type processes: int, optional
+    :return: One merged response per `Pointings`, with `pointing_ids`,
+        `ERRORS` and `WARNINGS` concatenated in input order, `failed`
+        listing the `chunk`, `start`, `stop`, `error` and `count` of
+        pointings sent in each failed chunk, which is less than `stop` -
+        `start` when the journal skipped some in between, and whether it
+        is `uncertain`, i.e. may have been stored
+        by the server and must not simply be sent again, and `resumed`
+        giving the number of pointings skipped because the journal
+        already held them
+    :rtype: list of dict
+    '''
+
+    pending = _pending(pointings, chunk_size, journal, processes)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = [
+            [(start, stop, executor.submit(_post_chunk, p, payload, keys,
+                                           journal, stop - start))
+             for start, stop, payload, keys in chunks]
+            for p, resumed, chunks in pending
+        ]
+
+    return _results(pending, [[(start, stop, _outcome(future))
+                               for start, stop, future in chunk_futures]
+                              for chunk_futures in futures], journal)
+
+
+def _pending(pointings, chunk_size, journal, processes):
+    '''
+    (pointings, resumed keys, chunks) per `Pointings`, where each chunk
+    is (start, stop, payload, keys), as posted by `submit_many`
+    '''
+
+    if processes is not None:
+        with metrics.span("prepare", processes=processes):
+            return prepare_chunks(pointings, chunk_size, processes, journal)
+    if journal is None:
+        return [(p, [], [(start, stop, payload, None) for start, stop,
+                         payload in p.chunks(chunk_size)])
+                for p in pointings]
+    return [_pending_chunks(p, chunk_size, journal) for p in pointings]
+
+
+def _results(pending, outcomes, journal):
+    '''
+    Merged response per `Pointings` from the (start, stop, response)
+    outcomes of its chunks, with the IDs of resumed pointings first
+    '''
+
+    results = []
+    for (p, resumed, chunks), chunk_outcomes in zip(pending, outcomes):
+        result = merge_chunks(p, chunk_outcomes)
+        for failure in result["failed"]:
+            keys = chunks[failure["chunk"]][3]
+            if keys is not None:
+                failure["count"] = len(keys)
+        result["resumed"] = len(resumed)
+        if resumed:
+            result["pointing_ids"] = (journal.pointing_ids(resumed) +
+                                      result["pointing_ids"])
+        results.append(result)
+
+    return results
+
+
+def _pending_chunks(p, chunk_size, journal):
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    keys = [journal.key(p.graceid, pointing) for pointing in p.records()]
+    resumed, indexes = _split(p, keys, journal, chunk_size)
+    payloads = [p.payload(list(p.records(index))) for index in indexes]
+
+    return p, resumed, _chunks(indexes, payloads, keys)
+
+
+def _encode(payload):
+    return json.dumps(payload, allow_nan=False,
+                      separators=(',', ':')).encode()
+
+
+def _post_chunk(p, payload, keys, journal, count):
+    if isinstance(payload, bytes):
+        # Encoded by prepare_chunks
+        if keys is not None:
+            count = len(keys)
+        metrics.count("pointings_sent", count)
+        response = p.post_body(payload)
+    else:
+        response = p.post_pointings(payload)
+    if journal is not None and "pointing_ids" in response:
+        journal.record(p.graceid, keys, response)
+    return response
+
+
+def _outcome(future):
+    error = future.exception()
+    if error is not None:
+        return error
+    return future.result()
+
+
+def merge_chunks(pointings, outcomes):
+    '''
+    Merge the responses to the chunks of one `Pointings`
+
+    :param pointings: Pointings the chunks were taken from
+    :type pointings: Pointings
+    :param outcomes: (start, stop, response) per chunk in input order,
+        where response is the decoded response or the exception raised
+    :type outcomes: list of tuple
+    :return: Merged response, see `submit_many`
+    :rtype: dict
+    '''
+
+    result = {"pointing_ids": [], "ERRORS": [], "WARNINGS": [], "failed": []}
+
+    for chunk, (start, stop, response) in enumerate(outcomes):
+        try:
+            if isinstance(response, BaseException):
+                raise response
+            ids = response["pointing_ids"]
+        except Exception as e:
+            uncertain = getattr(e, 'uncertain', False)
+            pointings.logger.error(
+                "Chunk {} (pointings {}-{}) failed: {!r}".format(
+                    chunk, start, stop, e))
+            if uncertain:
+                pointings.logger.warning(
+                    "Chunk {} (pointings {}-{}) may have been stored all "
+                    "the same; check the server before sending it "
+                    "again".format(chunk, start, stop))
+            result["failed"].append({"chunk": chunk, "start": start,
+                                     "stop": stop, "count": stop - start,
+                                     "error": repr(e),
+                                     "uncertain": uncertain})
+            continue
+
+        result["pointing_ids"].extend(ids)
+        result["ERRORS"].extend(response.get("ERRORS", []))
+        result["WARNINGS"].extend(response.get("WARNINGS", []))
+
+    return result
@@ -0,0 +1,402 @@
+import datetime
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import decam, metrics
+from .journal import SubmissionJournal
+from .sources import DECamSource, FileSource
+from .table import PointingTable
+from .treasuremap import Pointings, submit_many
+
+
+class DirectoryPoll:
+    '''
+    New and changed pointing files in a directory
+
+    A file is read once its size and modification time have stayed the
+    same for `settle` seconds, and again whenever they change, e.g. when
+    rows are appended. A changed file is read whole; it is up to the
+    `Watcher` to leave out the rows it has already seen.
+
+    :param directory: Directory to watch
+    :type directory: str
+    :param pattern: Glob pattern of the files to read, defaults to '*.csv'
+    :type pattern: str, optional
+    :param format: File format, see `loaders.read_pointings`, defaults
+        to guessing from each file name
+    :type format: str, optional
+    :param settle: Seconds a file must be left untouched before it is
+        read, defaults to 1.0
+    :type settle: float, optional
+    '''
+
+    def __init__(self, directory, pattern='*.csv', format=None, settle=1.0):
+        '''Constructor method
+        '''
+
+        self.logger = logging.getLogger('treasuremap.DirectoryPoll')
+        self.directory = directory
+        self.pattern = pattern
+        self.format = format
+        self.settle = settle
+        self._seen = {}
+
+    def poll(self):
+        '''
+        Read the files that are new or changed since the last poll
+
+        :return: Pointing tables
+        :rtype: list of pandas.DataFrame
+        '''
+
+        frames = []
+        now = time.time()
+        for path in sorted(glob.glob(os.path.join(self.directory,
+                                                  self.pattern))):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime < self.settle:
+                # May still be being written
+                continue
+
+            signature = (stat.st_size, stat.st_mtime)
+            if self._seen.get(path) == signature:
+                continue
+            self._seen[path] = signature
+
+            self.logger.info("Reading {}".format(path))
+            frames.extend(FileSource(path, self.format).batches())
+
+        return frames
+
+
+class DECamPoll:
+    '''
+    DECam pointings with exposures newer than the last poll, see
+    `sources.DECamSource`
+
+    :param propid: Proposal ID
+    :type propid: str
+    :param start: YYYYMMDD lower bound (exclusive) of the nights
+    :type start: str
+    :param since: Only read groups with exposures newer than this
+        exposure ID, defaults to None for all of them on the first poll
+    :type since: int, optional
+    :param batch_size: Rows per batch, defaults to 10000
+    :type batch_size: int, optional
+    :param connect: Function returning a new database connection,
+        defaults to `decam.connect`
+    :type connect: callable, optional
+    '''
+
+    def __init__(self, propid, start, since=None, batch_size=10000,
+                 connect=None):
+        '''Constructor method
+        '''
+
+        self.propid = propid
+        self.start = start
+        self.since = since
+        self.batch_size = batch_size
+        self.connect = connect
+        self.instrumentid = decam.INSTRUMENT_ID
+
+    def poll(self):
+        '''
+        Read the groups with new exposures
+
+        :return: Pointing tables
+        :rtype: list of pandas.DataFrame
+        '''
+
+        # Nights up to tomorrow's, whatever the time zone
+        end = (datetime.datetime.now(datetime.timezone.utc).date() +
+               datetime.timedelta(days=2)).strftime('%Y%m%d')
+        source = DECamSource(self.propid, self.start, end, self.since,
+                             self.batch_size, self.connect)
+        frames = list(source)
+
+        if source.watermark['expnum'] is not None:
+            self.since = source.watermark['expnum']
+        return frames
+
+
+class Watcher:
+    '''
+    Submit pointings as they appear, in micro-batches
+
+    A poll thread calls `poller.poll()` every `interval` seconds and
+    queues the tables it returns. The submitting thread gathers them and
+    submits once `max_size` pointings are waiting or the oldest has
+    waited `max_delay` seconds, through one `Pointings` per band kept
+    for the life of the watcher. Pointings are keyed as in the journal:
+    those the journal holds, that this watcher already had acknowledged
+    or that appear twice in a micro-batch, e.g. from a file read again,
+    are dropped before submission. Those in failed chunks are queued
+    again for the next micro-batch, unless the chunk may have been
+    stored all the same; those are logged for replay by hand instead.
+
+    Besides the submission metrics, it sets the gauges `queue_depth`
+    (pointings waiting to be submitted) and records `latency` spans
+    from each pointing's observation time to its acknowledgement.
+
+    :param poller: Object whose `poll()` returns new pointing tables,
+        e.g. `DirectoryPoll` or `DECamPoll`
+    :type poller: object
+    :param graceid: Event ID in GraceDB
+    :type graceid: str
+    :param instrumentid: Instrument ID, defaults to the poller's
+    :type instrumentid: int, optional
+    :param api_token: Treasuremap API token, defaults to None
+    :type api_token: str, optional
+    :param status: Observing status, defaults to 'completed'
+    :type status: str, optional
+    :param interval: Seconds between polls, defaults to 10.0
+    :type interval: float, optional
+    :param max_size: Pointings that trigger a submission, defaults to 500
+    :type max_size: int, optional
+    :param max_delay: Longest a pointing waits for others to join its
+        micro-batch, in seconds, defaults to 5.0
+    :type max_delay: float, optional
+    :param journal: Journal of acknowledged pointings, defaults to None
+    :type journal: SubmissionJournal, optional
+    :param chunk_size: Maximum number of pointings per request,
+        defaults to 500
+    :type chunk_size: int, optional
+    :param max_workers: Maximum number of requests in flight,
+        defaults to 4
+    :type max_workers: int, optional
+    :param kwargs: Other `Pointings` arguments, such as `base_url`
+    '''
+
+    def __init__(self, poller, graceid, instrumentid=None, api_token=None,
+                 status='completed', interval=10.0, max_size=500,
+                 max_delay=5.0, journal=None, chunk_size=500, max_workers=4,
+                 **kwargs):
+        '''Constructor method
+        '''
+
+        if instrumentid is None:
+            instrumentid = getattr(poller, 'instrumentid', None)
+        if instrumentid is None:
+            raise ValueError("instrumentid is needed for a poller without "
+                             "one")
+
+        self.logger = logging.getLogger('treasuremap.Watcher')
+        self.poller = poller
+        self.graceid = graceid
+        self.instrumentid = instrumentid
+        self.api_token = api_token
+        self.status = status
+        self.interval = interval
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.journal = journal
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.kwargs = kwargs
+
+        self.stopping = threading.Event()
+        self.totals = {"polls": 0, "pointings": 0, "skipped": 0,
+                       "submitted": 0, "accepted": 0, "failed": 0,
+                       "uncertain": 0}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._pointings = {}
+        # Keys of the pointings acknowledged or possibly stored
+        self._sent = set()
+
+    def stop(self):
+        '''
+        Make `run` submit what is waiting and return
+        '''
+
+        self.stopping.set()
+
+    def run(self):
+        '''
+        Poll and submit until `stop` is called
+
+        :return: Totals of `polls`, `pointings` read, pointings `skipped`
+            as already submitted, pointings `submitted`, `accepted`, in
+            `failed` chunks (which were queued again) and in `uncertain`
+            chunks (which were logged)
+        :rtype: dict
+        '''
+
+        poller = threading.Thread(target=self._poll_loop,
+                                  name='treasuremap-watch', daemon=True)
+        poller.start()
+
+        buffer = []
+        buffered = 0
+        oldest = None
+        try:
+            while True:
+                if oldest is None:
+                    timeout = self.interval
+                else:
+                    timeout = max(0.0, oldest + self.max_delay -
+                                  time.monotonic())
+                if self.stopping.is_set():
+                    timeout = min(timeout, 0.1)
+
+                try:
+                    arrived, frame = self._queue.get(timeout=timeout)
+                    buffer.append(frame)
+                    buffered += len(frame)
+                    oldest = arrived if oldest is None else min(oldest,
+                                                                arrived)
+                except queue.Empty:
+                    pass
+
+                # Everything polled before `stop` is still submitted
+                stopping = not poller.is_alive() and self._queue.empty()
+                due = oldest is not None and (
+                    buffered >= self.max_size or stopping or
+                    time.monotonic() - oldest >= self.max_delay)
+                if due:
+                    retry = self.submit(pd.concat(buffer, ignore_index=True))
+                    buffer, buffered, oldest = [], 0, None
+                    if len(retry) and not stopping:
+                        self._put(retry)
+                if stopping:
+                    break
+        finally:
+            self.stopping.set()
+            poller.join()
+
+        return dict(self.totals)
+
+    def _poll_loop(self):
+        while not self.stopping.is_set():
+            try:
+                with metrics.span("poll"):
+                    frames = self.poller.poll()
+            except Exception:
+                self.logger.exception("Polling failed, trying again in "
+                                      "{} s".format(self.interval))
+                frames = []
+
+            self.totals["polls"] += 1
+            for frame in frames:
+                if len(frame):
+                    self.totals["pointings"] += len(frame)
+                    self._put(frame)
+
+            self.stopping.wait(self.interval)
+
+    def _put(self, frame):
+        with self._lock:
+            self._depth += len(frame)
+            metrics.gauge("queue_depth", self._depth)
+        self._queue.put((time.monotonic(), frame))
+
+    def _band(self, band):
+        '''
+        The `Pointings` kept for a band
+        '''
+
+        if band not in self._pointings:
+            self._pointings[band] = Pointings(
+                self.status, self.graceid, self.instrumentid, band,
+                api_token=self.api_token, **self.kwargs)
+        return self._pointings[band]
+
+    def submit(self, df):
+        '''
+        Submit one micro-batch
+
+        :param df: Pointing table
+        :type df: pandas.DataFrame
+        :return: Rows of `df` in chunks that failed and can be sent again
+        :rtype: pandas.DataFrame
+        '''
+
+        groups = []
+        batch = set()
+        for band, group in df.groupby('band', sort=False):
+            p = self._band(band)
+            p.table = PointingTable()
+            p.add_pointings_from_frame(group)
+
+            keys = [SubmissionJournal.key(self.graceid, pointing)
+                    for pointing in p.records()]
+            fresh = np.zeros(len(keys), dtype=bool)
+            for i, key in enumerate(keys):
+                fresh[i] = not (key in batch or key in self._sent or
+                                (self.journal is not None and
+                                 key in self.journal))
+                batch.add(key)
+
+            self.totals["skipped"] += int((~fresh).sum())
+            metrics.count("pointings_skipped", int((~fresh).sum()))
+            p.table = p.table.take(fresh)
+            group = group[fresh]
+            keys = [key for key, f in zip(keys, fresh) if f]
+            if len(p):
+                groups.append((p, group, keys))
+
+        failed = []
+        if groups:
+            with metrics.span("micro_batch"):
+                results = submit_many([p for p, group, keys in groups],
+                                      self.chunk_size, self.max_workers,
+                                      self.journal)
+            acknowledged = time.time()
+
+            for (p, group, keys), result in zip(groups, results):
+                ok = np.ones(len(p), dtype=bool)
+                retry = np.zeros(len(p), dtype=bool)
+                for chunk in result["failed"]:
+                    ok[chunk["start"]:chunk["stop"]] = False
+                    if not chunk["uncertain"]:
+                        retry[chunk["start"]:chunk["stop"]] = True
+                        continue
+                    self.totals["uncertain"] += chunk["count"]
+                    self.logger.warning(
+                        "Not sending again {} {} band pointings that may "
+                        "have been stored; check the server and replay by "
+                        "hand those missing: {}".format(
+                            chunk["count"], p.band,
+                            json.dumps(list(p.records(
+                                slice(chunk["start"], chunk["stop"]))))))
+                self._sent.update(key for key, r in zip(keys, retry)
+                                  if not r)
+
+                observed = p.table.time[ok].astype(np.int64) / 1000.0
+                for latency in (acknowledged - observed).tolist():
+                    metrics.observe("latency", latency)
+
+                self.totals["submitted"] += len(p)
+                self.totals["accepted"] += len(result["pointing_ids"])
+                self.totals["failed"] += int(retry.sum())
+                failed.append(group[retry])
+
+        with self._lock:
+            self._depth -= len(df)
+            metrics.gauge("queue_depth", self._depth)
+
+        registry = metrics.registry()
+        if registry is not None:
+            registry.flush()
+
+        self.logger.info("Micro-batch of {} pointings: {} submitted, {} "
+                         "failed, {} waiting".format(
+                             len(df), sum(len(p) for p, g, k in groups),
+                             sum(len(f) for f in failed), self._depth))
+
+        if failed:
+            return pd.concat(failed, ignore_index=True)
+        return df.iloc[:0]
@@ -0,0 +1,134 @@
+# A daemon submitting pointings to Treasure Map as they are observed,
+# by tailing a directory of pointing files or polling the DECam database
+# Authors: R. Morgan and M. Gill
+
+## USAGE:
+# Directory: python watch_tm.py --graceid S190814bv --instrumentid 38 --watch-dir incoming/ --pattern '*.csv'
+# Database:  python watch_tm.py --graceid S190814bv --propid 2019B-0372 --start 20190813
+# Stop with Ctrl-C or SIGTERM; what is waiting is submitted before it exits
+
+import datetime
+import getpass
+import glob
+import logging
+from optparse import OptionParser
+import os
+import signal
+import sys
+
+# Get username of user
+USERNAME = getpass.getuser()
+
+# Handle command line arguments
+parser = OptionParser(__doc__)
+parser.add_option('--graceid', default=None, help="Name of the GraceDB event")
+parser.add_option('--watch-dir', default=None, help="Directory of incoming pointing files to tail")
+parser.add_option('--pattern', default='*.csv', help="Glob pattern of the files to read in --watch-dir")
+parser.add_option('--format', default=None, help="Format of the files: csv, parquet, arrow or fits (default: from each file name)")
+parser.add_option('--instrumentid', type='int', default=None, help="Instrument ID of the pointings in --watch-dir")
+parser.add_option('--propid', default=None, help="PROPID of the DECam exposures to poll the database for, instead of --watch-dir")
+parser.add_option('--start', default=None, help="YYYYMMDD lower bound of the nights with --propid")
+parser.add_option('--status', default='completed', help="Observing status of the pointings: completed or planned")
+parser.add_option('--interval', type='float', default=10.0, help="Seconds between polls (default 10)")
+parser.add_option('--max-size', type='int', default=500, help="Submit once this many pointings are waiting (default 500)")
+parser.add_option('--max-delay', type='float', default=5.0, help="Submit once the oldest pointing has waited this many seconds (default 5)")
+parser.add_option('--chunk-size', type='int', default=500, help="Maximum number of pointings per request")
+parser.add_option('--workers', type='int', default=4, help="Maximum number of requests in flight")
+parser.add_option('--journal', default=None, help="Journal of acknowledged pointings, which are never sent again (default logs/<graceid>.journal)")
+parser.add_option('--api-token', default=None, help="Treasure Map API token (default: $TREASUREMAP_API or api_tokens/<user>/)")
+parser.add_option('--url', default=None, help="Treasure Map API base URL, e.g. of a test server")
+parser.add_option('--metrics', default=None, help="JSON-lines file to write timing spans, latencies and counters to")
+parser.add_option('--prometheus', default=None, help="Prometheus textfile (.prom) rewritten after each submission, with latency and queue depth")
+options, args = parser.parse_args(sys.argv[1:])
+
+if not options.graceid:
+    print("Use '--graceid' to specify the GraceDB event")
+    sys.exit(1)
+if bool(options.watch_dir) == bool(options.propid):
+    print("Use either '--watch-dir' or '--propid' to specify where pointings come from")
+    sys.exit(1)
+if options.watch_dir and options.instrumentid is None:
+    print("Use '--instrumentid' with '--watch-dir'")
+    sys.exit(1)
+if options.propid and not options.start:
+    print("Use '--start' with '--propid' (fmt YYYYMMDD)")
+    sys.exit(1)
+
+# Set up logging
+log_dir = "logs/watch_{}".format(datetime.datetime.now().strftime("%y-%m-%d_%H-%M-%S"))
+os.makedirs(log_dir, exist_ok=True)
+logging.basicConfig(filename=os.path.join(log_dir, "watch.log"),
+                    filemode="a+",
+                    format="|%(levelname)s\t| %(asctime)s -- %(name)s -- %(message)s",
+                    datefmt="20%y-%m-%d %I:%M:%S %p",
+                    level=logging.DEBUG)
+logging.info("[" + USERNAME + "] " + "watch_tm.py started")
+logging.debug("[" + USERNAME + "] " + "program command: " + ' '.join(sys.argv))
+
+# Imported only now, so '--help' and missing arguments return straight away
+from treasuremap import metrics, SubmissionJournal
+from treasuremap.watch import DECamPoll, DirectoryPoll, Watcher
+
+# API token - Get your own by making a TreasureMap account
+api_token = options.api_token or os.getenv('TREASUREMAP_API')
+if api_token is None:
+    tokens = glob.glob('api_tokens/{}/*.api_token'.format(USERNAME)) + glob.glob('api_tokens/mssgill/*.api_token')
+    if not tokens:
+        print("No API token: use '--api-token', set TREASUREMAP_API or add one under api_tokens/")
+        logging.critical("[" + USERNAME + "] " + "Program needs a valid API_token and will terminate")
+        sys.exit(1)
+    api_token = os.path.basename(tokens[0]).split('.')[0]
+
+# Latency and queue depth are always collected, and written out when asked to
+sinks = []
+if options.metrics:
+    sinks.append(metrics.JSONLinesSink(options.metrics))
+if options.prometheus:
+    sinks.append(metrics.PrometheusSink(options.prometheus))
+metrics.enable(sinks)
+
+if options.journal is None:
+    options.journal = "logs/{}.journal".format(options.graceid)
+journal = SubmissionJournal(options.journal)
+logging.info("[" + USERNAME + "] " + "Journal {} holds {} acknowledged pointings".format(options.journal, len(journal)))
+
+if options.watch_dir:
+    poller = DirectoryPoll(options.watch_dir, options.pattern, options.format)
+    logging.info("[" + USERNAME + "] " + "Watching {} for {}".format(options.watch_dir, options.pattern))
+else:
+    poller = DECamPoll(options.propid, options.start)
+    logging.info("[" + USERNAME + "] " + "Polling the DECam database for {} from {}".format(options.propid, options.start))
+
+watcher = Watcher(poller, options.graceid,
+                  instrumentid=options.instrumentid,
+                  api_token=api_token,
+                  status=options.status,
+                  interval=options.interval,
+                  max_size=options.max_size,
+                  max_delay=options.max_delay,
+                  journal=journal,
+                  chunk_size=options.chunk_size,
+                  max_workers=options.workers,
+                  base_url=options.url)
+
+# Finish the current micro-batch and exit on Ctrl-C or SIGTERM
+for signum in (signal.SIGINT, signal.SIGTERM):
+    signal.signal(signum, lambda signum, frame: watcher.stop())
+
+print("Watching for pointings of {}, stop with Ctrl-C".format(options.graceid))
+totals = watcher.run()
+
+snapshot = metrics.registry().flush()
+for timing in snapshot["timings"]:
+    if timing["name"] == "latency" and timing["count"]:
+        logging.info("[" + USERNAME + "] " + "Latency from observation to acknowledgement: mean {:.1f} s, max {:.1f} s".format(
+            timing["total"] / timing["count"], timing["max"]))
+
+print("Read {} pointings in {} polls: {} accepted, {} already submitted, {} failed".format(
+    totals['pointings'], totals['polls'], totals['accepted'], totals['skipped'], totals['failed']))
+if totals['uncertain']:
+    print("{} pointings may have been stored although their requests failed; see the log to "
+          "replay those missing".format(totals['uncertain']))
+logging.info("[" + USERNAME + "] " + "Totals: {}".format(totals))
+logging.info("[" + USERNAME + "] " + "Program finished")
+logging.shutdown()